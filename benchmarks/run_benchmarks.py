@@ -0,0 +1,609 @@
+# --------------------------Trn.la Plugin For Nuke Studio--------------------------------
+# Benchmarks for the export pipeline outside of Nuke Studio. hiero and nuke are replaced by
+# the stubs in benchmarks/stubs and trn.la by the local stand-in server, so only the
+# plugin's own archive and upload code is measured.
+#
+#   python benchmarks/run_benchmarks.py --frames 100 --frame-size 8 --shots 4 --setup-shots 100 2500
+#
+# Results are saved to benchmarks/results/ and compared with the last run that used the
+# same parameters.
+#
+# (c) 2021 Tarantula
+# Author: Moses Molina
+# ---------------------------------------------------------------------------------------
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+sys.path.insert(0, os.path.join(BENCH_DIR, "stubs"))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+
+# changes bigger than this are reported as regressions
+REGRESSION_THRESHOLD = 0.10
+MB = 1048576.0
+
+
+def start_standin_process(args):
+    """Runs the stand-in in its own process, so its request handling doesn't hold the GIL of the
+    process the plugin runs in. Returns (process, api_root)."""
+    process = subprocess.Popen([sys.executable, os.path.join(BENCH_DIR, "trnla_standin.py"), "--port", "0",
+                                "--latency", str(args.latency), "--drop-rate", str(args.drop_rate),
+                                "--error-rate", str(args.error_rate)],
+                               stdout=subprocess.PIPE, universal_newlines=True)
+    line = process.stdout.readline()
+    if "TRNLA_API_ROOT=" not in line:
+        process.kill()
+        raise RuntimeError("the stand-in didn't start: " + line)
+    return process, line.strip().split("TRNLA_API_ROOT=", 1)[1]
+
+
+def make_frames(directory, shot_name, count, frame_size, compressibility, ext=".dpx"):
+    """Writes count frames of frame_size bytes. compressibility is the share of every frame that is
+    zeros, the rest is random and won't compress."""
+    os.makedirs(directory)
+    random_bytes = int(frame_size * (1.0 - compressibility))
+    for frame in range(count):
+        with open(os.path.join(directory, "%s.%04d%s" % (shot_name, 1001 + frame, ext)), "wb") as frame_file:
+            frame_file.write(os.urandom(random_bytes))
+            frame_file.write(b"\0" * (frame_size - random_bytes))
+    return directory
+
+
+def members_of(directory):
+    return [(os.path.join(directory, name), name) for name in sorted(os.listdir(directory))]
+
+
+def wait_for(app, done, timeout, stalls=None):
+    """Runs the Qt event loop until done() is true. Returns the seconds it took. stalls gets how long
+    every pass of the event loop took, the longest is how long the Nuke Studio UI would have frozen."""
+    from PySide2.QtCore import QEventLoop
+    start = time.time()
+    while not done():
+        if time.time() - start > timeout:
+            raise RuntimeError("timed out after %ds" % timeout)
+        loop_start = time.time()
+        app.processEvents(QEventLoop.AllEvents, 50)
+        if stalls is not None:
+            stalls.append(time.time() - loop_start)
+    return time.time() - start
+
+
+def bench_archive(args, shot_dir, scratch):
+    from trnla.TrnlaArchive import TrnlaArchiveStream, TrnlaCompressionPolicy, archive_workers, write_archive
+    members = members_of(shot_dir)
+    size = sum(os.path.getsize(path) for path, arcname in members)
+    results = {}
+    for label, workers in (("serial", 1), ("parallel", archive_workers(args.workers))):
+        policy = TrnlaCompressionPolicy(args.compression)
+        zip_path = os.path.join(scratch, "archive_%s.zip" % label)
+        start = time.time()
+        write_archive(zip_path, members, policy, workers)
+        elapsed = time.time() - start
+        results["archive_%s_mb_per_s" % label] = round(size / MB / elapsed, 2)
+        results["archive_ratio"] = round(policy.stats.ratio(), 3)
+        os.remove(zip_path)
+
+    stream = TrnlaArchiveStream(members, TrnlaCompressionPolicy(args.compression), archive_workers(args.workers))
+    start = time.time()
+    while stream.read(1024 * 1024):
+        pass
+    results["archive_stream_mb_per_s"] = round(size / MB / (time.time() - start), 2)
+    stream.close()
+    return results
+
+
+def standin_call(app, endpoint, fields, timeout):
+    """Calls one of the stand-in's test controls and returns its reply."""
+    from trnla.TrnlaNetwork import trnla_network
+    reply = trnla_network().post_form(endpoint, fields)
+    wait_for(app, reply.isFinished, timeout)
+    data = json.loads(reply.readAll().data().decode("utf8"))
+    reply.deleteLater()
+    return data
+
+
+def bench_upload(args, app, shot_dir, scratch):
+    from trnla.TrnlaArchive import TrnlaCompressionPolicy, write_archive
+    from trnla.TrnlaChunkedUpload import TrnlaChunkedUpload, TrnlaFileSource
+    from trnla.TrnlaNetwork import trnla_network
+    from trnla.TrnlaArchive import hash_file
+
+    zip_path = os.path.join(scratch, "upload.zip")
+    write_archive(zip_path, members_of(shot_dir), TrnlaCompressionPolicy("stored"))
+    size = os.path.getsize(zip_path)
+    results = {}
+
+    outcome = {}
+    source = TrnlaFileSource(zip_path)
+    upload = TrnlaChunkedUpload("bench", "1", "upload_bench", source, "upload.zip", args.chunk_size * 1024 * 1024)
+    upload.finished.connect(lambda upload_id: outcome.setdefault("done", upload_id))
+    upload.failed.connect(lambda reason: outcome.setdefault("error", reason))
+    upload.start()
+    elapsed = wait_for(app, lambda: outcome, args.timeout)
+    source.close()
+    if "error" in outcome:
+        raise RuntimeError("chunked upload failed: " + outcome["error"])
+    results["upload_chunked_mb_per_s"] = round(size / MB / elapsed, 2)
+
+    # connections that drop partway through a chunk: the upload has to go on from the offset
+    # upload/status acknowledges, not send the chunk again from its start
+    before = standin_call(app, "standin/stats", [], args.timeout)
+    standin_call(app, "standin/faults", [("drop_chunk_after", str(min(size, args.chunk_size * 1024 * 1024) // 3)),
+                                         ("chunk_drops", "3")], args.timeout)
+    outcome = {}
+    source = TrnlaFileSource(zip_path)
+    upload = TrnlaChunkedUpload("bench", "1", "resume_bench", source, "upload.zip", args.chunk_size * 1024 * 1024)
+    upload.finished.connect(lambda upload_id: outcome.setdefault("done", upload_id))
+    upload.failed.connect(lambda reason: outcome.setdefault("error", reason))
+    upload.start()
+    elapsed = wait_for(app, lambda: outcome, args.timeout)
+    source.close()
+    standin_call(app, "standin/faults", [("chunk_drops", "0")], args.timeout)
+    if "error" in outcome:
+        raise RuntimeError("resumed chunked upload failed: " + outcome["error"])
+    after = standin_call(app, "standin/stats", [], args.timeout)
+    drops = after["chunk_drops"] - before["chunk_drops"]
+    if not drops:
+        raise RuntimeError("the stand-in didn't drop any chunk of the resume upload")
+    if after["overlap_bytes"] != before["overlap_bytes"]:
+        raise RuntimeError("chunks were sent again from their start after a drop: %d bytes"
+                           % (after["overlap_bytes"] - before["overlap_bytes"]))
+    if after["uploads"][outcome["done"]]["sha256"] != hash_file(zip_path):
+        raise RuntimeError("the resumed upload doesn't match the archive")
+    results["upload_resume_chunk_drops"] = drops
+    results["upload_resume_mb_per_s"] = round(size / MB / elapsed, 2)
+
+    # one multipart request with the whole archive, like the store endpoint
+    from PySide2.QtCore import QFile, QIODevice
+    zip_file = QFile(zip_path)
+    zip_file.open(QIODevice.ReadOnly)
+    start = time.time()
+    reply = trnla_network().post_form("store", [("api_key", "bench"), ("project_id", "1"), ("shot_name", "upload_bench")],
+                                      [("shot_file", "upload.zip", zip_file)])
+    wait_for(app, reply.isFinished, args.timeout)
+    results["upload_multipart_mb_per_s"] = round(size / MB / (time.time() - start), 2)
+    zip_file.close()
+    reply.deleteLater()
+    os.remove(zip_path)
+    return results
+
+
+def shot_exporter(args, mode_dir, shot_name, properties, plate=None):
+    """An exporter of an already rendered shot. The frames are copied from plate when given, shots with
+    the same plate share every frame."""
+    from trnla.TrnlaTranscodeExporter import TrnlaTranscodeExporter, TrnlaTranscodePreset
+
+    frames_dir = os.path.join(mode_dir, shot_name, "frames")
+    if plate:
+        os.makedirs(frames_dir)
+        for frame, name in enumerate(sorted(os.listdir(plate))):
+            shutil.copyfile(os.path.join(plate, name),
+                            os.path.join(frames_dir, "%s.%04d.dpx" % (shot_name, 1001 + frame)))
+    else:
+        make_frames(frames_dir, shot_name, args.frames, args.frame_size, args.compressibility)
+    preview = os.path.join(mode_dir, shot_name, shot_name + ".mp4")
+    with open(preview, "wb") as preview_file:
+        preview_file.write(os.urandom(args.frame_size // 4))
+    preset_properties = {"trnla_upload": True, "trnla_api_key": "bench", "trnla_project_id": "1",
+                         "trnla_chunk_size": args.chunk_size, "trnla_archive_workers": args.workers,
+                         "trnla_archive_compression": args.compression, "file_type": "dpx"}
+    preset_properties.update(properties)
+    preset = TrnlaTranscodePreset("bench", preset_properties)
+    exporter = TrnlaTranscodeExporter({"preset": preset, "shotName": shot_name,
+                                       "exportPath": os.path.join(frames_dir, shot_name + ".####.dpx"),
+                                       "range": (1001, 1000 + args.frames)})
+    exporter.startTask()
+    exporter._progress = 1.0
+    return exporter, preview
+
+
+def bench_shared_frames(args, app, scratch):
+    """Shots that share every frame, where the shot that owns the frames is refused by the server. The
+    other shots have to upload the frames themselves instead of storing manifests of missing frames."""
+    from trnla.TrnlaUploadJournal import upload_journal, COMPLETED, FAILED
+
+    mode_dir = os.path.join(scratch, "shots_shared")
+    plate = make_frames(os.path.join(scratch, "shared_plate"), "plate", args.frames, args.frame_size,
+                        args.compressibility)
+    exporters = [shot_exporter(args, mode_dir, "sh%03d" % (shot * 10), {"trnla_dedup_frames": True}, plate)
+                 for shot in range(max(2, args.shots))]
+    owner, owner_preview = exporters[0]
+    before = standin_call(app, "standin/stats", [], args.timeout)
+    # refused once the other shots are waiting on its frames
+    standin_call(app, "standin/faults", [("failing_shots", json.dumps([owner.shotName()])),
+                                         ("failing_delay", "1")], args.timeout)
+    start = time.time()
+    try:
+        owner.upload_shot(owner_preview)
+        wait_for(app, lambda: owner.archive_span is not None, args.timeout)
+        for exporter, preview in exporters[1:]:
+            exporter.upload_shot(preview)
+        wait_for(app, lambda: all(exporter.uploaded for exporter, preview in exporters), args.timeout)
+    finally:
+        standin_call(app, "standin/faults", [], args.timeout)
+    elapsed = time.time() - start
+    after = standin_call(app, "standin/stats", [], args.timeout)
+    if upload_journal().entry(owner.journal_id)["state"] != FAILED:
+        raise RuntimeError("the stand-in didn't refuse " + owner.shotName())
+    for exporter, preview in exporters[1:]:
+        entry = upload_journal().entry(exporter.journal_id)
+        if entry["state"] != COMPLETED:
+            raise RuntimeError("shared frames: %s was not stored: %s" % (exporter.shotName(), entry.get("error")))
+    if after["broken_manifests"] != before["broken_manifests"]:
+        raise RuntimeError("shared frames: a manifest referenced frames that were never uploaded")
+    if not any(exporter.frame_upload is not None for exporter, preview in exporters[1:]):
+        raise RuntimeError("shared frames: no shot took over the frames of " + owner.shotName())
+    for exporter, preview in exporters:
+        exporter.finishTask()
+    shutil.rmtree(mode_dir)
+    shutil.rmtree(plate)
+    return {"shot_shared_owner_failed_seconds": round(elapsed, 3)}
+
+
+def bench_lost_replies(args, app, scratch):
+    """Shots registered and stored while the connection drops after the server has handled the request.
+    The retries must not create any shot twice."""
+    from trnla.TrnlaShotRegistry import TrnlaShotRegistration
+    from trnla.TrnlaUploadJournal import upload_journal, COMPLETED
+
+    mode_dir = os.path.join(scratch, "shots_lost_replies")
+    exporters = [shot_exporter(args, mode_dir, "lost%03d" % (shot * 10), {"trnla_batch_register": True})
+                 for shot in range(args.shots)]
+    before = standin_call(app, "standin/stats", [], args.timeout)
+    # the registration and the first stores
+    standin_call(app, "standin/faults", [("lost_replies", str(1 + args.shots))], args.timeout)
+    start = time.time()
+    try:
+        registration = TrnlaShotRegistration("bench", [exporter.shotName() for exporter, preview in exporters])
+        registration.start("1")
+        for exporter, preview in exporters:
+            exporter.shot_registration = registration
+            exporter.upload_shot(preview)
+        wait_for(app, lambda: all(exporter.uploaded for exporter, preview in exporters), args.timeout)
+    finally:
+        standin_call(app, "standin/faults", [], args.timeout)
+    elapsed = time.time() - start
+    after = standin_call(app, "standin/stats", [], args.timeout)
+    for exporter, preview in exporters:
+        entry = upload_journal().entry(exporter.journal_id)
+        if entry["state"] != COMPLETED:
+            raise RuntimeError("lost replies: %s was not stored: %s" % (exporter.shotName(), entry.get("error")))
+        if after["shots"].count(exporter.shotName()) != 1:
+            raise RuntimeError("lost replies: %s was created %d times" % (exporter.shotName(),
+                                                                          after["shots"].count(exporter.shotName())))
+        exporter.finishTask()
+    if after["repeated_requests"] == before["repeated_requests"]:
+        raise RuntimeError("lost replies: no request was sent again")
+    shutil.rmtree(mode_dir)
+    return {"shot_lost_replies_seconds": round(elapsed / args.shots, 3)}
+
+
+def bench_shots(args, app, scratch):
+    """End to end time of exporting already rendered shots, from the upload starting until every shot
+    is stored, for every upload mode the preset offers."""
+    from trnla.TrnlaShotRegistry import TrnlaShotRegistration
+    from trnla.TrnlaShotProcessor import TrnlaPendingProject
+    from trnla.TrnlaNetwork import trnla_network
+    from trnla.TrnlaUploadScheduler import upload_scheduler
+    from trnla.TrnlaUploadWorker import upload_worker
+    from trnla.TrnlaUploadJournal import upload_journal, COMPLETED
+
+    modes = {"store": {},
+             "chunked": {"trnla_chunked_upload": True},
+             "stream": {"trnla_stream_archive": True},
+             "dedup": {"trnla_dedup_frames": True},
+             "batch": {"trnla_batch_register": True},
+             # the project is created by the export, as with "New Project" in the export dialog
+             "new_project": {"trnla_project_id": False},
+             "worker": {"trnla_upload_worker": True, "trnla_stream_archive": True}}
+    upload_scheduler().configure(args.max_uploads, 0)
+    results = {}
+    for mode, properties in sorted(modes.items()):
+        mode_dir = os.path.join(scratch, "shots_" + mode)
+        exporters = [shot_exporter(args, mode_dir, "sh%03d" % (shot * 10), properties)
+                     for shot in range(args.shots)]
+
+        start = time.time()
+        if mode == "new_project":
+            # resolved before the uploads start, so no exporter waits on it
+            pending = TrnlaPendingProject("bench new project")
+            reply = trnla_network().post_form_retrying("store_project", [("api_key", "bench"),
+                                                                         ("name", pending.name)])
+            reply.finished.connect(lambda reply: pending.resolve(
+                json.loads(reply.readAll().data().decode("utf8"))["project_id"]))
+            wait_for(app, lambda: pending.project_id is not None, args.timeout)
+            for exporter, preview in exporters:
+                exporter.pending_project = pending
+        if properties.get("trnla_batch_register"):
+            registration = TrnlaShotRegistration("bench", [exporter.shotName() for exporter, preview in exporters])
+            registration.start("1")
+            for exporter, preview in exporters:
+                exporter.shot_registration = registration
+        for exporter, preview in exporters:
+            exporter.upload_shot(preview)
+        stalls = []
+        wait_for(app, lambda: all(exporter.uploaded for exporter, preview in exporters), args.timeout, stalls)
+        elapsed = time.time() - start
+        for exporter, preview in exporters:
+            if exporter.error():
+                raise RuntimeError("%s failed: %s" % (mode, exporter.error()))
+            entry = upload_journal().entry(exporter.journal_id)
+            if entry["state"] != COMPLETED:
+                raise RuntimeError("%s: %s was not stored: %s" % (mode, exporter.shotName(), entry.get("error")))
+            exporter.finishTask()
+        results["shot_%s_seconds" % mode] = round(elapsed / args.shots, 3)
+        results["shot_%s_max_stall_ms" % mode] = round(max(stalls or [0]) * 1000.0, 1)
+        shutil.rmtree(mode_dir)
+    results.update(bench_shared_frames(args, app, scratch))
+    results.update(bench_lost_replies(args, app, scratch))
+    if upload_worker() is not None:
+        upload_worker().stop()
+    return results
+
+
+def bench_farm(args, app, scratch):
+    """End to end time of exporting shots with the farm submission: rendered and uploaded by the local
+    stand-in render nodes, the shots stored from here once they are done. single_pass writes the preview
+    from the full quality render instead of a render of its own, scrub adds the poster and scrub sprite,
+    segmented uploads the preview in segments while it renders."""
+    from trnla.TrnlaTranscodeExporter import TrnlaTranscodeExporter, TrnlaTranscodePreset
+    from trnla.TrnlaPreviewTranscoder import TrnlaPreviewTranscoder, TrnlaPreviewTranscoderPreset
+    from trnla.TrnlaFarmSubmission import TrnlaFarmSubmission
+    from trnla_farm_standin import start_farm, stop_farm, render_command, write_config
+
+    spool = os.path.join(scratch, "farm_spool")
+    os.environ["TRNLA_FARM_SPOOL"] = spool
+    # the segments of a segmented preview are encoded from here, by the fake renderer
+    os.environ["TRNLA_BENCH_RENDER"] = render_command(args.frame_size, args.render_seconds / 4)
+    # the nodes upload with their own login, the tickets don't carry the key
+    node_config = write_config(os.path.join(scratch, "node_config.json"), "bench")
+    farm = start_farm(spool, args.farm_nodes, os.environ["TRNLA_API_ROOT"], args.frame_size, args.render_seconds,
+                      node_config)
+    results = {}
+    try:
+        for mode, single_pass, scrub, segmented in (("farm", False, False, False),
+                                                    ("farm_single_pass", True, False, False),
+                                                    ("farm_scrub", True, True, False),
+                                                    ("farm_segmented", True, False, True)):
+            submission = TrnlaFarmSubmission()
+            submission.initialise()
+            tasks = []
+            exporters = []
+            for shot in range(args.shots):
+                shot_name = "sh%03d" % (shot * 10)
+                shot_dir = os.path.join(scratch, mode, shot_name)
+                init = {"shotName": shot_name, "range": (1001, 1000 + args.frames), "submission": submission}
+                full_preset = TrnlaTranscodePreset("bench", {"trnla_upload": True, "trnla_api_key": "bench",
+                                                             "trnla_project_id": "1", "file_type": "dpx",
+                                                             "trnla_farm_frames_per_ticket": args.farm_frames_per_ticket})
+                full = TrnlaTranscodeExporter(dict(init, preset=full_preset,
+                                                   exportPath=os.path.join(shot_dir, "full", shot_name + ".####.dpx")))
+                prev_preset = TrnlaPreviewTranscoderPreset("bench", {"file_type": "mov", "trnla_scrub": scrub,
+                                                                     "trnla_preview_segment_frames":
+                                                                         max(1, args.frames // 4) if segmented else 0})
+                prev = TrnlaPreviewTranscoder(dict(init, preset=prev_preset,
+                                                   exportPath=os.path.join(shot_dir, shot_name + ".mp4")))
+                if single_pass:
+                    full.render_preview(prev)
+                if scrub:
+                    prev.notifier.preview_ready[str].connect(full.upload_scrub)
+                if segmented:
+                    prev.notifier.preview_started[str].connect(full.upload_preview_segments)
+                    prev.notifier.preview_ready[str].connect(full.preview_encoded)
+                prev.notifier.preview_ready[str].connect(full.upload_shot)
+                tasks += [full, prev]
+                exporters.append(full)
+
+            start = time.time()
+            for task in tasks:
+                task.startTask()
+            running = list(tasks)
+            first_segment = {}
+            segment_times = dict((exporter, []) for exporter in exporters)
+
+            def step():
+                # what Hiero does with the tasks of an export
+                for task in list(running):
+                    if not task.taskStep():
+                        running.remove(task)
+                        task.finishTask()
+                for exporter in exporters:
+                    if exporter.segments_sent and exporter not in first_segment:
+                        first_segment[exporter] = time.time() - start
+                    if exporter.segments_sent > len(segment_times[exporter]):
+                        segment_times[exporter].append(time.time() - start)
+                return all(exporter.uploaded for exporter in exporters)
+            stalls = []
+            wait_for(app, step, args.timeout, stalls)
+            elapsed = time.time() - start
+            for exporter in exporters:
+                if exporter.error():
+                    raise RuntimeError("%s failed: %s" % (mode, exporter.error()))
+            results["%s_shot_seconds" % mode] = round(elapsed / args.shots, 3)
+            results["%s_max_stall_ms" % mode] = round(max(stalls or [0]) * 1000.0, 1)
+            if segmented:
+                if not all(exporter.preview_stored for exporter in exporters):
+                    raise RuntimeError("%s: a segmented preview was not stored" % mode)
+                # how soon a shot can be played on trn.la, and how long after its render that is, below
+                # zero while it is still rendering
+                results["%s_first_segment_seconds" % mode] = round(sum(first_segment.values()) /
+                                                                   max(1, len(first_segment)), 3)
+                # the preview movie is written when the render ends
+                rendered = dict((exporter, os.path.getmtime(exporter.preview_task.resolvedExportPath()) - start)
+                                for exporter in exporters)
+                results["%s_first_segment_after_render_seconds" % mode] = round(
+                    sum(first_segment[exporter] - rendered[exporter] for exporter in first_segment) /
+                    max(1, len(first_segment)), 3)
+                # share of the segments that only got to trn.la after their shot finished rendering
+                sent = sum(len(times) for times in segment_times.values())
+                late = sum(len([at for at in times if at >= rendered[exporter]])
+                           for exporter, times in segment_times.items())
+                results["%s_segments_after_render_share" % mode] = round(float(late) / max(1, sent), 2)
+    finally:
+        stop_farm(farm)
+    return results
+
+
+class BenchItem(object):
+    def __init__(self, guid):
+        self._guid = guid
+
+    def guid(self):
+        return self._guid
+
+
+def bench_setup(args):
+    """Time TrnlaShotProcessor takes to set up the trnla tasks of an export, by shot count."""
+    from trnla.TrnlaShotProcessor import TrnlaShotProcessor, TrnlaShotProcessorPreset
+    from trnla.TrnlaTranscodeExporter import TrnlaTranscodeExporter, TrnlaTranscodePreset
+    from trnla.TrnlaPreviewTranscoder import TrnlaPreviewTranscoder, TrnlaPreviewTranscoderPreset
+
+    results = {}
+    for shots in args.setup_shots:
+        full_preset = TrnlaTranscodePreset("full", {})
+        prev_preset = TrnlaPreviewTranscoderPreset("prev", {})
+        preset = TrnlaShotProcessorPreset("bench", {"trnla_upload": True, "trnla_new_project": False,
+                                                    "trnla_exist_project": True, "trnla_project_id": "1",
+                                                    "trnla_api_key": "bench", "trnla_timing_log": "",
+                                                    "exportTemplate": (("{shot}/full/{shot}.####.dpx", full_preset),
+                                                                       ("{shot}/prev/{shot}.mp4", prev_preset))})
+        processor = TrnlaShotProcessor(preset)
+        for shot in range(shots):
+            item = BenchItem("guid%05d" % shot)
+            processor.tasks.append(TrnlaTranscodeExporter({"preset": full_preset, "item": item}))
+            processor.tasks.append(TrnlaPreviewTranscoder({"preset": prev_preset, "item": item}))
+        export_items = [None] * shots
+        start = time.time()
+        processor.startProcessing(export_items)
+        results["setup_%d_shots_ms" % shots] = round((time.time() - start) * 1000.0, 2)
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def previous_result(params):
+    if not os.path.isdir(RESULTS_DIR):
+        return None
+    for name in sorted(os.listdir(RESULTS_DIR), reverse=True):
+        with open(os.path.join(RESULTS_DIR, name)) as result_file:
+            result = json.load(result_file)
+        if result.get("params") == params:
+            return result
+    return None
+
+
+def compare(previous, metrics):
+    """Prints every metric next to the previous run. Returns the metrics that got worse."""
+    regressions = []
+    for name, value in sorted(metrics.items()):
+        line = "  %-28s %10s" % (name, value)
+        old = previous["metrics"].get(name) if previous else None
+        if old:
+            change = (value - old) / float(old)
+            # throughput should go up, times should go down
+            worse = -change if name.endswith("_per_s") else change
+            line += "   was %10s  %+6.1f%%" % (old, change * 100)
+            if name != "archive_ratio" and worse > REGRESSION_THRESHOLD:
+                line += "  REGRESSION"
+                regressions.append(name)
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the trn.la export pipeline against a local stand-in.")
+    parser.add_argument("--frames", type=int, default=48, help="frames per shot")
+    parser.add_argument("--frame-size", type=float, default=4, help="size of every frame in MB")
+    parser.add_argument("--shots", type=int, default=4, help="shots in the end to end export")
+    parser.add_argument("--compressibility", type=float, default=0.5, help="share of every frame that compresses")
+    parser.add_argument("--compression", default="deflate", help="stored, deflate or fast")
+    parser.add_argument("--workers", type=int, default=0, help="archive workers, 0 uses every core")
+    parser.add_argument("--chunk-size", type=int, default=8, help="chunked upload size in MB")
+    parser.add_argument("--max-uploads", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the stand-in waits before every reply")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="chance the stand-in drops an upload request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="chance the stand-in answers with a 502 or 503")
+    parser.add_argument("--setup-shots", type=int, nargs="+", default=[100, 500, 2500],
+                        help="shot counts the export setup is timed with")
+    parser.add_argument("--farm-nodes", type=int, default=4, help="render nodes of the stand-in farm")
+    parser.add_argument("--farm-frames-per-ticket", type=int, default=0,
+                        help="frames every farm node renders, 0 renders a whole shot on one node")
+    parser.add_argument("--render-seconds", type=float, default=0.05, help="stand-in render time of a frame")
+    parser.add_argument("--timeout", type=int, default=600)
+    parser.add_argument("--only", choices=("archive", "upload", "shots", "farm", "setup"), action="append",
+                        help="run only these benchmarks")
+    parser.add_argument("--no-save", action="store_true", help="don't write the results file")
+    args = parser.parse_args()
+    args.frame_size = int(args.frame_size * MB)
+    benchmarks = args.only or ["archive", "upload", "shots", "farm", "setup"]
+
+    standin, api_root = start_standin_process(args)
+    # the plugin reads the api root when it is imported
+    os.environ["TRNLA_API_ROOT"] = api_root
+    from PySide2.QtCore import QCoreApplication
+    app = QCoreApplication.instance() or QCoreApplication(sys.argv)
+
+    scratch = tempfile.mkdtemp(prefix="trnla_bench_")
+    # keep the benchmark's uploads out of the user's upload journal
+    os.environ["TRNLA_UPLOAD_JOURNAL"] = os.path.join(scratch, "upload_journal.json")
+    metrics = {}
+    try:
+        shot_dir = make_frames(os.path.join(scratch, "shot"), "bench", args.frames, args.frame_size,
+                               args.compressibility)
+        if "archive" in benchmarks:
+            metrics.update(bench_archive(args, shot_dir, scratch))
+        if "upload" in benchmarks:
+            metrics.update(bench_upload(args, app, shot_dir, scratch))
+        if "shots" in benchmarks:
+            metrics.update(bench_shots(args, app, scratch))
+        if "farm" in benchmarks:
+            metrics.update(bench_farm(args, app, scratch))
+        if "setup" in benchmarks:
+            metrics.update(bench_setup(args))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+        standin.terminate()
+        standin.wait()
+
+    params = dict((key, value) for key, value in vars(args).items() if key not in ("timeout", "no_save", "only"))
+    params["benchmarks"] = sorted(benchmarks)
+    previous = previous_result(params)
+    print("trn.la benchmarks @ %s%s" % (git_revision(), " vs " + previous["revision"] if previous else ""))
+    regressions = compare(previous, metrics)
+
+    if not args.no_save:
+        if not os.path.isdir(RESULTS_DIR):
+            os.makedirs(RESULTS_DIR)
+        result = {"revision": git_revision(),
+                  "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                  "python": platform.python_version(),
+                  "platform": platform.platform(),
+                  "cpus": os.cpu_count(),
+                  "params": params,
+                  "metrics": metrics}
+        result_path = os.path.join(RESULTS_DIR, "%s_%s.json" % (time.strftime("%Y%m%d_%H%M%S"), result["revision"]))
+        with open(result_path, "w") as result_file:
+            json.dump(result, result_file, indent=2, sort_keys=True)
+        print("saved " + os.path.relpath(result_path, REPO_DIR))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,5 @@
+# Lightweight stand-ins for the parts of hiero the trnla plugin uses, so it can be benchmarked
+# outside Nuke Studio. Only the behaviour the plugin relies on is modelled.
+from . import core
+from . import exporters
+from . import ui
@@ -0,0 +1,2 @@
+def nukeColourTransformNameFromHiero(colourSpace, projectsettings):
+    return colourSpace
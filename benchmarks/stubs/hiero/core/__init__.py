@@ -0,0 +1,111 @@
+from . import log
+from . import FnNukeHelpers
+from . import nuke
+
+
+class TaskPresetBase(object):
+    kAllItems = 0
+
+    def __init__(self, parentType, name):
+        self._parentType = parentType
+        self._name = name
+        self._properties = {}
+        self._nonPersistentProperties = {}
+
+    def name(self):
+        return self._name
+
+    def properties(self):
+        return self._properties
+
+    def nonPersistentProperties(self):
+        return self._nonPersistentProperties
+
+
+class RenderTaskPreset(TaskPresetBase):
+    def __init__(self, parentType, name, properties):
+        TaskPresetBase.__init__(self, parentType, name)
+
+
+class ProcessorPreset(TaskPresetBase):
+    def __init__(self, parentType, name):
+        TaskPresetBase.__init__(self, parentType, name)
+
+
+class _TaskRegistry(object):
+    def registerProcessor(self, preset, processor):
+        pass
+
+    def registerTask(self, preset, task):
+        pass
+
+    def addSubmission(self, name, submission):
+        pass
+
+
+taskRegistry = _TaskRegistry()
+
+
+def remapPath(path):
+    return path
+
+
+def projects():
+    return []
+
+
+def LUTs(project=None):
+    return []
+
+
+class ExportStructureElement(object):
+    def __init__(self, name, preset=None):
+        self._name = name
+        self._preset = preset
+        self._children = []
+
+    def name(self):
+        return self._name
+
+    def preset(self):
+        return self._preset
+
+    def children(self):
+        return list(self._children)
+
+    def childCount(self):
+        return len(self._children)
+
+    def addChild(self, child):
+        self._children.append(child)
+        return child
+
+    def removeChild(self, child):
+        self._children.remove(child)
+
+
+class ExportStructure2(object):
+    def __init__(self, template=()):
+        self._root = ExportStructureElement("")
+        for path, preset in template:
+            parent = self._root
+            parts = path.split("/")
+            for part in parts[:-1]:
+                existing = [child for child in parent.children() if child.name() == part]
+                parent = existing[0] if existing else parent.addChild(ExportStructureElement(part))
+            parent.addChild(ExportStructureElement(parts[-1], preset))
+
+    def rootElement(self):
+        return self._root
+
+    def flatten(self):
+        elements = []
+        stack = [("", self._root)]
+        while stack:
+            path, element = stack.pop()
+            for child in reversed(element.children()):
+                child_path = path + "/" + child.name() if path else child.name()
+                if child.preset() is not None:
+                    elements.append((child_path, child.preset()))
+                stack.append((child_path, child))
+        return elements
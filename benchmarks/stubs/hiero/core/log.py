@@ -0,0 +1,10 @@
+def info(msg):
+    print(msg)
+
+
+def debug(msg):
+    pass
+
+
+def error(msg):
+    print(msg)
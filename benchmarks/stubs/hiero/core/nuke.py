@@ -0,0 +1,98 @@
+# Minimal stand-in for hiero.core.nuke, the script writer the exporters build Nuke scripts with.
+
+import os
+import re
+import shlex
+import subprocess
+
+
+class Node(object):
+    def __init__(self, nodeClass, inputNode=None, inputs=1):
+        self._nodeClass = nodeClass
+        self._knobs = {}
+        self._name = None
+
+    def setKnob(self, name, value):
+        self._knobs[name] = value
+
+    def knob(self, name):
+        return self._knobs.get(name)
+
+    def setName(self, name):
+        self._name = name
+
+    def toString(self):
+        lines = ["%s {" % self._nodeClass]
+        if self._name:
+            lines.append(" name %s" % self._name)
+        lines += [" %s %s" % (name, value) for name, value in sorted(self._knobs.items())]
+        return "\n".join(lines + ["}"])
+
+
+class WriteNode(Node):
+    def __init__(self, file, inputNode=None, inputs=1):
+        Node.__init__(self, "Write", inputNode, inputs)
+        self.setKnob("file", file)
+
+
+class ReadNode(Node):
+    def __init__(self, file, inputNode=None, inputs=0):
+        Node.__init__(self, "Read", inputNode, inputs)
+        self.setKnob("file", file)
+
+
+class RootNode(Node):
+    def __init__(self, first, last, fps=None):
+        Node.__init__(self, "Root", inputs=0)
+        self.setKnob("first_frame", first)
+        self.setKnob("last_frame", last)
+        if fps is not None:
+            self.setKnob("fps", fps)
+
+
+class SetNode(Node):
+    def __init__(self, label, inputs=0):
+        Node.__init__(self, "set", inputs=inputs)
+        self._label = label
+
+    def toString(self):
+        return "set %s [stack 0]" % self._label
+
+
+class PushNode(Node):
+    def __init__(self, label):
+        Node.__init__(self, "push", inputs=0)
+        self._label = label
+
+    def toString(self):
+        return "push $%s" % self._label
+
+
+class ScriptWriter(object):
+    def __init__(self):
+        self._nodes = []
+
+    def addNode(self, node):
+        self._nodes.append(node)
+
+    def toString(self):
+        return "\n".join(node.toString() for node in self._nodes) + "\n"
+
+    def writeToDisk(self, path):
+        with open(path, "w") as script:
+            script.write(self.toString())
+
+
+def executeNukeScript(path, logFile=None, useSingleSocket=False):
+    """Renders the script's frame range with the command in TRNLA_BENCH_RENDER, the benchmarks point it
+    at the stand-in farm's fake renderer."""
+    with open(path) as script:
+        text = script.read()
+    first = int(re.search(r"first_frame (\d+)", text).group(1))
+    last = int(re.search(r"last_frame (\d+)", text).group(1))
+    command = os.environ["TRNLA_BENCH_RENDER"].format(first=first, last=last, script='"%s"' % path)
+    log = open(logFile or os.devnull, "w")
+    try:
+        return subprocess.Popen(shlex.split(command), stdout=log, stderr=subprocess.STDOUT)
+    finally:
+        log.close()
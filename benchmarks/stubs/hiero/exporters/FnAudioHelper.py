@@ -0,0 +1,2 @@
+def defineExportPresetProperties(preset):
+    pass
@@ -0,0 +1,4 @@
+kFileBaseKeyword = "{filebase}"
+kFileHeadKeyword = "{filehead}"
+kFilePathKeyword = "{filepath}"
+KeywordTooltips = {kFileBaseKeyword: "", kFileHeadKeyword: "", kFilePathKeyword: ""}
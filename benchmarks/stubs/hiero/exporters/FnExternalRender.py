@@ -0,0 +1,84 @@
+import os
+import tempfile
+
+import hiero.core
+
+from .FnSubmission import Submission
+
+
+class NukeRenderTask(object):
+    burninPropertyData = []
+
+    def __init__(self, initDict):
+        self._initDict = initDict
+        self._preset = initDict["preset"]
+        self._item = initDict.get("item")
+        self._exportPath = initDict.get("exportPath", "")
+        self._shotName = initDict.get("shotName", "shot")
+        self._start, self._end = initDict.get("range", (1001, 1001))
+        self._progress = 0.0
+        self._finished = False
+        self._error = None
+        # with a submission the render is handed to the job it adds, as Hiero does
+        self._submission = initDict.get("submission")
+        self._renderTask = None
+        self._scriptfile = None
+
+    def resolvedExportPath(self):
+        return self._exportPath
+
+    def shotName(self):
+        return self._shotName
+
+    def outputRange(self):
+        return self._start, self._end
+
+    def setError(self, error):
+        self._error = error
+
+    def error(self):
+        if self._error is None and self._renderTask is not None:
+            return self._renderTask.error()
+        return self._error
+
+    def progress(self):
+        if self._renderTask is not None:
+            return self._renderTask.progress()
+        return self._progress
+
+    def startTask(self):
+        if self._submission is None:
+            return
+        script = hiero.core.nuke.ScriptWriter()
+        if hasattr(self, "addWriteNodeToScript"):
+            self.addWriteNodeToScript(script, None, None)
+        handle, self._scriptfile = tempfile.mkstemp(suffix=".nk")
+        os.close(handle)
+        script.writeToDisk(self._scriptfile)
+        self._renderTask = self._submission.addJob(Submission.kNukeRender, self._initDict, self._scriptfile)
+        self._renderTask.startTask()
+
+    def taskStep(self):
+        if self._renderTask is not None:
+            return self._renderTask.taskStep()
+        return False
+
+    def finishTask(self):
+        if self._renderTask is not None:
+            self._renderTask.finishTask()
+        if self._scriptfile and os.path.exists(self._scriptfile):
+            os.remove(self._scriptfile)
+            self._scriptfile = None
+        self._finished = True
+
+
+def getRoleFromProperty(value):
+    return value
+
+
+def getColorspaceFromProperty(value):
+    return value
+
+
+def _mapDefaultColourTransform(preset, projectsettings):
+    return None
@@ -0,0 +1,3 @@
+class NukeRenderTaskUI(object):
+    def __init__(self, preset, taskType, displayName):
+        self._preset = preset
@@ -0,0 +1,2 @@
+class NukeShotPreset(object):
+    pass
@@ -0,0 +1,19 @@
+import hiero.core
+
+
+class ShotProcessor(object):
+    kStartFrameSource = "Source"
+
+    def __init__(self, preset, submission=None, synchronous=False):
+        self._preset = preset
+        self._submission = submission
+        self._synchronous = synchronous
+        self._exportTemplate = hiero.core.ExportStructure2(preset.properties().get("exportTemplate", ()))
+        # the tasks startProcessing pretends to have created from the template
+        self.tasks = []
+
+    def preset(self):
+        return self._preset
+
+    def startProcessing(self, exportItems, preview=False):
+        return list(self.tasks)
@@ -0,0 +1,8 @@
+class Submission(object):
+    kNukeRender = "NukeRender"
+
+    def initialise(self):
+        pass
+
+    def addJob(self, jobType, initDict, filePath, **kwargs):
+        raise NotImplementedError()
@@ -0,0 +1,13 @@
+import hiero.core
+
+from .FnExternalRender import NukeRenderTask
+
+
+class TranscodeExporter(NukeRenderTask):
+    def addWriteNodeToScript(self, script, rootNode, framerate):
+        script.addNode(hiero.core.nuke.WriteNode(self._exportPath))
+
+
+class TranscodePreset(hiero.core.RenderTaskPreset):
+    def _defaultReadAllLinesForCodec(self):
+        return False
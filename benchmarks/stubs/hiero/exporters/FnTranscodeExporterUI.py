@@ -0,0 +1,6 @@
+from .FnExternalRenderUI import NukeRenderTaskUI
+
+
+class TranscodeExporterUI(NukeRenderTaskUI):
+    def populateUI(self, widget, exportTemplate):
+        pass
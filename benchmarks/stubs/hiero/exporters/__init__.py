@@ -0,0 +1,2 @@
+from . import (FnTranscodeExporter, FnTranscodeExporterUI, FnExternalRenderUI, FnExternalRender, FnAudioHelper,
+               FnSubmission, FnShotProcessor, FnExportKeywords, FnNukeShotExporter)
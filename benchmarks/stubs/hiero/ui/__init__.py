@@ -0,0 +1,9 @@
+class _TaskUIRegistry(object):
+    def registerProcessorUI(self, preset, ui):
+        pass
+
+    def registerTaskUI(self, preset, ui):
+        pass
+
+
+taskUIRegistry = _TaskUIRegistry()
@@ -0,0 +1,18 @@
+# Minimal stand-in for Nuke's python module, enough to import the trnla plugin outside Nuke.
+
+
+def message(text):
+    print(text)
+
+
+def getFilename(message, *args, **kwargs):
+    return None
+
+
+class _Root(object):
+    def knob(self, name):
+        return None
+
+
+def root():
+    return _Root()
@@ -0,0 +1,154 @@
+# --------------------------Trn.la Plugin For Nuke Studio--------------------------------
+# Local stand-in for a render farm. Runs a number of TrnlaFarmNode processes on this
+# machine against one spool directory, with a fake renderer in the place of Nuke that
+# writes the files of every Write node in the script, at a given speed per frame.
+#
+#   python benchmarks/trnla_farm_standin.py --spool /tmp/trnla_spool --nodes 4
+#
+# (c) 2021 Tarantula
+# Author: Moses Molina
+# ---------------------------------------------------------------------------------------
+
+import os
+import re
+import sys
+import time
+import json
+import struct
+import argparse
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+NODE_SCRIPT = os.path.join(os.path.dirname(BENCH_DIR), "trnla", "TrnlaFarmNode.py")
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), "trnla"))
+
+
+def write_paths(script_path):
+    """(file, first, last) of the Write nodes in a Nuke script, first and last are None for a Write
+    node without a frame limit."""
+    writes = []
+    write = None
+    with open(script_path) as script:
+        for line in script:
+            if re.match(r"^Write\s*{", line):
+                write = {}
+            elif line.startswith("}") and write is not None:
+                limited = write.get("use_limit") == "True"
+                writes.append((write["file"], int(write["first"]) if limited else None,
+                               int(write["last"]) if limited else None))
+                write = None
+            elif write is not None and line.strip():
+                knob, _, value = line.strip().partition(" ")
+                write[knob] = value.strip().strip('"')
+    return writes
+
+
+def write_file(path, size):
+    if not os.path.isdir(os.path.dirname(path)):
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError:
+            pass
+    if path.endswith(".jpg"):
+        # posters and thumbnails are read back as images
+        from PySide2.QtGui import QImage
+        image = QImage(240, 135, QImage.Format_RGB32)
+        image.fill(0x336699)
+        image.save(path + ".partial", "JPG")
+        os.rename(path + ".partial", path)
+        return
+    # half random, half zeros, like the benchmark's frames
+    data = os.urandom(size // 2) + b"\0" * (size - size // 2)
+    if os.path.splitext(path)[1] in (".mov", ".mp4"):
+        # the boxes of a finished movie, moov written last
+        data = struct.pack(">I4s8s", 16, b"ftyp", b"isom\0\0\0\0") + struct.pack(">I4s", len(data) + 8, b"mdat") + \
+            data + struct.pack(">I4s", 8, b"moov")
+    with open(path + ".partial", "wb") as frame_file:
+        frame_file.write(data)
+    os.rename(path + ".partial", path)
+
+
+def fake_render(first, last, script_path, frame_size, seconds_per_frame):
+    """Renders first to last of every Write node in the script. The time per frame stands for reading
+    and transforming the source, which the Write nodes of a script share. Like Nuke's movie writers,
+    every movie is finished once the whole render is, frame range or not."""
+    from TrnlaFarmSpool import frame_path
+    writes = write_paths(script_path)
+    for frame in range(first, last + 1):
+        time.sleep(seconds_per_frame)
+        for output, limit_first, limit_last in writes:
+            if limit_first is not None and not limit_first <= frame <= limit_last:
+                continue
+            path = frame_path(output, frame)
+            if path is not None:
+                write_file(path, frame_size)
+    for output, limit_first, limit_last in writes:
+        if frame_path(output, first) is None:
+            # a movie, written once every frame is in
+            frames = (limit_last - limit_first + 1) if limit_first is not None else (last - first + 1)
+            write_file(output, frame_size // 4 * frames // (last - first + 1))
+
+
+def render_command(frame_size, seconds_per_frame):
+    return " ".join('"%s"' % arg for arg in (sys.executable, os.path.abspath(__file__), "render",
+                                              "--frame-size", str(frame_size),
+                                              "--seconds-per-frame", str(seconds_per_frame))) + \
+        " {first} {last} {script}"
+
+
+def write_config(path, api_key):
+    """A trn.la config for the nodes, as a login on the node would write it."""
+    with open(path, "w") as config_file:
+        json.dump({"settings": {"api_key": api_key}}, config_file)
+    return path
+
+
+def start_farm(spool, nodes, api_root, frame_size, seconds_per_frame=0.0, config=None):
+    """Starts the render nodes, uploading with the api key in config. Returns their processes, stop them
+    with stop_farm."""
+    env = dict(os.environ)
+    env["TRNLA_API_ROOT"] = api_root
+    env["PYTHONUNBUFFERED"] = "1"
+    config_args = ["--config", config] if config else []
+    return [subprocess.Popen([sys.executable, NODE_SCRIPT, "--spool", spool, "--name", "node%02d" % node,
+                              "--render", render_command(frame_size, seconds_per_frame)] + config_args, env=env)
+            for node in range(nodes)]
+
+
+def stop_farm(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.wait()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "render":
+        parser = argparse.ArgumentParser(description="Fake renderer the stand-in nodes run instead of Nuke.")
+        parser.add_argument("command")
+        parser.add_argument("--frame-size", type=int, default=1048576)
+        parser.add_argument("--seconds-per-frame", type=float, default=0.0)
+        parser.add_argument("first", type=int)
+        parser.add_argument("last", type=int)
+        parser.add_argument("script")
+        args = parser.parse_args()
+        fake_render(args.first, args.last, args.script, args.frame_size, args.seconds_per_frame)
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="Local stand-in for a trn.la render farm.")
+    parser.add_argument("--spool", required=True, help="the spool directory Nuke Studio submits to")
+    parser.add_argument("--nodes", type=int, default=4)
+    parser.add_argument("--api-root", default=os.environ.get("TRNLA_API_ROOT", "https://trn.la/api/producer"))
+    parser.add_argument("--frame-size", type=float, default=4, help="size of every rendered frame in MB")
+    parser.add_argument("--seconds-per-frame", type=float, default=0.5, help="render time of a frame")
+    parser.add_argument("--config", help="trn.la config with the api key the nodes upload with")
+    args = parser.parse_args()
+    farm = start_farm(args.spool, args.nodes, args.api_root, int(args.frame_size * 1048576), args.seconds_per_frame,
+                      args.config)
+    print("%d render nodes watching %s" % (args.nodes, args.spool))
+    sys.stdout.flush()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stop_farm(farm)
@@ -0,0 +1,435 @@
+# --------------------------Trn.la Plugin For Nuke Studio--------------------------------
+# Local stand-in for the trn.la producer API. Implements just enough of the endpoints the
+# plugin talks to for benchmarks, and can drop connections part way through requests to
+# exercise resumable uploads.
+#
+# (c) 2021 Tarantula
+# Author: Moses Molina
+# ---------------------------------------------------------------------------------------
+
+import io
+import os
+import sys
+import json
+import random
+import shutil
+import hashlib
+import tempfile
+import time
+import threading
+import itertools
+import zipfile
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+API_PREFIX = "/api/producer/"
+# endpoints that create something, see handle_standin_faults
+CREATES = ("store_project", "shots/register", "store", "store_preview", "store_scrub", "preview/segment")
+
+
+def parse_form(content_type, body):
+    """Returns {name: bytes} for a multipart or urlencoded body."""
+    if content_type.startswith("application/x-www-form-urlencoded"):
+        fields = {}
+        for pair in body.decode("utf8").split("&"):
+            if "=" in pair:
+                name, value = pair.split("=", 1)
+                fields[name] = value.encode("utf8")
+        return fields
+    message = BytesParser().parsebytes(b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body)
+    fields = {}
+    for part in message.get_payload():
+        name = part.get_param("name", header="content-disposition")
+        fields[name] = part.get_payload(decode=True)
+    return fields
+
+
+class TrnlaStandinState(object):
+    def __init__(self, root):
+        self.root = root
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.projects = {}
+        self.shots = {}
+        self.uploads = {}
+        self.resume_keys = {}
+        self.frames = set()
+        self.requests = {}
+        self.dropped = 0
+        self.errors = 0
+        # chunks cut off after this many bytes, see handle_standin_faults
+        self.drop_chunk_after = 0
+        self.chunk_drops_left = 0
+        self.chunk_drops = 0
+        # bytes of chunks the server already had, sent again by a client that restarted a chunk
+        self.overlap_bytes = 0
+        # shots whose store is refused after failing_delay seconds, see handle_standin_faults
+        self.failing_shots = set()
+        self.failing_delay = 0.0
+        # stored manifests that referenced frames the server doesn't have
+        self.broken_manifests = 0
+        # creates handled but not answered, see handle_standin_faults
+        self.lost_replies_left = 0
+        # (endpoint, idempotency key): (reply, status) of requests already handled
+        self.handled = {}
+        self.repeated_requests = 0
+
+
+class TrnlaStandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None
+    # fault injection, set through start_standin
+    drop_rate = 0.0
+    error_rate = 0.0
+    latency = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.startswith(API_PREFIX):
+            self._reply({"success": False, "error": "not found"}, 404)
+            return
+        endpoint = self.path[len(API_PREFIX):].strip("/")
+        length = int(self.headers.get("Content-Length", 0))
+        if endpoint in ("upload/chunk", "store", "frames/store") and random.random() < self.drop_rate:
+            # read part of the body, then hang up without answering
+            self.rfile.read(length // 2)
+            with self.state.lock:
+                self.state.dropped += 1
+            self.close_connection = True
+            self.connection.shutdown(2)
+            return
+        body = self.rfile.read(length)
+        self.hang_up = False
+        if self.latency:
+            threading.Event().wait(self.latency)
+        if endpoint != "login" and not endpoint.startswith("standin/") and random.random() < self.error_rate:
+            # an overloaded or restarting server, the request was not handled
+            with self.state.lock:
+                self.state.errors += 1
+            self.response_headers = {"Retry-After": "0"} if random.random() < 0.5 else {}
+            self._reply({"success": False, "error": "bad gateway"}, random.choice((502, 503)))
+            return
+        with self.state.lock:
+            self.state.requests[endpoint] = self.state.requests.get(endpoint, 0) + 1
+        handler = getattr(self, "handle_" + endpoint.replace("/", "_"), None)
+        if handler is None:
+            self._reply({"success": False, "error": "unknown endpoint " + endpoint}, 404)
+            return
+        fields = parse_form(self.headers.get("Content-Type", ""), body)
+        self.response_headers = {}
+        if "project_id" in fields and not self._text(fields, "project_id").isdigit():
+            # an exporter that never learned the id of the project it belongs to
+            self._reply({"success": False, "error": "invalid project_id %r" % self._text(fields, "project_id")}, 400)
+            return
+        if endpoint != "login" and not endpoint.startswith("standin/") and not self._text(fields, "api_key"):
+            self._reply({"success": False, "error": "no api_key"}, 401)
+            return
+        key = (endpoint, self._text(fields, "idempotency_key"))
+        with self.state.lock:
+            handled = self.state.handled.get(key) if key[1] else None
+            if handled is not None:
+                self.state.repeated_requests += 1
+        if handled is not None:
+            # a retry of a request that was handled already, answered as the first try was
+            self._reply(*handled)
+            return
+        self.reply_status = 200
+        data = handler(fields)
+        with self.state.lock:
+            if key[1]:
+                self.state.handled[key] = (data, self.reply_status)
+            if endpoint in CREATES and self.state.lost_replies_left:
+                self.state.lost_replies_left -= 1
+                self.hang_up = True
+        if self.hang_up:
+            # the connection went down before the reply
+            self.close_connection = True
+            self.connection.shutdown(2)
+            return
+        if data is None:
+            # not modified since the client's copy
+            self.send_response(304)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self._reply(data, self.reply_status)
+
+    def _reply(self, data, status=200):
+        payload = json.dumps(data).encode("utf8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in getattr(self, "response_headers", {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _text(self, fields, name, default=""):
+        value = fields.get(name)
+        return value.decode("utf8") if value is not None else default
+
+    # -- account and projects --------------------------------------------------------------
+
+    def handle_login(self, fields):
+        return {"class": "success", "token": "standin-token", "data": {},
+                "organization": {"name": "standin"}}
+
+    def handle_projects(self, fields):
+        with self.state.lock:
+            projects = sorted(self.state.projects.items())
+            etag = '"%d"' % max([updated for pid, (name, updated) in projects] or [0])
+            server_time = next(self.state.ids)
+        if self.headers.get("If-None-Match") == etag:
+            return None
+        self.response_headers = {"ETag": etag}
+        since = int(self._text(fields, "updated_since", "0") or 0)
+        return {"success": True, "incremental": bool(since), "server_time": server_time,
+                "projects": [{"project_id": pid, "project_name": name}
+                             for pid, (name, updated) in projects if updated > since]}
+
+    def handle_store_project(self, fields):
+        with self.state.lock:
+            project_id = next(self.state.ids)
+            self.state.projects[project_id] = (self._text(fields, "name"), project_id)
+        return {"success": True, "project_id": project_id}
+
+    # -- shots -----------------------------------------------------------------------------
+
+    def _shot(self, fields):
+        shot_id = self._text(fields, "shot_id")
+        with self.state.lock:
+            if not shot_id:
+                shot_id = str(next(self.state.ids))
+            shot = self.state.shots.setdefault(shot_id, {"shot_id": shot_id})
+            shot["shot_name"] = self._text(fields, "shot_name")
+            shot["project_id"] = self._text(fields, "project_id")
+        return shot
+
+    def handle_shots_register(self, fields):
+        shots = []
+        for shot in json.loads(self._text(fields, "shots", "[]")):
+            with self.state.lock:
+                shot_id = str(next(self.state.ids))
+                self.state.shots[shot_id] = {"shot_id": shot_id, "shot_name": shot["shot_name"],
+                                             "project_id": self._text(fields, "project_id")}
+            shots.append({"shot_name": shot["shot_name"], "shot_id": shot_id})
+        return {"success": True, "shots": shots}
+
+    def handle_store_preview(self, fields):
+        shot = self._shot(fields)
+        shot["preview_bytes"] = len(fields.get("preview_file") or b"")
+        return {"success": True, "shot_id": shot["shot_id"]}
+
+    def handle_store_scrub(self, fields):
+        shot = self._shot(fields)
+        shot["poster_bytes"] = len(fields.get("poster_file") or b"")
+        shot["sprite_bytes"] = len(fields.get("sprite_file") or b"")
+        shot["sprite_layout"] = json.loads(self._text(fields, "sprite_layout", "{}"))
+        return {"success": True, "shot_id": shot["shot_id"]}
+
+    def handle_preview_segment(self, fields):
+        shot = self._shot(fields)
+        with self.state.lock:
+            # a retried segment replaces the first copy
+            shot.setdefault("preview_segments", {})[self._text(fields, "index")] = len(fields.get("segment_file") or b"")
+            shot.setdefault("first_segment_time", time.time())
+        return {"success": True, "shot_id": shot["shot_id"]}
+
+    def handle_preview_complete(self, fields):
+        shot = self._shot(fields)
+        segments = shot.get("preview_segments", {})
+        if len(segments) != int(self._text(fields, "segments", "0")):
+            return {"success": False, "error": "%d segments received" % len(segments)}
+        shot["preview_bytes"] = sum(segments.values())
+        shot["preview_complete_time"] = time.time()
+        return {"success": True, "shot_id": shot["shot_id"]}
+
+    def _archive_blobs(self, fields):
+        """Names of the frames in the shot's archive, uploaded with the request or in chunks."""
+        upload = self.state.uploads.get(self._text(fields, "shot_upload_id"))
+        if upload:
+            archive = open(upload["path"], "rb")
+        elif "shot_file" in fields:
+            archive = io.BytesIO(fields["shot_file"])
+        else:
+            return set()
+        try:
+            with zipfile.ZipFile(archive) as shot_zip:
+                return set(shot_zip.namelist())
+        except zipfile.BadZipfile:
+            return set()
+        finally:
+            archive.close()
+
+    def handle_store(self, fields):
+        if self._text(fields, "shot_name") in self.state.failing_shots:
+            threading.Event().wait(self.state.failing_delay)
+            self.reply_status = 400
+            return {"success": False, "error": "shot refused by the stand-in"}
+        shot = self._shot(fields)
+        if "preview_file" in fields:
+            shot["preview_bytes"] = len(fields["preview_file"])
+        if "shot_file" in fields:
+            shot["archive_bytes"] = len(fields["shot_file"])
+        upload_id = self._text(fields, "shot_upload_id")
+        if upload_id:
+            upload = self.state.uploads.get(upload_id)
+            if not upload or not upload["complete"]:
+                return {"success": False, "error": "upload %s is not complete" % upload_id}
+            shot["archive_bytes"] = upload["offset"]
+        if "manifest" in fields:
+            manifest = json.loads(fields["manifest"].decode("utf8"))
+            shot["frames"] = len(manifest["frames"])
+            blobs = self._archive_blobs(fields)
+            with self.state.lock:
+                self.state.frames.update(frame["hash"] for frame in manifest["frames"] if frame["blob"] in blobs)
+                missing = [frame["name"] for frame in manifest["frames"] if frame["hash"] not in self.state.frames]
+                if missing:
+                    self.state.broken_manifests += 1
+            if missing:
+                self.reply_status = 400
+                return {"success": False, "error": "manifest references %d frames that were never uploaded"
+                                                   % len(missing)}
+        return {"success": True, "shot_id": shot["shot_id"]}
+
+    # -- chunked uploads -------------------------------------------------------------------
+
+    def handle_upload_begin(self, fields):
+        resume_key = self._text(fields, "resume_key")
+        with self.state.lock:
+            upload_id = self.state.resume_keys.get(resume_key)
+            if upload_id is None or self.state.uploads[upload_id]["complete"]:
+                upload_id = str(next(self.state.ids))
+                path = os.path.join(self.state.root, "upload_" + upload_id)
+                open(path, "wb").close()
+                self.state.uploads[upload_id] = {"path": path, "offset": 0, "complete": False}
+                if resume_key:
+                    self.state.resume_keys[resume_key] = upload_id
+            offset = self.state.uploads[upload_id]["offset"]
+        return {"success": True, "upload_id": upload_id, "offset": offset}
+
+    def handle_upload_status(self, fields):
+        with self.state.lock:
+            upload = self.state.uploads.get(self._text(fields, "upload_id"))
+            if not upload:
+                return {"success": False, "error": "unknown upload"}
+            return {"success": True, "offset": upload["offset"]}
+
+    def handle_upload_chunk(self, fields):
+        upload = self.state.uploads.get(self._text(fields, "upload_id"))
+        if not upload:
+            return {"success": False, "error": "unknown upload"}
+        offset = int(self._text(fields, "offset", "0"))
+        chunk = fields.get("chunk") or b""
+        with self.state.lock:
+            if offset > upload["offset"]:
+                return {"success": False, "error": "chunk past the end of the upload"}
+            # overlapping chunks after a resume are trimmed to what is new
+            self.state.overlap_bytes += min(len(chunk), upload["offset"] - offset)
+            chunk = chunk[upload["offset"] - offset:]
+            if self.state.chunk_drops_left and len(chunk) > self.state.drop_chunk_after:
+                # only the start of the chunk arrived before the connection dropped
+                chunk = chunk[:self.state.drop_chunk_after]
+                self.state.chunk_drops_left -= 1
+                self.state.chunk_drops += 1
+                self.hang_up = True
+            with open(upload["path"], "ab") as upload_file:
+                upload_file.write(chunk)
+            upload["offset"] += len(chunk)
+            return {"success": True, "offset": upload["offset"]}
+
+    def handle_upload_complete(self, fields):
+        upload = self.state.uploads.get(self._text(fields, "upload_id"))
+        if not upload:
+            return {"success": False, "error": "unknown upload"}
+        size = int(self._text(fields, "file_size", "0"))
+        if size != upload["offset"]:
+            return {"success": False, "error": "size mismatch"}
+        upload["complete"] = True
+        with open(upload["path"], "rb") as upload_file:
+            upload["sha256"] = hashlib.sha256(upload_file.read()).hexdigest()
+        return {"success": True}
+
+    # -- content addressed frames ----------------------------------------------------------
+
+    def handle_frames_missing(self, fields):
+        hashes = json.loads(self._text(fields, "hashes", "[]"))
+        with self.state.lock:
+            missing = [frame_hash for frame_hash in hashes if frame_hash not in self.state.frames]
+        return {"success": True, "missing": missing}
+
+    def handle_frames_store(self, fields):
+        with self.state.lock:
+            self.state.frames.add(self._text(fields, "hash"))
+        return {"success": True}
+
+    # -- test controls, not part of the trn.la api -----------------------------------------
+
+    def handle_standin_faults(self, fields):
+        """Cuts the next `chunk_drops` chunk uploads off after `drop_chunk_after` bytes: the server
+        keeps those bytes and hangs up without a reply, so the client has to ask upload/status.
+        Stores of the shots named in the json list `failing_shots` are refused after `failing_delay`
+        seconds. The next `lost_replies` requests that create something are handled, but the connection
+        drops before the reply."""
+        with self.state.lock:
+            self.state.drop_chunk_after = int(self._text(fields, "drop_chunk_after", "0"))
+            self.state.chunk_drops_left = int(self._text(fields, "chunk_drops", "0"))
+            self.state.failing_shots = set(json.loads(self._text(fields, "failing_shots", "[]")))
+            self.state.failing_delay = float(self._text(fields, "failing_delay", "0"))
+            self.state.lost_replies_left = int(self._text(fields, "lost_replies", "0"))
+        return {"success": True}
+
+    def handle_standin_stats(self, fields):
+        with self.state.lock:
+            return {"success": True, "requests": dict(self.state.requests), "dropped": self.state.dropped,
+                    "errors": self.state.errors, "chunk_drops": self.state.chunk_drops,
+                    "overlap_bytes": self.state.overlap_bytes, "broken_manifests": self.state.broken_manifests,
+                    "repeated_requests": self.state.repeated_requests,
+                    "projects": sorted(name for name, project_id in self.state.projects.values()),
+                    "shots": sorted(shot["shot_name"] for shot in self.state.shots.values()),
+                    "uploads": dict((upload_id, {"offset": upload["offset"], "sha256": upload.get("sha256")})
+                                    for upload_id, upload in self.state.uploads.items())}
+
+
+def start_standin(port=0, drop_rate=0.0, latency=0.0, error_rate=0.0):
+    """Starts the stand-in on a background thread. Returns (server, api_root); shut it down with
+    stop_standin(server)."""
+    root = tempfile.mkdtemp(prefix="trnla_standin_")
+    handler = type("Handler", (TrnlaStandinHandler,), {"state": TrnlaStandinState(root),
+                                                        "drop_rate": drop_rate,
+                                                        "error_rate": error_rate,
+                                                        "latency": latency})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    server.state = handler.state
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, "http://127.0.0.1:%d/api/producer" % server.server_address[1]
+
+
+def stop_standin(server):
+    server.shutdown()
+    server.server_close()
+    shutil.rmtree(server.state.root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local stand-in for the trn.la producer API.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="chance to drop an upload request midway")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="chance to answer a request with a 502 or 503")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every reply")
+    args = parser.parse_args()
+    server, api_root = start_standin(args.port, args.drop_rate, args.latency, args.error_rate)
+    print("trn.la stand-in listening, set TRNLA_API_ROOT=" + api_root)
+    sys.stdout.flush()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stop_standin(server)
@@ -0,0 +1,430 @@
+# --------------------------Trn.la Plugin For Nuke Studio--------------------------------
+# Zip archive building for shot uploads. Members are compressed up front and written with
+# their final sizes, so the archive can be written to disk or streamed straight into an
+# upload without ever seeking back.
+#
+# (c) 2021 Tarantula
+# Author: Moses Molina
+# ---------------------------------------------------------------------------------------
+
+import os
+import time
+import zlib
+import shutil
+import hashlib
+import zipfile
+import tempfile
+import threading
+import collections
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+# members bigger than this are spooled to a temp file while they are compressed
+SPOOL_LIMIT = 256 * 1024 * 1024
+BLOCK_SIZE = 1024 * 1024
+
+# compression methods, as (zip compress type, zlib level)
+STORED = "stored"
+DEFLATE = "deflate"
+FAST = "fast"
+COMPRESSION_METHODS = {
+    STORED: (zipfile.ZIP_STORED, 0),
+    DEFLATE: (zipfile.ZIP_DEFLATED, -1),
+    FAST: (zipfile.ZIP_DEFLATED, 1),
+}
+
+# Formats that are already compressed gain next to nothing from deflate.
+FORMAT_COMPRESSION = {
+    "jpeg": STORED,
+    "jpg": STORED,
+    "png": STORED,
+    "mov": STORED,
+    "mp4": STORED,
+    "mxf": STORED,
+    "dpx": DEFLATE,
+    "cin": DEFLATE,
+    "sgi": DEFLATE,
+    "targa": DEFLATE,
+    "tga": DEFLATE,
+}
+# exr is keyed on its own compression setting
+EXR_UNCOMPRESSED = ("none", "")
+TIFF_UNCOMPRESSED = ("none", "")
+
+# used to estimate the cpu time saved when nothing was sampled, in bytes per cpu second
+DEFAULT_DEFLATE_RATE = 40 * 1024 * 1024
+
+# thread_time keeps the timings honest once members are compressed on several threads
+_cpu_clock = getattr(time, "thread_time", time.time)
+
+
+def compress_member(path, arcname, compress_type=zipfile.ZIP_DEFLATED, level=-1):
+    """Compress a single file. Returns the ZipInfo (with crc and sizes filled in) and a file object
+    holding the compressed payload, positioned at 0."""
+    st = os.stat(path)
+    zinfo = zipfile.ZipInfo(arcname, time.localtime(st.st_mtime)[0:6])
+    zinfo.external_attr = (st.st_mode & 0xFFFF) << 16
+    zinfo.compress_type = compress_type
+    zinfo.file_size = 0
+    zinfo.CRC = 0
+
+    payload = tempfile.SpooledTemporaryFile(max_size=SPOOL_LIMIT)
+    compressor = None
+    if compress_type == zipfile.ZIP_DEFLATED:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    with open(path, 'rb') as src:
+        while True:
+            block = src.read(BLOCK_SIZE)
+            if not block:
+                break
+            zinfo.file_size += len(block)
+            zinfo.CRC = zlib.crc32(block, zinfo.CRC)
+            payload.write(compressor.compress(block) if compressor else block)
+    if compressor:
+        payload.write(compressor.flush())
+    zinfo.CRC &= 0xffffffff
+    zinfo.compress_size = payload.tell()
+    payload.seek(0)
+    return zinfo, payload
+
+
+class TrnlaArchiveStats(object):
+    """Per shot compression numbers."""
+    def __init__(self):
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.cpu_seconds = 0.0
+        self.stored_bytes = 0
+
+    def ratio(self):
+        if not self.bytes_in:
+            return 1.0
+        return float(self.bytes_out) / self.bytes_in
+
+
+class TrnlaCompressionPolicy(object):
+    """Picks how shot frames are compressed, from the file type of the preset or by sampling the
+    first frames of the shot, and keeps the stats of what it did."""
+    def __init__(self, method=DEFLATE, sample_frames=0):
+        self.method = method
+        self.sample_frames = sample_frames
+        self.deflate_rate = None
+        self.stats = TrnlaArchiveStats()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_preset(cls, properties):
+        method = properties.get("trnla_archive_compression", "auto")
+        if method not in COMPRESSION_METHODS:
+            method = cls.method_for_format(properties)
+        return cls(method, int(properties.get("trnla_compression_sample_frames", 0)))
+
+    @staticmethod
+    def method_for_format(properties):
+        file_type = str(properties.get("file_type", "")).lower()
+        if file_type == "exr":
+            exr_compression = str(properties.get("exr", {}).get("compression", "")).lower()
+            return DEFLATE if exr_compression in EXR_UNCOMPRESSED else STORED
+        if file_type in ("tiff", "tif"):
+            tiff_compression = str(properties.get("tiff", {}).get("compression", "")).lower()
+            return DEFLATE if tiff_compression in TIFF_UNCOMPRESSED else STORED
+        return FORMAT_COMPRESSION.get(file_type, DEFLATE)
+
+    def choose(self, members):
+        """Compress the first few frames to see whether the frames are worth compressing at all."""
+        if not self.sample_frames or not members:
+            return self.method
+        bytes_in = bytes_out = 0
+        cpu_seconds = 0.0
+        for path, arcname in members[:self.sample_frames]:
+            start = _cpu_clock()
+            zinfo, payload = compress_member(path, arcname, *COMPRESSION_METHODS[DEFLATE])
+            cpu_seconds += _cpu_clock() - start
+            payload.close()
+            bytes_in += zinfo.file_size
+            bytes_out += zinfo.compress_size
+        if cpu_seconds > 0:
+            self.deflate_rate = bytes_in / cpu_seconds
+        ratio = float(bytes_out) / bytes_in if bytes_in else 1.0
+        if ratio > 0.95:
+            self.method = STORED
+        elif ratio > 0.8:
+            self.method = FAST
+        else:
+            self.method = DEFLATE
+        return self.method
+
+    def reset(self):
+        self.stats = TrnlaArchiveStats()
+
+    def compress(self, path, arcname):
+        start = _cpu_clock()
+        zinfo, payload = compress_member(path, arcname, *COMPRESSION_METHODS[self.method])
+        elapsed = _cpu_clock() - start
+        with self._lock:
+            self.stats.bytes_in += zinfo.file_size
+            self.stats.bytes_out += zinfo.compress_size
+            self.stats.cpu_seconds += elapsed
+            if self.method == STORED:
+                self.stats.stored_bytes += zinfo.file_size
+        return zinfo, payload
+
+    def cpu_saved(self):
+        """Estimated cpu seconds a full deflate of the stored frames would have cost."""
+        return self.stats.stored_bytes / float(self.deflate_rate or DEFAULT_DEFLATE_RATE)
+
+    def report(self, shot_name):
+        return "Trnla: archived %s with %s compression, %.1f MB -> %.1f MB (ratio %.3f), %.1fs cpu, ~%.1fs cpu saved" % (
+            shot_name, self.method, self.stats.bytes_in / 1048576.0, self.stats.bytes_out / 1048576.0,
+            self.stats.ratio(), self.stats.cpu_seconds, self.cpu_saved())
+
+
+class _ArchiveSink(object):
+    """Write-only, tell-able target that queues archive bytes for a reader instead of storing them."""
+    def __init__(self):
+        self._pending = []
+        self._pos = 0
+
+    def write(self, data):
+        if data:
+            self._pending.append(data)
+            self._pos += len(data)
+
+    def write_payload(self, payload, length):
+        self._pending.append(payload)
+        self._pos += length
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        pending, self._pending = self._pending, []
+        for item in pending:
+            if isinstance(item, bytes):
+                yield item
+            else:
+                while True:
+                    block = item.read(BLOCK_SIZE)
+                    if not block:
+                        break
+                    yield block
+                item.close()
+
+
+class _FileSink(object):
+    """Adapter that gives a plain file the same write_payload interface as _ArchiveSink."""
+    def __init__(self, fileobj):
+        self._file = fileobj
+
+    def write(self, data):
+        self._file.write(data)
+
+    def write_payload(self, payload, length):
+        shutil.copyfileobj(payload, self._file, BLOCK_SIZE)
+        payload.close()
+
+    def tell(self):
+        return self._file.tell()
+
+    def flush(self):
+        self._file.flush()
+
+
+class TrnlaArchiveWriter(object):
+    """Writes pre-compressed members into a zip. zipfile keeps the bookkeeping and writes the
+    central directory, including zip64 records for big shots."""
+    def __init__(self, sink):
+        self.sink = sink
+        self._zip = zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED, allowZip64=True)
+
+    def write_member(self, zinfo, payload):
+        zinfo.header_offset = self.sink.tell()
+        self.sink.write(zinfo.FileHeader(None))
+        self.sink.write_payload(payload, zinfo.compress_size)
+        self._zip.filelist.append(zinfo)
+        self._zip.NameToInfo[zinfo.filename] = zinfo
+        self._zip.start_dir = self.sink.tell()
+
+    def close(self):
+        self._zip.close()
+
+
+def archive_workers(workers):
+    """0 or less means one worker per core."""
+    if workers <= 0:
+        return multiprocessing.cpu_count()
+    return workers
+
+
+def compressed_members(members, policy, workers=1):
+    """Yields (zinfo, payload) for every member in order. With more than one worker the frames are
+    compressed on a thread pool, zlib and file reads release the GIL so this scales across cores.
+    Only a few frames are compressed ahead of the writer to keep memory bounded, and the output is
+    byte-identical to the serial path since every member goes through the same compress call."""
+    if workers <= 1:
+        for path, arcname in members:
+            yield policy.compress(path, arcname)
+        return
+
+    pool = ThreadPool(workers)
+    pending = collections.deque()
+    try:
+        for path, arcname in members:
+            pending.append(pool.apply_async(policy.compress, (path, arcname)))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
+
+
+def frame_members(directory, ext):
+    """Frames of a shot in frame order, as (path, name in the archive)."""
+    members = []
+    for root, dirs, files in os.walk(directory + '/'):
+        for file in sorted(files):
+            if os.path.splitext(file)[1] == ext:
+                members.append((os.path.join(root, file), file))
+    return members
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as src:
+        while True:
+            block = src.read(BLOCK_SIZE)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def frame_blob_name(frame_hash, path):
+    """Name of a frame inside a content addressed archive."""
+    return frame_hash + os.path.splitext(path)[1]
+
+
+def hash_members(members, workers=1):
+    """sha256 of every member, in member order."""
+    paths = [path for path, arcname in members]
+    if workers <= 1 or len(paths) < 2:
+        return [hash_file(path) for path in paths]
+    pool = ThreadPool(workers)
+    try:
+        return pool.map(hash_file, paths)
+    finally:
+        pool.terminate()
+
+
+def write_archive(zip_path, members, policy=None, workers=1):
+    """Write members, a list of (path, arcname), into a zip file on disk."""
+    policy = policy or TrnlaCompressionPolicy()
+    policy.reset()
+    with open(zip_path, 'wb') as zip_file:
+        writer = TrnlaArchiveWriter(_FileSink(zip_file))
+        for zinfo, payload in compressed_members(members, policy, workers):
+            writer.write_member(zinfo, payload)
+        writer.close()
+
+
+class TrnlaFileSource(object):
+    """Readable, seekable source for a file on disk. TrnlaArchiveStream provides the same interface for
+    archives that are built while they upload."""
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+
+    def size(self):
+        return os.path.getsize(self.path)
+
+    def size_hint(self):
+        return self.size()
+
+    def seek(self, offset):
+        self._file.seek(offset)
+
+    def read(self, size):
+        return self._file.read(size)
+
+    def resume_key(self, shot_name):
+        stat = os.stat(self.path)
+        key = "%s|%s|%d|%d" % (shot_name, os.path.basename(self.path), stat.st_size, int(stat.st_mtime))
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def close(self):
+        self._file.close()
+
+
+class TrnlaArchiveStream(object):
+    """Upload source that produces the zip on the fly while it is read, so compression and transfer
+    overlap and no temp zip is written. The archive is deterministic for the same files, which lets
+    seek() regenerate it after an interrupted upload."""
+    def __init__(self, members, policy=None, workers=1):
+        self.members = members
+        self.policy = policy or TrnlaCompressionPolicy()
+        self.workers = workers
+        self._chunks = None
+        self._buffer = b''
+        self._pos = 0
+        self.seek(0)
+
+    def _generate(self):
+        sink = _ArchiveSink()
+        writer = TrnlaArchiveWriter(sink)
+        self.policy.reset()
+        for zinfo, payload in compressed_members(self.members, self.policy, self.workers):
+            writer.write_member(zinfo, payload)
+            for block in sink.drain():
+                yield block
+        writer.close()
+        for block in sink.drain():
+            yield block
+
+    def size(self):
+        # unknown until the last member is compressed
+        return None
+
+    def size_hint(self):
+        return sum(os.path.getsize(path) for path, arcname in self.members)
+
+    def seek(self, offset):
+        if self._chunks is None or offset < self._pos:
+            self.close()
+            self._chunks = self._generate()
+            self._buffer = b''
+            self._pos = 0
+        while self._pos < offset:
+            skipped = self.read(min(offset - self._pos, BLOCK_SIZE))
+            if not skipped:
+                break
+
+    def read(self, size):
+        blocks = [self._buffer]
+        buffered = len(self._buffer)
+        while buffered < size:
+            try:
+                block = next(self._chunks)
+            except StopIteration:
+                break
+            blocks.append(block)
+            buffered += len(block)
+        data = b''.join(blocks)
+        data, self._buffer = data[:size], data[size:]
+        self._pos += len(data)
+        return data
+
+    def resume_key(self, shot_name):
+        key = hashlib.sha1(shot_name.encode('utf-8'))
+        for path, arcname in self.members:
+            st = os.stat(path)
+            key.update(("|%s|%d|%d" % (arcname, st.st_size, int(st.st_mtime))).encode('utf-8'))
+        return key.hexdigest()
+
+    def close(self):
+        if self._chunks is not None:
+            self._chunks.close()
+            self._chunks = None
@@ -0,0 +1,115 @@
+# --------------------------Trn.la Plugin For Nuke Studio--------------------------------
+# The chunked upload protocol of trn.la, without the network. An upload is begun, sent in
+# chunks the server acknowledges with the next offset it expects, and completed. After a
+# dropped request the server is asked how far it got, so only the unacknowledged part of
+# a chunk is sent again.
+#
+# Plain python, TrnlaChunkedUpload drives it with Qt and the upload worker process with
+# blocking requests.
+#
+# (c) 2021 Tarantula
+# Author: Moses Molina
+# ---------------------------------------------------------------------------------------
+
+BEGIN = "upload/begin"
+CHUNK = "upload/chunk"
+STATUS = "upload/status"
+COMPLETE = "upload/complete"
+
+
+class TrnlaChunkRequest(object):
+    """One request of the protocol. chunk is the body of an upload/chunk, None for the others."""
+    def __init__(self, endpoint, fields, chunk=None):
+        self.endpoint = endpoint
+        self.fields = fields
+        self.chunk = chunk
+
+
+class TrnlaChunkProtocol(object):
+    """Which request comes next and what its reply means. Call next_request, send it, and hand the json
+    reply to replied, or the reason it didn't get through to interrupted."""
+    def __init__(self, api_key, project_id, shot_name, source, file_name, chunk_size, policy):
+        self.api_key = api_key
+        self.project_id = project_id
+        self.shot_name = shot_name
+        self.source = source
+        self.file_name = file_name
+        self.chunk_size = chunk_size
+        self.policy = policy
+
+        self.upload_id = None
+        self.offset = 0
+        self.retries = 0
+        self.finished = False
+        self._chunk = b''
+        self._chunk_offset = 0
+        # a request was interrupted, ask the server how far it got before sending anything
+        self._resync = False
+
+    def total_size(self):
+        # streamed sources only know their final size once they are exhausted
+        size = self.source.size()
+        if size is None:
+            return max(self.source.size_hint(), self.offset)
+        return size
+
+    def sent(self, fraction):
+        """Bytes sent with fraction of the pending chunk through, for progress while it is in flight."""
+        return int(self._chunk_offset + len(self._chunk) * fraction)
+
+    def next_request(self):
+        auth = [("api_key", self.api_key)]
+        if self.upload_id is None:
+            fields = auth + [("project_id", self.project_id),
+                             ("shot_name", self.shot_name),
+                             ("file_name", self.file_name),
+                             ("resume_key", self.source.resume_key(self.shot_name))]
+            if self.source.size() is not None:
+                fields.append(("file_size", self.source.size()))
+            return TrnlaChunkRequest(BEGIN, fields)
+        if self._resync:
+            return TrnlaChunkRequest(STATUS, auth + [("upload_id", self.upload_id)])
+        if not self._chunk:
+            self._chunk = self.source.read(self.chunk_size)
+            self._chunk_offset = self.offset
+        if not self._chunk:
+            return TrnlaChunkRequest(COMPLETE, auth + [("upload_id", self.upload_id), ("file_size", self.offset)])
+        return TrnlaChunkRequest(CHUNK, auth + [("upload_id", self.upload_id), ("offset", self._chunk_offset)],
+                                 self._chunk)
+
+    def replied(self, request, replyJson):
+        """Takes in the reply to request, a successful one."""
+        self.retries = 0
+        if request.endpoint == BEGIN:
+            self.upload_id = str(replyJson['upload_id'])
+            self.offset = int(replyJson.get('offset', 0))
+            self.source.seek(self.offset)
+            self._chunk = b''
+            self._chunk_offset = self.offset
+        elif request.endpoint in (CHUNK, STATUS):
+            self._resync = False
+            self._acknowledge(int(replyJson['offset']))
+        elif request.endpoint == COMPLETE:
+            self.finished = True
+
+    def _acknowledge(self, acked):
+        chunk_end = self._chunk_offset + len(self._chunk)
+        if self._chunk_offset <= acked <= chunk_end:
+            # Drop the acknowledged part of the pending chunk, the rest is sent again.
+            self._chunk = self._chunk[acked - self._chunk_offset:]
+            self._chunk_offset = acked
+        else:
+            self.source.seek(acked)
+            self._chunk = b''
+            self._chunk_offset = acked
+        self.offset = acked
+
+    def interrupted(self, retry_after=None):
+        """A request didn't get through. Returns the seconds to wait before the next one, None when the
+        upload is out of retries."""
+        if not self.policy.should_retry(self.retries):
+            return None
+        delay = self.policy.delay(self.retries, retry_after)
+        self.retries += 1
+        self._resync = self.upload_id is not None
+        return delay
@@ -0,0 +1,134 @@
+# --------------------------Trn.la Plugin For Nuke Studio--------------------------------
+# Resumable chunked upload of shot archives to trn.la.
+#
+# (c) 2021 Tarantula
+# Author: Moses Molina
+# ---------------------------------------------------------------------------------------
+
+import json
+
+from PySide2.QtNetwork import *
+from PySide2.QtCore import *
+
+from .TrnlaNetwork import trnla_network, transient_error
+from .TrnlaRetry import retry_policy, parse_retry_after
+from .TrnlaArchive import TrnlaFileSource
+from .TrnlaChunkProtocol import TrnlaChunkProtocol, BEGIN
+
+DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+
+
+class TrnlaChunkBody(QBuffer):
+    """A chunk body that can't be rewound. Qt quietly sends a request again from its start when the
+    connection drops under it, this turns the drop into an error so the upload asks the server how far
+    it got instead."""
+    def __init__(self, data, parent=None):
+        QBuffer.__init__(self, parent)
+        self.setData(QByteArray(data))
+        self.open(QIODevice.ReadOnly)
+
+    def reset(self):
+        return self.pos() == 0
+
+
+class TrnlaChunkedUpload(QObject):
+    """Uploads a source in fixed-size parts. Every part is acknowledged by the server with the next
+    offset it expects, so a dropped connection only costs the part that was in flight. The protocol
+    itself is TrnlaChunkProtocol, this sends its requests with Qt."""
+    uploadProgress = Signal('qint64', 'qint64')
+    # upload id and the offset the server has stored up to
+    acknowledged = Signal(str, 'qint64')
+    finished = Signal(str)
+    failed = Signal(str)
+
+    def __init__(self, api_key, project_id, shot_name, source, file_name, chunk_size=DEFAULT_CHUNK_SIZE,
+                 policy=None, scheduler=None):
+        QObject.__init__(self)
+        self.shot_name = shot_name
+        self.source = source
+        self.file_name = file_name
+        self.protocol = TrnlaChunkProtocol(api_key, project_id, shot_name, source, file_name, chunk_size,
+                                           policy or retry_policy())
+        # paces the chunks when the scheduler has a bandwidth cap
+        self.scheduler = scheduler
+        self.aborted = False
+        self._reply = None
+
+    def start(self):
+        self._next()
+
+    def abort(self):
+        self.aborted = True
+        self.source.close()
+        if self._reply:
+            self._reply.abort()
+
+    def _next(self):
+        if self.aborted:
+            return
+        request = self.protocol.next_request()
+        delay = 0
+        if request.chunk is not None and self.scheduler:
+            delay = self.scheduler.reserve(len(request.chunk))
+        if delay > 0:
+            QTimer.singleShot(delay, lambda: self._post(request))
+        else:
+            self._post(request)
+
+    def _post(self, request):
+        if self.aborted:
+            return
+        files = [("chunk", self.file_name, TrnlaChunkBody(request.chunk))] if request.chunk is not None else []
+        self._reply = trnla_network().post_form(request.endpoint, request.fields, files)
+        reply = self._reply
+        for name, file_name, body in files:
+            body.setParent(reply)
+        reply.finished.connect(lambda: self._on_reply(reply, request))
+        if request.chunk is not None:
+            reply.uploadProgress.connect(self._on_chunk_progress)
+
+    def _on_reply(self, reply, request):
+        reply.deleteLater()
+        if self.aborted:
+            return
+        if reply.error() != QNetworkReply.NoError:
+            if not transient_error(reply):
+                self._fail(reply.errorString())
+                return
+            self._retry(reply.errorString(),
+                        parse_retry_after(reply.rawHeader(b"Retry-After").data().decode('ascii', 'ignore')))
+            return
+        try:
+            replyJson = json.loads(reply.readAll().data().decode('utf8'))
+        except ValueError:
+            self._retry("invalid reply from server")
+            return
+        if not replyJson.get('success'):
+            self._fail(str(replyJson.get('error', 'upload rejected by server')))
+            return
+        self.protocol.replied(request, replyJson)
+        if self.protocol.finished:
+            self.source.close()
+            self.finished.emit(self.protocol.upload_id)
+            return
+        self.acknowledged.emit(self.protocol.upload_id, self.protocol.offset)
+        if request.endpoint != BEGIN:
+            self.uploadProgress.emit(self.protocol.offset, self.protocol.total_size())
+        self._next()
+
+    def _retry(self, reason, retry_after=None):
+        delay = self.protocol.interrupted(retry_after)
+        if delay is None:
+            self._fail(reason)
+            return
+        print("Trnla: chunk upload interrupted (" + self.shot_name + "): " + reason)
+        QTimer.singleShot(int(delay * 1000), self._next)
+
+    def _fail(self, reason):
+        # a streamed archive stops its compression workers, a zip is no longer held open
+        self.source.close()
+        self.failed.emit(reason)
+
+    def _on_chunk_progress(self, bytes_sent, bytes_total):
+        if bytes_total > 0:
+            self.uploadProgress.emit(self.protocol.sent(float(bytes_sent) / bytes_total), self.protocol.total_size())
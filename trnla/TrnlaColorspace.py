@@ -0,0 +1,99 @@
+# --------------------------Trn.la Plugin For Nuke Studio--------------------------------
+# Colourspace names as Nuke's Write node shows them, read from the OCIO config of the
+# project and cached until the config or the project colour settings change. Nothing is
+# added to the node graph.
+#
+# (c) 2021 Tarantula
+# Author: Moses Molina
+# ---------------------------------------------------------------------------------------
+
+import os
+import nuke
+
+from hiero.exporters.FnExternalRender import getColorspaceFromProperty
+
+try:
+    import PyOpenColorIO as OCIO
+except ImportError:
+    # ships with Nuke Studio, without it the names are sent as the preset has them
+    OCIO = None
+
+# root knobs and project settings that change which colourspaces exist
+ROOT_CONFIG_KNOBS = ('colorManagement', 'OCIO_config', 'customOCIOConfigPath')
+PROJECT_CONFIG_SETTINGS = ('lutUseOCIOForExport', 'ocioConfigName', 'ocioConfigPath')
+
+
+def ocio_config_path(projectsettings=None):
+    """The config file of the project's OCIO config: a custom one, one of the configs Nuke ships, or the
+    one $OCIO points at."""
+    if projectsettings:
+        if projectsettings.get('ocioConfigPath'):
+            return projectsettings['ocioConfigPath']
+        name = projectsettings.get('ocioConfigName')
+        exe_path = getattr(nuke, 'EXE_PATH', None)
+        if name and name != 'custom' and exe_path:
+            path = os.path.join(os.path.dirname(exe_path), 'plugins', 'OCIOConfigs', 'configs', name, 'config.ocio')
+            if os.path.exists(path):
+                return path
+    return os.environ.get('OCIO') or None
+
+
+def write_menu_names(config):
+    """The names the Write node's colorspace menu resolves to. Nuke lists a colourspace with a family as
+    "family/name<tab>name", the names after the tab are the ones the menu is matched against."""
+    return [cs.getName() for cs in config.getColorSpaces() if cs.getFamily()]
+
+
+class TrnlaColorspaceTable(object):
+    def __init__(self):
+        self._key = None
+        self._names = []
+        self._resolved = {}
+
+    def config_key(self, projectsettings=None):
+        values = [os.environ.get('OCIO', '')]
+        root = nuke.root()
+        for name in ROOT_CONFIG_KNOBS:
+            knob = root.knob(name) if root else None
+            values.append(knob.value() if knob else None)
+        for name in PROJECT_CONFIG_SETTINGS:
+            values.append(projectsettings.get(name) if projectsettings else None)
+        return tuple(str(value) for value in values)
+
+    def _colorspace_names(self, projectsettings):
+        path = ocio_config_path(projectsettings)
+        if OCIO is None or not path:
+            return []
+        try:
+            return write_menu_names(OCIO.Config.CreateFromFile(path))
+        except Exception as err:
+            print("Trnla: could not read the OCIO config %s: %s" % (path, err))
+            return []
+
+    def resolve(self, colourTransform, projectsettings=None):
+        """Full name of the colourspace the Write node would use for colourTransform."""
+        key = self.config_key(projectsettings)
+        if key != self._key:
+            self._names = self._colorspace_names(projectsettings)
+            self._resolved = {}
+            self._key = key
+        if colourTransform not in self._resolved:
+            resolved = colourTransform
+            # the first menu entry whose name starts with the transform, as a match on tab + transform
+            # against the Write node's menu finds it
+            for name in self._names:
+                if name.startswith(colourTransform):
+                    resolved = getColorspaceFromProperty(name)
+                    break
+            self._resolved[colourTransform] = resolved
+        return self._resolved[colourTransform]
+
+
+_colorspace_table = None
+
+
+def colorspace_table():
+    global _colorspace_table
+    if _colorspace_table is None:
+        _colorspace_table = TrnlaColorspaceTable()
+    return _colorspace_table
@@ -0,0 +1,96 @@
+# --------------------------Trn.la Plugin For Nuke Studio--------------------------------
+# The trn.la account config (api key, organization directory) written on login. It is
+# parsed once and only read again when the file changes on disk, so path resolution and
+# dialogs don't open it on every call.
+#
+# (c) 2021 Tarantula
+# Author: Moses Molina
+# ---------------------------------------------------------------------------------------
+
+import os
+import json
+import threading
+
+TARANTULA_DATA = os.path.expanduser("~") + '/AppData/Local/Tarantula/'
+CONFIG_PATH = TARANTULA_DATA + 'config.json'
+
+
+def replace_file(src, dst):
+    """Moves src over dst in one step, for files written next to their target so no reader sees half of
+    one."""
+    try:
+        os.replace(src, dst)
+    except AttributeError:
+        # python 2, where rename only fails on windows if dst exists
+        if os.path.exists(dst) and os.name == "nt":
+            os.remove(dst)
+        os.rename(src, dst)
+
+
+class TrnlaConfig(object):
+    def __init__(self, path=CONFIG_PATH):
+        self.path = path
+        self._settings = None
+        self._stamp = None
+        self._lock = threading.Lock()
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime, st.st_size
+
+    def settings(self):
+        """The settings of the logged in account, or None when nobody is logged in on this machine."""
+        stamp = self._file_stamp()
+        with self._lock:
+            if stamp != self._stamp:
+                self._settings = None
+                if stamp is not None:
+                    try:
+                        with open(self.path) as jsonFile:
+                            self._settings = json.load(jsonFile)['settings']
+                    except (IOError, OSError, ValueError, KeyError) as err:
+                        print("Trnla: could not read " + self.path + ": " + str(err))
+                self._stamp = stamp
+            return self._settings
+
+    def get(self, name, default=None):
+        settings = self.settings()
+        if not settings:
+            return default
+        return settings.get(name, default)
+
+    def api_key(self):
+        return self.get("api_key")
+
+    def org_dir(self):
+        return str(self.get("organization_directory", ""))
+
+    def save(self, settings):
+        config_dir = os.path.dirname(self.path)
+        if not os.path.exists(config_dir):
+            os.makedirs(config_dir)
+        with self._lock:
+            with open(self.path, 'w') as outfile:
+                json.dump({'settings': settings}, outfile, indent=4, sort_keys=True)
+            self._settings = settings
+            self._stamp = self._file_stamp()
+
+    def clear(self):
+        with self._lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self._settings = None
+            self._stamp = None
+
+
+_config = None
+
+
+def trnla_config():
+    global _config
+    if _config is None:
+        _config = TrnlaConfig()
+    return _config
@@ -0,0 +1,92 @@
+# --------------------------Trn.la Plugin For Nuke Studio--------------------------------
+# Index of the trnla tasks of one export. The export template is walked once, and the full
+# quality and preview transcoders of every shot are paired by item guid, so setting up an
+# export grows linearly with the number of shots.
+#
+# (c) 2021 Tarantula
+# Author: Moses Molina
+# ---------------------------------------------------------------------------------------
+
+from .TrnlaTranscodeExporter import TrnlaTranscodeExporter
+from .TrnlaPreviewTranscoder import TrnlaPreviewTranscoder, TrnlaPreviewTranscoderPreset
+
+# processor properties every trnla task of the export gets
+PROJECT_PROPERTIES = ("trnla_project_id", "trnla_new_project", "trnla_exist_project", "trnla_project_name",
+                      "trnla_api_key")
+
+_OTHER = 0
+_PREVIEW = 1
+_PREVIEW_DIR = 2
+
+
+class TrnlaExportPlan(object):
+    def __init__(self, exportTemplate):
+        self.template = exportTemplate
+        self.presets = []
+        self.full_presets = []
+        self._index()
+
+    def _index(self):
+        self.presets = [preset for (exportPath, preset) in self.template.flatten()
+                        if "trnla_upload" in preset.properties()]
+        self.full_presets = [preset for preset in self.presets if "trnla_project_id" in preset.properties()]
+
+    def apply(self, properties):
+        """Copies the processor's trnla properties onto the task presets."""
+        for preset in self.presets:
+            preset.properties()["trnla_upload"] = properties["trnla_upload"]
+        for preset in self.full_presets:
+            for name in PROJECT_PROPERTIES:
+                preset.properties()[name] = properties[name]
+
+    def prune_previews(self):
+        """Removes the preview transcodes from the template, together with the folder each one is in,
+        for exports that don't upload. Returns how many elements were removed."""
+        root = self.template.rootElement()
+        if root is None:
+            return 0
+        # breadth first, so every child comes after its parent and is settled before it
+        nodes = [(root, -1)]
+        i = 0
+        while i < len(nodes):
+            for child in nodes[i][0].children():
+                nodes.append((child, i))
+            i += 1
+
+        child_results = [[] for node in nodes]
+        removed = 0
+        for i in range(len(nodes) - 1, -1, -1):
+            ele, parent = nodes[i]
+            has_preview = False
+            for child, result in child_results[i]:
+                if result == _PREVIEW:
+                    has_preview = True
+                if result != _OTHER:
+                    ele.removeChild(child)
+                    removed += 1
+            child_results[i] = None
+            if type(ele.preset()) == TrnlaPreviewTranscoderPreset:
+                result = _PREVIEW
+            elif has_preview:
+                result = _PREVIEW_DIR
+            else:
+                result = _OTHER
+            if parent >= 0:
+                child_results[parent].append((ele, result))
+        self._index()
+        return removed
+
+    def pair_transcoders(self, exporters):
+        """Returns the full quality transcoders and (full, preview) pairs of the same shot."""
+        full_transcoders = []
+        previews = {}
+        for exporter in exporters:
+            if type(exporter) is TrnlaTranscodeExporter:
+                full_transcoders.append(exporter)
+            elif type(exporter) is TrnlaPreviewTranscoder:
+                previews.setdefault(exporter._item.guid(), []).append(exporter)
+        pairs = []
+        for full in full_transcoders:
+            for prev in previews.get(full._item.guid(), ()):
+                pairs.append((full, prev))
+        return full_transcoders, pairs
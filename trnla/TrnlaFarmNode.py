@@ -0,0 +1,212 @@
+# --------------------------Trn.la Plugin For Nuke Studio--------------------------------
+# Runs on the render nodes of a farm export. Takes tickets from the farm spool, renders
+# their frame range with Nuke and uploads the frames straight to trn.la, so a big export
+# renders and uploads across the farm instead of on the artist's workstation.
+#
+#   python TrnlaFarmNode.py --spool //server/trnla_spool --render "Nuke13.2 -x -F {first}-{last} {script}"
+#
+# Start one per render slot, with whatever runs the farm's jobs. Frames are uploaded the
+# content addressed way (see TrnlaFrameDedup), Nuke Studio stores the shot once every
+# range is done. The tickets don't carry the api key, a node uploads with the trn.la
+# config of the account it runs as (--config, or TRNLA_CONFIG).
+#
+# (c) 2021 Tarantula
+# Author: Moses Molina
+# ---------------------------------------------------------------------------------------
+
+import os
+import sys
+import time
+import json
+import shlex
+import socket
+import argparse
+import subprocess
+
+# run as a script, so the plugin's plain python modules are imported from next to it
+from TrnlaConfig import TrnlaConfig, CONFIG_PATH
+from TrnlaArchive import frame_blob_name, hash_file
+from TrnlaRetry import TrnlaRetryPolicy, DEFAULT_MAX_RETRIES
+from TrnlaWorkerProcess import TrnlaWorkerError, post_retrying
+from TrnlaFarmSpool import (QUEUE, RUNNING, STATUS, CANCELLED, RENDERING, UPLOADING, DONE, FAILED, make_spool,
+                            spool_path, write_json, read_json, frame_path)
+
+DEFAULT_RENDER = "nuke -x -F {first}-{last} {script}"
+# seconds between looks at the queue and between status reports while rendering
+POLL_INTERVAL = 2.0
+
+
+class TrnlaFarmError(Exception):
+    pass
+
+
+class TrnlaFarmCancelled(Exception):
+    pass
+
+
+class TrnlaFarmNode(object):
+    def __init__(self, spool, render=DEFAULT_RENDER, name=None, config=CONFIG_PATH):
+        self.spool = make_spool(spool)
+        self.render_command = render
+        self.name = name or "%s-%d" % (socket.gethostname(), os.getpid())
+        self.config = TrnlaConfig(config)
+
+    def claim(self):
+        """The next queued ticket, moved to running/ so no other node takes it. None when the queue is
+        empty."""
+        queue_dir = os.path.join(self.spool, QUEUE)
+        for file_name in sorted(os.listdir(queue_dir)):
+            if not file_name.endswith(".json"):
+                continue
+            running_path = os.path.join(self.spool, RUNNING, file_name)
+            try:
+                # atomic on one file system, only one node wins
+                os.rename(os.path.join(queue_dir, file_name), running_path)
+            except OSError:
+                continue
+            # claimed now, however long the ticket waited in the queue
+            os.utime(running_path, None)
+            ticket = read_json(running_path)
+            if ticket is None:
+                os.remove(running_path)
+                continue
+            return ticket
+        return None
+
+    def run(self, exit_when_idle=False):
+        while True:
+            ticket = self.claim()
+            if ticket is None:
+                if exit_when_idle:
+                    return
+                time.sleep(POLL_INTERVAL)
+                continue
+            self.process(ticket)
+
+    def process(self, ticket):
+        status = {"ticket": ticket["ticket"], "node": self.name, "state": RENDERING, "frames_rendered": 0,
+                  "frames_uploaded": 0, "hashes": {}, "error": None}
+        try:
+            self.check_cancelled(ticket)
+            self.check_output(ticket)
+            self.report(status)
+            self.render(ticket, status)
+            if ticket.get("upload"):
+                status["state"] = UPLOADING
+                self.report(status)
+                self.upload(ticket, status)
+            status["state"] = DONE
+        except TrnlaFarmCancelled:
+            status["state"] = FAILED
+            status["error"] = "cancelled"
+        except (TrnlaFarmError, TrnlaWorkerError) as err:
+            status["state"] = FAILED
+            status["error"] = str(err)
+        except Exception as err:
+            status["state"] = FAILED
+            status["error"] = "render node error: %r" % err
+        if status["error"]:
+            sys.stderr.write("Trnla: %s failed on %s: %s\n" % (ticket["ticket"], self.name, status["error"]))
+        self.report(status)
+        try:
+            os.remove(spool_path(self.spool, RUNNING, ticket["ticket"]))
+        except OSError:
+            pass
+
+    def report(self, status):
+        write_json(spool_path(self.spool, STATUS, status["ticket"]), status)
+
+    def check_cancelled(self, ticket):
+        if os.path.exists(spool_path(self.spool, CANCELLED, ticket["ticket"], "")):
+            raise TrnlaFarmCancelled()
+
+    def check_output(self, ticket):
+        """Nuke Studio leaves a file in the export directory. A node that can't see it would render
+        somewhere Nuke Studio never looks."""
+        check = ticket.get("output_check")
+        if check and not os.path.exists(check):
+            raise TrnlaFarmError("the export directory %s can't be reached from %s, farm exports have to go "
+                                 "to storage the render nodes share" % (os.path.dirname(check), self.name))
+
+    def frames(self, ticket):
+        if not ticket.get("output") or ticket.get("first") is None:
+            return []
+        paths = [frame_path(ticket["output"], frame) for frame in range(ticket["first"], ticket["last"] + 1)]
+        return [path for path in paths if path is not None]
+
+    def command(self, ticket):
+        """The render command for the ticket. A ticket without a frame range renders the range of its
+        script."""
+        args = shlex.split(self.render_command, posix=os.name != "nt")
+        if ticket.get("first") is None:
+            args = [arg for i, arg in enumerate(args) if "{first}" not in arg and "{last}" not in arg
+                    and not (arg == "-F" and i + 1 < len(args) and "{first}" in args[i + 1])]
+        return [arg.format(first=ticket.get("first"), last=ticket.get("last"), script=ticket["script"],
+                           output=ticket.get("output") or "") for arg in args]
+
+    def render(self, ticket, status):
+        frames = self.frames(ticket)
+        try:
+            process = subprocess.Popen(self.command(ticket))
+        except OSError as err:
+            raise TrnlaFarmError("could not start the render: %s" % err)
+        while process.poll() is None:
+            time.sleep(POLL_INTERVAL)
+            try:
+                self.check_cancelled(ticket)
+            except TrnlaFarmCancelled:
+                process.kill()
+                process.wait()
+                raise
+            status["frames_rendered"] = len([path for path in frames if os.path.exists(path)])
+            self.report(status)
+        if process.returncode != 0:
+            raise TrnlaFarmError("the render exited with code %d" % process.returncode)
+        missing = [path for path in frames if not os.path.exists(path)]
+        if missing:
+            raise TrnlaFarmError("the render didn't write " + os.path.basename(missing[0]))
+        status["frames_rendered"] = len(frames)
+
+    def upload(self, ticket, status):
+        """Uploads the frames of the range trn.la doesn't have yet, and reports the hash of every frame
+        for the shot's manifest."""
+        upload = ticket["upload"]
+        policy = TrnlaRetryPolicy(int(upload.get("max_retries", DEFAULT_MAX_RETRIES)))
+        api_key = self.config.api_key()
+        if not api_key:
+            raise TrnlaFarmError("no trn.la api key on %s, log in to trn.la as the account the node runs as or "
+                                 "point --config at its config" % self.name)
+        auth = [("api_key", api_key), ("project_id", upload["project_id"])]
+        frames = self.frames(ticket)
+        hashes = [hash_file(path) for path in frames]
+        replyJson = post_retrying("frames/missing", auth + [("hashes", json.dumps(sorted(set(hashes))))],
+                                  policy=policy, name="frame lookup of " + ticket["ticket"])
+        missing = set(replyJson.get("missing", []))
+        for path, frame_hash in zip(frames, hashes):
+            self.check_cancelled(ticket)
+            if frame_hash in missing:
+                with open(path, "rb") as frame_file:
+                    data = frame_file.read()
+                post_retrying("frames/store", auth + [("hash", frame_hash)],
+                              [("frame", frame_blob_name(frame_hash, path), data)],
+                              policy=policy, name="upload of " + os.path.basename(path))
+                # a frame the range has more than once is only sent the first time
+                missing.discard(frame_hash)
+            status["hashes"][os.path.basename(path)] = frame_hash
+            status["frames_uploaded"] += 1
+            self.report(status)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Renders and uploads trn.la farm tickets.")
+    parser.add_argument("--spool", default=os.environ.get("TRNLA_FARM_SPOOL"), help="the farm spool directory")
+    parser.add_argument("--render", default=os.environ.get("TRNLA_FARM_RENDER", DEFAULT_RENDER),
+                        help="render command, {first} {last} {script} and {output} are filled in")
+    parser.add_argument("--name", help="node name in the status reports")
+    parser.add_argument("--config", default=os.environ.get("TRNLA_CONFIG", CONFIG_PATH),
+                        help="the trn.la config with the api key to upload with")
+    parser.add_argument("--exit-when-idle", action="store_true", help="stop once the queue is empty")
+    args = parser.parse_args()
+    if not args.spool:
+        parser.error("set --spool or TRNLA_FARM_SPOOL")
+    TrnlaFarmNode(args.spool, args.render, args.name, args.config).run(args.exit_when_idle)
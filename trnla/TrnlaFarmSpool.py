@@ -0,0 +1,86 @@
+# --------------------------Trn.la Plugin For Nuke Studio--------------------------------
+# The spool directory Nuke Studio and the render nodes share for farm renders. Nuke Studio
+# writes a json ticket per frame range into queue/, a node claims it by moving it to
+# running/, and reports how the render and its upload are going in status/.
+#
+# Plain python, the render nodes use it without Qt.
+#
+# (c) 2021 Tarantula
+# Author: Moses Molina
+# ---------------------------------------------------------------------------------------
+
+import os
+import re
+import json
+import uuid
+
+try:
+    from .TrnlaConfig import replace_file
+except (ImportError, ValueError):
+    # imported by the render node script, from next to it
+    from TrnlaConfig import replace_file
+
+QUEUE = "queue"
+RUNNING = "running"
+STATUS = "status"
+SCRIPTS = "scripts"
+CANCELLED = "cancelled"
+SPOOL_DIRS = (QUEUE, RUNNING, STATUS, SCRIPTS, CANCELLED)
+
+# ticket states, as reported by the node that runs it
+RENDERING = "rendering"
+UPLOADING = "uploading"
+DONE = "done"
+FAILED = "failed"
+
+FRAME_PADDING = re.compile(r"(#+)|%(0?\d*)d")
+
+
+def spool_path(spool, kind, ticket_id, ext=".json"):
+    return os.path.join(spool, kind, ticket_id + ext)
+
+
+def make_spool(spool):
+    for kind in SPOOL_DIRS:
+        path = os.path.join(spool, kind)
+        if not os.path.isdir(path):
+            try:
+                os.makedirs(path)
+            except OSError:
+                # another node got there first
+                if not os.path.isdir(path):
+                    raise
+    return spool
+
+
+def write_json(path, data):
+    """Written next to path and moved into place, so a reader never sees half a file."""
+    temp_path = "%s.%s.tmp" % (path, uuid.uuid4().hex[:8])
+    with open(temp_path, "w") as json_file:
+        json.dump(data, json_file)
+    replace_file(temp_path, path)
+
+
+def read_json(path):
+    """The json at path, None if it is missing or not written yet."""
+    try:
+        with open(path) as json_file:
+            return json.load(json_file)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def frame_path(pattern, frame):
+    """The file of frame in an output path with #### or %04d padding, None for a movie."""
+    match = FRAME_PADDING.search(pattern)
+    if match is None:
+        return None
+    width = len(match.group(1)) if match.group(1) else int(match.group(2) or 0)
+    return pattern[:match.start()] + str(frame).zfill(width) + pattern[match.end():]
+
+
+def frame_ranges(first, last, frames_per_ticket):
+    """first to last in ranges of frames_per_ticket, the whole range when it is 0."""
+    if frames_per_ticket <= 0:
+        return [(first, last)]
+    return [(start, min(start + frames_per_ticket - 1, last)) for start in range(first, last + 1, frames_per_ticket)]
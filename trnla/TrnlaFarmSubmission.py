@@ -0,0 +1,256 @@
+# --------------------------Trn.la Plugin For Nuke Studio--------------------------------
+# Render farm submission. Instead of rendering on the workstation, every render task of
+# the export is split into frame ranges and queued in the farm spool (see TrnlaFarmSpool)
+# for the render nodes running TrnlaFarmNode. Nodes upload the frames of Trnla shots
+# themselves, Nuke Studio only follows their progress and stores the shots.
+#
+# (c) 2021 Tarantula
+# Author: Moses Molina
+# ---------------------------------------------------------------------------------------
+
+import os
+import re
+import time
+import uuid
+import shutil
+
+from hiero.exporters.FnSubmission import Submission
+
+from PySide2.QtCore import *
+
+from .TrnlaConfig import trnla_config, replace_file
+from .TrnlaFarmSpool import (QUEUE, RUNNING, STATUS, SCRIPTS, CANCELLED, DONE, FAILED, make_spool, spool_path,
+                             write_json, read_json, frame_path, frame_ranges)
+
+# seconds between looks at the status of the tickets
+POLL_INTERVAL = 1.0
+# a ticket whose node hasn't reported for this long is given to another node
+STALE_TICKET_SECONDS = 300
+
+
+def farm_spool():
+    """The spool directory shared with the render nodes: TRNLA_FARM_SPOOL, or farm_spool in the
+    trn.la config."""
+    return os.environ.get("TRNLA_FARM_SPOOL") or trnla_config().get("farm_spool")
+
+
+def announce_to_farm(task):
+    """Trnla tasks call this right before their render is submitted, so the farm knows their frame
+    range, output and upload."""
+    submission = getattr(task, "_submission", None)
+    if isinstance(submission, TrnlaFarmSubmission):
+        submission.announce(task)
+        return True
+    return False
+
+
+class TrnlaFarmRender(QObject):
+    """The render of one task on the farm, in the place of a local render. done is emitted when every
+    ticket has finished, check error() for how it went."""
+    done = Signal()
+
+    def __init__(self, spool, script_path, task=None):
+        QObject.__init__(self)
+        self.spool = spool
+        self.script_path = script_path
+        self.task = task
+        self.tickets = []
+        self.statuses = {}
+        self.submitted = False
+        self.finished = False
+        self.output_check = None
+        self._error = None
+        self._last_poll = 0.0
+        if task is not None:
+            task.farm_render = self
+
+    def startTask(self):
+        if self.submitted:
+            return
+        if self.spool is None:
+            self.fail("set farm_spool in the trn.la config or TRNLA_FARM_SPOOL to render on the farm")
+        elif hasattr(self.task, "submit_to_farm"):
+            # Trnla shots wait for their project, so the nodes can upload the frames
+            self.task.submit_to_farm(self.submit)
+        else:
+            self.submit(None)
+
+    def submit(self, upload):
+        """Queues the tickets. upload has what the nodes need to upload the frames, None to only render."""
+        if self.submitted or self.finished:
+            return
+        self.submitted = True
+        make_spool(self.spool)
+        name = re.sub(r'[^\w.-]', '_', self.task.shotName() if self.task is not None else "render")
+        job_id = "%s_%s" % (name, uuid.uuid4().hex[:8])
+        script = spool_path(self.spool, SCRIPTS, job_id, ".nk")
+        # the script is usually written to a temp folder the nodes can't see
+        shutil.copyfile(self.script_path, script)
+
+        output = None
+        output_check = None
+        ranges = [(None, None)]
+        if self.task is not None:
+            output = self.task.resolvedExportPath()
+            # the nodes write straight to the export directory, they check they can see this file first
+            output_check = self.write_output_check(output, job_id)
+            if output_check is None:
+                return
+            first, last = self.task.outputRange()
+            frames_per_ticket = int(self.task._preset.properties().get("trnla_farm_frames_per_ticket", 0))
+            if frame_path(output, first) is None:
+                # a movie is rendered in one piece
+                frames_per_ticket = 0
+                upload = None
+            elif getattr(self.task, "preview_task", None) is not None:
+                # so is a sequence that writes its preview movie in the same render
+                frames_per_ticket = 0
+            ranges = frame_ranges(first, last, frames_per_ticket)
+        for index, (first, last) in enumerate(ranges):
+            ticket = {"ticket": "%s_%03d" % (job_id, index), "script": script, "first": first, "last": last,
+                      "output": output, "output_check": output_check, "upload": upload, "submitted": time.time()}
+            self.tickets.append(ticket)
+            write_json(spool_path(self.spool, QUEUE, ticket["ticket"]), ticket)
+        print("Trnla: queued %d farm ticket(s) for %s." % (len(ranges), name))
+
+    def write_output_check(self, output, job_id):
+        directory = os.path.dirname(output)
+        path = os.path.join(directory, ".trnla_farm_%s" % job_id)
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            open(path, "w").close()
+        except (IOError, OSError) as err:
+            self.fail("could not write to the export directory %s: %s" % (directory, err))
+            return None
+        self.output_check = path
+        return path
+
+    def frame_count(self, ticket):
+        if ticket["first"] is None:
+            return 1
+        return ticket["last"] - ticket["first"] + 1
+
+    def taskStep(self):
+        if self.finished:
+            return False
+        if self.submitted and time.time() - self._last_poll >= POLL_INTERVAL:
+            self._last_poll = time.time()
+            self.poll()
+        return not self.finished
+
+    def poll(self):
+        for ticket in self.tickets:
+            ticket_id = ticket["ticket"]
+            status = read_json(spool_path(self.spool, STATUS, ticket_id))
+            if status is not None:
+                self.statuses[ticket_id] = status
+                if status["state"] == FAILED:
+                    self.fail("farm render of %s failed on %s: %s" % (ticket_id, status["node"], status["error"]))
+                    return
+            if status is None or status["state"] != DONE:
+                self.requeue_stale(ticket_id, status is not None)
+        if len(self.statuses) == len(self.tickets) and all(status["state"] == DONE
+                                                            for status in self.statuses.values()):
+            self.finish()
+
+    def requeue_stale(self, ticket_id, reported):
+        # a node that went down leaves its ticket in running/
+        running = spool_path(self.spool, RUNNING, ticket_id)
+        last_report = spool_path(self.spool, STATUS, ticket_id) if reported else running
+        try:
+            if time.time() - os.path.getmtime(last_report) < STALE_TICKET_SECONDS:
+                return
+            replace_file(running, spool_path(self.spool, QUEUE, ticket_id))
+        except OSError:
+            return
+        print("Trnla: %s stopped reporting, it goes back in the queue." % ticket_id)
+
+    def progress(self):
+        if self.finished:
+            return 1.0
+        total = 0
+        done = 0
+        for ticket in self.tickets:
+            frames = self.frame_count(ticket)
+            steps = 2 if ticket["upload"] else 1
+            status = self.statuses.get(ticket["ticket"]) or {}
+            total += frames * steps
+            done += min(status.get("frames_rendered", 0), frames)
+            if ticket["upload"]:
+                done += min(status.get("frames_uploaded", 0), frames)
+        return float(done) / total if total else 0.0
+
+    def frame_hashes(self):
+        """{frame file name: sha256} of the frames the nodes uploaded."""
+        hashes = {}
+        for status in self.statuses.values():
+            hashes.update(status.get("hashes") or {})
+        return hashes
+
+    def uploaded(self):
+        return self.finished and self._error is None and all(ticket["upload"] for ticket in self.tickets)
+
+    def fail(self, reason):
+        self._error = reason
+        self.cancel()
+        self.finish()
+
+    def finish(self):
+        self.finished = True
+        self.done.emit()
+
+    def cancel(self):
+        for ticket in self.tickets:
+            ticket_id = ticket["ticket"]
+            if self.statuses.get(ticket_id, {}).get("state") in (DONE, FAILED):
+                continue
+            try:
+                os.remove(spool_path(self.spool, QUEUE, ticket_id))
+            except OSError:
+                # already taken, the node stops when it sees the cancel
+                open(spool_path(self.spool, CANCELLED, ticket_id, ""), "w").close()
+
+    def forcedAbort(self):
+        if not self.finished:
+            self.fail("cancelled")
+
+    def error(self):
+        return self._error
+
+    def finishTask(self):
+        self.clean_up()
+
+    def clean_up(self):
+        """Removes the tickets, the reports and the script once the nodes are done with them."""
+        if not self.finished:
+            return
+        paths = [spool_path(self.spool, kind, ticket["ticket"], ext) for ticket in self.tickets
+                 for kind, ext in ((QUEUE, ".json"), (STATUS, ".json"), (CANCELLED, ""))]
+        if self.tickets:
+            paths.append(self.tickets[0]["script"])
+        if self.output_check:
+            paths.append(self.output_check)
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class TrnlaFarmSubmission(Submission):
+    """Submission for the export dialog's render list. Every job becomes a TrnlaFarmRender."""
+    def __init__(self):
+        Submission.__init__(self)
+        self._announced = None
+
+    def initialise(self):
+        if not farm_spool():
+            print("Trnla: no farm spool set, add farm_spool to the trn.la config or set TRNLA_FARM_SPOOL.")
+
+    def announce(self, task):
+        self._announced = task
+
+    def addJob(self, jobType, initDict, filePath, **kwargs):
+        task, self._announced = self._announced, None
+        return TrnlaFarmRender(farm_spool(), filePath, task)
@@ -0,0 +1,156 @@
+# --------------------------Trn.la Plugin For Nuke Studio--------------------------------
+# Content addressed frames. Rendered frames are identified by their sha256 so a shot only
+# uploads the frames trn.la doesn't already have, plus a manifest to rebuild the shot.
+#
+# (c) 2021 Tarantula
+# Author: Moses Molina
+# ---------------------------------------------------------------------------------------
+
+import os
+import json
+
+from PySide2.QtNetwork import *
+from PySide2.QtCore import *
+
+from .TrnlaNetwork import trnla_network
+# the render nodes name the frames they upload the same way, without Qt
+from .TrnlaArchive import frame_blob_name
+
+MANIFEST_VERSION = 1
+
+
+def build_manifest(members, hashes):
+    frames = []
+    for (path, arcname), frame_hash in zip(members, hashes):
+        frames.append({"name": arcname,
+                       "hash": frame_hash,
+                       "blob": frame_blob_name(frame_hash, path),
+                       "size": os.path.getsize(path)})
+    return json.dumps({"version": MANIFEST_VERSION, "frames": frames})
+
+
+class TrnlaFrameIndex(QObject):
+    """Frames claimed by uploads of this session. Shots of one export that share plates only upload a
+    frame once; the other shots wait for the owner to store it before they reference it. If the owner
+    fails, the shots that waited on it reclaim the frames and upload them themselves."""
+    released = Signal()
+
+    def __init__(self):
+        QObject.__init__(self)
+        self._owners = {}
+        self._stored = set()
+        # released by an owner that failed, nobody knows whether they are on the server
+        self._failed = set()
+
+    def claim(self, hashes, owner):
+        """Returns the hashes owner has to upload itself, in order and without repeats."""
+        claimed = []
+        for frame_hash in hashes:
+            if frame_hash in self._stored or frame_hash in self._owners:
+                continue
+            self._owners[frame_hash] = owner
+            self._failed.discard(frame_hash)
+            claimed.append(frame_hash)
+        return claimed
+
+    def reclaim(self, hashes, owner):
+        """Claims the hashes whose owner failed and nobody holds now. Returns the ones owner has to
+        upload before it references them."""
+        return self.claim([frame_hash for frame_hash in hashes if frame_hash in self._failed], owner)
+
+    def waiting_on(self, hashes, owner):
+        """True while another upload still owns one of the hashes."""
+        for frame_hash in hashes:
+            frame_owner = self._owners.get(frame_hash)
+            if frame_owner is not None and frame_owner is not owner:
+                return True
+        return False
+
+    def release(self, owner, stored=True):
+        """Called once the owner's shot is stored, or failed, in which case the shots waiting on its
+        frames reclaim them."""
+        for frame_hash, frame_owner in list(self._owners.items()):
+            if frame_owner is owner:
+                del self._owners[frame_hash]
+                if stored:
+                    self._stored.add(frame_hash)
+                else:
+                    self._failed.add(frame_hash)
+        self.released.emit()
+
+
+class TrnlaFrameUpload(QObject):
+    """Sends frames one at a time as content addressed frames. frames are (path, sha256) pairs."""
+    finished = Signal()
+    failed = Signal(str)
+
+    def __init__(self, api_key, project_id, frames, scheduler=None):
+        QObject.__init__(self)
+        self.api_key = api_key
+        self.project_id = project_id
+        self.scheduler = scheduler
+        self.aborted = False
+        self._queue = list(frames)
+        self._frame_file = None
+        self._reply = None
+
+    def start(self):
+        if self.aborted:
+            return
+        if not self._queue:
+            self.finished.emit()
+            return
+        path = self._queue[0][0]
+        delay = self.scheduler.reserve(os.path.getsize(path)) if self.scheduler else 0
+        if delay > 0:
+            QTimer.singleShot(delay, self._post_frame)
+        else:
+            self._post_frame()
+
+    def abort(self):
+        self.aborted = True
+        if self._reply:
+            self._reply.abort()
+
+    def _post_frame(self):
+        if self.aborted:
+            return
+        path, frame_hash = self._queue[0]
+        self._frame_file = QFile(path)
+        if not self._frame_file.open(QIODevice.ReadOnly):
+            self.failed.emit("could not read " + path)
+            return
+        self._reply = trnla_network().post_form_retrying("frames/store", [("api_key", self.api_key),
+                                                                         ("project_id", self.project_id),
+                                                                         ("hash", frame_hash)],
+                                                         [("frame", frame_blob_name(frame_hash, path), self._frame_file)],
+                                                         name="upload of " + os.path.basename(path))
+        self._reply.finished.connect(self._on_frame_stored)
+
+    def _on_frame_stored(self, reply):
+        reply.deleteLater()
+        self._frame_file.close()
+        self._reply = None
+        if self.aborted:
+            return
+        stored = False
+        if reply.error() == QNetworkReply.NoError:
+            try:
+                stored = bool(json.loads(reply.readAll().data().decode('utf8')).get('success'))
+            except ValueError:
+                pass
+        path = self._queue.pop(0)[0]
+        if not stored:
+            self.failed.emit("could not upload " + os.path.basename(path) + ": " + reply.errorString())
+            return
+        self.start()
+
+
+_frame_index = None
+
+
+def frame_index():
+    global _frame_index
+    if _frame_index is None:
+        _frame_index = TrnlaFrameIndex()
+    return _frame_index
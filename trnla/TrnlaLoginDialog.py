@@ -15,6 +15,9 @@ import os.path as path
 import json
 import nuke
 
+from .TrnlaNetwork import trnla_network
+from .TrnlaConfig import trnla_config
+
 class TrnlaLoginDialog(QDialog):
     def __init__(self, parent=None):
         QDialog.__init__(self, parent)
@@ -93,19 +96,16 @@ class TrnlaLoginDialog(QDialog):
             self.loginBtn.setEnabled(False)
             self.username.deselect()
             self.password.deselect()
-            self.nam = QNetworkAccessManager()
-            self.nam.finished[QNetworkReply].connect(self.nam_finished)
-
             data = QByteArray()
             email = str("email=" + self.username.text() + "&")
             data.append(email)
             pwd = str("password=" + self.password.text())
             data.append(pwd)
 
-            url = QUrl()
-            url.setUrl('https://trn.la/api/producer/login')
-            self.request = QNetworkRequest(url)
-            self.reply = self.nam.post(self.request, data)
+            self.request = trnla_network().request('login')
+            self.reply = trnla_network().post(self.request, data)
+            reply = self.reply
+            self.reply.finished.connect(lambda: self.nam_finished(reply))
             self.reply.error.connect(self.reply_error_occurred)
         else:
             self.statusL.setText("<b><font color=\"#cc0000\">Chosen folder is not a real directory!</font></b>")
@@ -148,21 +148,12 @@ class TrnlaLoginDialog(QDialog):
                     "data": userdata,
                     "rendering_enabled": False
                 }
-                doc = {'settings': settings}
-
-                TarantulaData = os.path.expanduser("~") + '/AppData/Local/Tarantula/'
-                configJsonFile = TarantulaData + 'config.json'
                 try:
-                    if not os.path.exists(os.path.dirname(configJsonFile)):
-                        os.makedirs(os.path.dirname(configJsonFile))
-
                     if not os.path.exists(jobs_dir):
                         os.makedirs(jobs_dir)
 
-                    with open(configJsonFile, 'w') as outfile:
-                        json.dump(doc, outfile, indent=4, sort_keys=True)
-                        outfile.close()
-                        QTimer.singleShot(0, self.success)
+                    trnla_config().save(settings)
+                    QTimer.singleShot(0, self.success)
                 except Exception as e:
                     self.statusL.setText("<b><font color=\"#ff3030\">Error during org setup:" + str(e) + "</font></b>")
             else:
@@ -0,0 +1,232 @@
+# --------------------------Trn.la Plugin For Nuke Studio--------------------------------
+# Shared transport for every request the plugin makes to trn.la. One network access
+# manager keeps its keep-alive connections (and HTTP/2 sessions where the server offers
+# them) open between requests, so shots don't pay for their own TLS handshake.
+#
+# (c) 2021 Tarantula
+# Author: Moses Molina
+# ---------------------------------------------------------------------------------------
+
+import os
+import uuid
+
+from PySide2.QtNetwork import *
+from PySide2.QtCore import *
+
+from .TrnlaRetry import retry_policy, transient_status, parse_retry_after
+
+# Point this at a local stand-in server to test uploads without touching trn.la.
+TRNLA_API_ROOT = os.environ.get("TRNLA_API_ROOT", "https://trn.la/api/producer")
+
+# errors that come from the connection rather than from the request, worth trying again
+TRANSIENT_ERRORS = set(getattr(QNetworkReply, name) for name in (
+    "RemoteHostClosedError", "TimeoutError", "TemporaryNetworkFailureError", "NetworkSessionFailedError",
+    "UnknownNetworkError", "ConnectionRefusedError", "HostNotFoundError", "ProxyConnectionRefusedError",
+    "ProxyConnectionClosedError", "ProxyTimeoutError", "InternalServerError", "ServiceUnavailableError",
+    "UnknownServerError", "ContentReSendError") if hasattr(QNetworkReply, name))
+
+
+def api_url(endpoint):
+    return TRNLA_API_ROOT.rstrip('/') + '/' + endpoint
+
+
+def form_part(name, value):
+    part = QHttpPart()
+    part.setHeader(QNetworkRequest.ContentDispositionHeader, "form-data; name=\"%s\"" % name)
+    if not isinstance(value, bytes):
+        value = str(value).encode()
+    part.setBody(value)
+    return part
+
+
+def new_idempotency_key():
+    """A key for one request that creates something on trn.la. Every try of the request sends the same
+    key and the server only acts on the first one it gets."""
+    return uuid.uuid4().hex
+
+
+def multipart_content_type(multpart):
+    # the boundary is a QByteArray, formatting it directly gives "b'...'" under python 3
+    return 'multipart/form-data; boundary=' + multpart.boundary().data().decode('ascii')
+
+
+def transient_error(reply):
+    """Whether a failed reply is worth sending again. An http status decides when the server answered."""
+    status = reply.attribute(QNetworkRequest.HttpStatusCodeAttribute)
+    if status:
+        return transient_status(status)
+    return reply.error() in TRANSIENT_ERRORS
+
+
+def body_size(body):
+    return body.size() if isinstance(body, QIODevice) else len(body)
+
+
+class TrnlaRetryingRequest(QObject):
+    """Sends a request again after transient failures, waiting as the retry policy says. send posts
+    a new reply on every try. finished gets the last reply, successful or not, None if it was aborted
+    before the first try. The shared network object owns the request until then, so callers don't have
+    to keep it. With a scheduler every try waits its turn under the bandwidth cap for num_bytes."""
+    uploadProgress = Signal('qint64', 'qint64')
+    finished = Signal(QObject)
+
+    def __init__(self, name, send, policy=None, scheduler=None, num_bytes=0):
+        QObject.__init__(self, trnla_network())
+        self.name = name
+        self.send = send
+        self.policy = policy or retry_policy()
+        self.scheduler = scheduler
+        self.num_bytes = num_bytes
+        self.retries = 0
+        self.reply = None
+        self.aborted = False
+        self._waiting = False
+
+    def start(self):
+        if self.aborted:
+            return self
+        delay = self.scheduler.reserve(self.num_bytes) if self.scheduler and self.num_bytes else 0
+        if delay > 0:
+            self._waiting = True
+            QTimer.singleShot(delay, self._send)
+        else:
+            self._send()
+        return self
+
+    def _send(self):
+        if self.aborted:
+            return
+        self._waiting = False
+        if self.reply is not None:
+            self.reply.deleteLater()
+        self.reply = self.send()
+        reply = self.reply
+        reply.uploadProgress.connect(lambda sent, total: self.uploadProgress.emit(sent, total))
+        reply.finished.connect(lambda: self._on_finished(reply))
+
+    def abort(self):
+        self.aborted = True
+        if self._waiting:
+            self._waiting = False
+            self.finished.emit(self.reply)
+            self.deleteLater()
+        elif self.reply is not None:
+            self.reply.abort()
+
+    def _on_finished(self, reply):
+        if (not self.aborted and reply.error() != QNetworkReply.NoError and transient_error(reply)
+                and self.policy.should_retry(self.retries)):
+            retry_after = parse_retry_after(reply.rawHeader(b"Retry-After").data().decode('ascii', 'ignore'))
+            delay = self.policy.delay(self.retries, retry_after)
+            self.retries += 1
+            print("Trnla: %s failed (%s), retry %d of %d in %.1fs." % (self.name, reply.errorString(), self.retries,
+                                                                     self.policy.max_retries, delay))
+            self._waiting = True
+            QTimer.singleShot(int(delay * 1000), self.start)
+            return
+        self.finished.emit(reply)
+        self.deleteLater()
+
+
+class TrnlaNetwork(QObject):
+    def __init__(self):
+        QObject.__init__(self)
+        self.manager = QNetworkAccessManager(self)
+        self.manager.encrypted.connect(self._on_encrypted)
+        self._stats = {
+            "requests": 0,
+            "in_flight": 0,
+            "tls_handshakes": 0,
+            "http2_replies": 0,
+            "bytes_sent": 0,
+            "bytes_received": 0,
+        }
+
+    def request(self, endpoint, content_type=None):
+        request = QNetworkRequest(QUrl(api_url(endpoint)))
+        if content_type:
+            request.setHeader(QNetworkRequest.ContentTypeHeader, content_type)
+        # HTTP/2 multiplexes all requests over one connection, older Qt builds just ignore this
+        http2 = getattr(QNetworkRequest, "Http2AllowedAttribute", None)
+        if http2 is not None:
+            request.setAttribute(http2, True)
+        return request
+
+    def post(self, request, body):
+        reply = self.manager.post(request, body)
+        self._stats["requests"] += 1
+        self._stats["in_flight"] += 1
+        reply.uploadProgress.connect(lambda sent, total: self._on_progress(reply, "bytes_sent", sent))
+        reply.downloadProgress.connect(lambda received, total: self._on_progress(reply, "bytes_received", received))
+        reply.finished.connect(lambda: self._on_finished(reply))
+        return reply
+
+    def post_form(self, endpoint, fields, files=()):
+        """Posts a multipart form. fields are (name, value) pairs, files are (name, filename, body) where
+        body is a bytes-like object or an open QIODevice."""
+        multpart = QHttpMultiPart(QHttpMultiPart.FormDataType)
+        for name, value in fields:
+            multpart.append(form_part(name, value))
+        for name, filename, body in files:
+            file_part = QHttpPart()
+            file_part.setHeader(QNetworkRequest.ContentDispositionHeader,
+                                "form-data; name=\"%s\"; filename=\"%s\"" % (name, filename))
+            if isinstance(body, QIODevice):
+                # from the start, a retry sends the same device again
+                body.reset()
+                file_part.setBodyDevice(body)
+            else:
+                file_part.setBody(QByteArray(body))
+            multpart.append(file_part)
+        request = self.request(endpoint, multipart_content_type(multpart))
+        reply = self.post(request, multpart)
+        # the multipart lives as long as the reply
+        multpart.setParent(reply)
+        return reply
+
+    def post_form_retrying(self, endpoint, fields, files=(), name=None, idempotency_key=None, scheduler=None):
+        """post_form, sent again after transient failures. Returns the started TrnlaRetryingRequest.
+        A try can fail after the server has handled it, so requests that create something have to pass
+        an idempotency_key, or the retry creates it twice. Uploads pass the upload scheduler, so their
+        files count against its bandwidth cap."""
+        if idempotency_key:
+            fields = list(fields) + [("idempotency_key", idempotency_key)]
+        num_bytes = sum(body_size(part[2]) for part in files)
+        return TrnlaRetryingRequest(name or endpoint, lambda: self.post_form(endpoint, fields, files),
+                                    scheduler=scheduler, num_bytes=num_bytes).start()
+
+    def warm_up(self):
+        """Opens the connection to trn.la ahead of the first request."""
+        url = QUrl(TRNLA_API_ROOT)
+        if url.scheme() == "https":
+            self.manager.connectToHostEncrypted(url.host(), url.port(443))
+        else:
+            self.manager.connectToHost(url.host(), url.port(80))
+
+    def stats(self):
+        return dict(self._stats)
+
+    def _on_encrypted(self, reply):
+        self._stats["tls_handshakes"] += 1
+
+    def _on_progress(self, reply, key, num_bytes):
+        last = reply.property(key) or 0
+        self._stats[key] += num_bytes - last
+        reply.setProperty(key, num_bytes)
+
+    def _on_finished(self, reply):
+        self._stats["in_flight"] -= 1
+        http2_used = getattr(QNetworkRequest, "Http2WasUsedAttribute", None)
+        if http2_used is not None and reply.attribute(http2_used):
+            self._stats["http2_replies"] += 1
+
+
+_network = None
+
+
+def trnla_network():
+    """The transport shared by the exporters, the processor and the UI."""
+    global _network
+    if _network is None:
+        _network = TrnlaNetwork()
+    return _network
@@ -0,0 +1,264 @@
+# --------------------------Trn.la Plugin For Nuke Studio--------------------------------
+# Uploads frames while the shot is still rendering. Finished frames are picked up from the
+# render directory and sent as content addressed frames, so by the time the last frame is
+# written most of the shot is already on trn.la.
+#
+# (c) 2021 Tarantula
+# Author: Moses Molina
+# ---------------------------------------------------------------------------------------
+
+import os
+import json
+from multiprocessing.pool import ThreadPool
+
+from PySide2.QtNetwork import *
+from PySide2.QtCore import *
+
+from .TrnlaNetwork import trnla_network
+from .TrnlaArchive import hash_file, archive_workers
+from .TrnlaFrameDedup import build_manifest, frame_blob_name, frame_index
+
+POLL_INTERVAL = 2000
+
+
+def _frame_stat(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime
+
+
+def _hash_frame(path):
+    # runs on the hashing pool, an empty hash tells the upload the frame couldn't be read
+    try:
+        return hash_file(path)
+    except (IOError, OSError):
+        return ""
+
+
+class TrnlaFrameWatcher(QObject):
+    """Polls a render directory and reports frames once they are complete. A frame counts as complete
+    when neither its size nor its modification time changed between two polls, or when the render is
+    done. Writers that flush in bursts can still fool this, TrnlaPipelinedUpload hashes the frames
+    that changed since they were sent again once the render is done."""
+    frameReady = Signal(str)
+
+    def __init__(self, directory, ext, interval=POLL_INTERVAL):
+        QObject.__init__(self)
+        self.directory = directory
+        self.ext = ext
+        self._sizes = {}
+        self._reported = set()
+        self._timer = QTimer(self)
+        self._timer.setInterval(interval)
+        self._timer.timeout.connect(self.poll)
+
+    def start(self):
+        self._timer.start()
+
+    def stop(self):
+        self._timer.stop()
+
+    def poll(self, render_done=False):
+        if not os.path.isdir(self.directory):
+            return
+        for file in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, file)
+            if path in self._reported or os.path.splitext(file)[1] != self.ext:
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            size = (stat.st_size, stat.st_mtime)
+            if render_done or (stat.st_size and self._sizes.get(path) == size):
+                self._reported.add(path)
+                self.frameReady.emit(path)
+            else:
+                self._sizes[path] = size
+
+
+class TrnlaPipelinedUpload(QObject):
+    """Sends the frames of one shot as they are rendered. finish() is called once the render is done;
+    finished is emitted with the shot manifest when every frame is on the server. Frames are hashed on
+    a thread pool, off the UI thread."""
+    uploadProgress = Signal('qint64', 'qint64')
+    finished = Signal(str)
+    failed = Signal(str)
+    # (path, sha256) from the hashing pool, delivered on the UI thread
+    _hashed = Signal(str, str)
+
+    def __init__(self, api_key, project_id, shot_name, directory, ext, scheduler=None, workers=1):
+        QObject.__init__(self)
+        self.api_key = api_key
+        self.project_id = project_id
+        self.shot_name = shot_name
+        self.scheduler = scheduler
+        self.frames = []
+        self.hashes = {}
+        # size and mtime of every frame when it was hashed
+        self.stats = {}
+        # the size of every frame in bytes_total, and the frames whose current version is in bytes_done
+        self._sizes = {}
+        self._done = set()
+        self.render_done = False
+        self.aborted = False
+        self.bytes_total = 0
+        self.bytes_done = 0
+        # (path, sha256) of the frames to send, the first one is on its way while _sending
+        self._queue = []
+        self._reply = None
+        self._sending = False
+        self._frame_file = None
+        self._hashing = 0
+        # frames reported while the render was running, hashed again once it is done
+        self._to_recheck = None
+        self._pool = ThreadPool(archive_workers(workers))
+        self._hashed.connect(self._on_hashed)
+        self.watcher = TrnlaFrameWatcher(directory, ext)
+        self.watcher.frameReady.connect(self.add_frame)
+
+    def start(self):
+        self.watcher.start()
+
+    def finish(self):
+        self._to_recheck = list(self.frames)
+        self.render_done = True
+        self.watcher.stop()
+        self.watcher.poll(render_done=True)
+        self._check_done()
+
+    def abort(self):
+        self.aborted = True
+        self.watcher.stop()
+        self._pool.terminate()
+        frame_index().release(self, stored=False)
+        if self._reply:
+            self._reply.abort()
+
+    def manifest(self):
+        members = [(path, os.path.basename(path)) for path in self.frames]
+        return build_manifest(members, [self.hashes[path] for path in self.frames])
+
+    def add_frame(self, path):
+        self.frames.append(path)
+        self._hash(path)
+
+    def _hash(self, path):
+        self.stats[path] = _frame_stat(path)
+        self._hashing += 1
+        self._pool.apply_async(_hash_frame, (path,), callback=lambda frame_hash: self._hashed.emit(path, frame_hash))
+
+    def _on_hashed(self, path, frame_hash):
+        self._hashing -= 1
+        if self.aborted:
+            return
+        if not frame_hash:
+            self._fail("could not read " + path)
+            return
+        previous = self.hashes.get(path)
+        self.hashes[path] = frame_hash
+        if previous == frame_hash:
+            self._check_done()
+            return
+        if previous is not None:
+            # it was still being written when it was sent
+            print("Trnla: " + os.path.basename(path) + " changed after it was picked up, sending the finished frame.")
+            self.bytes_total -= self._sizes[path]
+            if path in self._done:
+                self._done.discard(path)
+                self.bytes_done -= self._sizes[path]
+            # a try with the old content that hasn't gone out yet is replaced, the one on its way is let be
+            waiting = 1 if self._sending else 0
+            self._queue = self._queue[:waiting] + [entry for entry in self._queue[waiting:] if entry[0] != path]
+        size = self.stats[path][0] if self.stats.get(path) else os.path.getsize(path)
+        self._sizes[path] = size
+        self.bytes_total += size
+        # frames shared with other shots of this export are only sent once
+        if frame_index().claim([frame_hash], self):
+            self._queue.append((path, frame_hash))
+        else:
+            self._done.add(path)
+            self.bytes_done += size
+        if not self._sending:
+            self._send_next()
+
+    def _send_next(self):
+        if self.aborted:
+            return
+        if not self._queue:
+            self._sending = False
+            self._check_done()
+            return
+        self._sending = True
+        path, frame_hash = self._queue[0]
+        delay = self.scheduler.reserve(self._sizes[path]) if self.scheduler else 0
+        if delay > 0:
+            QTimer.singleShot(delay, lambda: self._post_frame(path, frame_hash))
+        else:
+            self._post_frame(path, frame_hash)
+
+    def _post_frame(self, path, frame_hash):
+        if self.aborted:
+            return
+        self._frame_file = QFile(path)
+        if not self._frame_file.open(QIODevice.ReadOnly):
+            self._fail("could not read " + path)
+            return
+        self._reply = trnla_network().post_form_retrying("frames/store", [("api_key", self.api_key),
+                                                                         ("project_id", self.project_id),
+                                                                         ("hash", frame_hash)],
+                                                         [("frame", frame_blob_name(frame_hash, path), self._frame_file)],
+                                                         name="upload of " + os.path.basename(path))
+        self._reply.finished.connect(lambda reply: self._on_frame_stored(reply, path, frame_hash))
+        self._reply.uploadProgress.connect(lambda sent, total: self.uploadProgress.emit(self.bytes_done + sent,
+                                                                                        self.bytes_total))
+
+    def _on_frame_stored(self, reply, path, frame_hash):
+        reply.deleteLater()
+        self._frame_file.close()
+        self._reply = None
+        if self.aborted:
+            return
+        stored = False
+        if reply.error() == QNetworkReply.NoError:
+            try:
+                stored = bool(json.loads(reply.readAll().data().decode('utf8')).get('success'))
+            except ValueError:
+                pass
+        if not stored:
+            # transient failures were already retried
+            self._fail("could not upload " + os.path.basename(path) + ": " + reply.errorString())
+            return
+        self._queue.pop(0)
+        if self.hashes[path] == frame_hash:
+            self._done.add(path)
+            self.bytes_done += self._sizes[path]
+        self.uploadProgress.emit(self.bytes_done, self.bytes_total)
+        self._send_next()
+
+    def _fail(self, reason):
+        self.aborted = True
+        self._sending = False
+        self.watcher.stop()
+        self._pool.terminate()
+        frame_index().release(self, stored=False)
+        self.failed.emit(reason)
+
+    def _check_done(self):
+        if not self.render_done or self.aborted or self._hashing:
+            return
+        if self._to_recheck:
+            # the size check can pass for a frame that is written in bursts, what was sent during the
+            # render has to match the finished frame. One that hasn't changed since it was hashed does.
+            recheck, self._to_recheck = self._to_recheck, None
+            recheck = [path for path in recheck if _frame_stat(path) != self.stats.get(path)]
+            for path in recheck:
+                self._hash(path)
+            if recheck:
+                return
+        if not self._queue and not self._sending:
+            self._pool.terminate()
+            frame_index().release(self)
+            self.finished.emit(self.manifest())
@@ -0,0 +1,232 @@
+# --------------------------Trn.la Plugin For Nuke Studio--------------------------------
+# Segmented previews. Next to the preview movie the render writes the shot again as a jpeg
+# sequence. Nuke can't write fragmented mp4 or HLS, and its movie writers only finish a
+# movie once the whole render is done, so Nuke Studio encodes every segment from the jpegs
+# in a render of its own as soon as the frames of its range are written. Every segment is
+# uploaded once its encode is done, while the shot is still rendering.
+#
+# (c) 2021 Tarantula
+# Author: Moses Molina
+# ---------------------------------------------------------------------------------------
+
+import os
+import re
+import struct
+import tempfile
+
+import hiero.core.nuke as nuke
+from hiero.exporters.FnExternalRender import getColorspaceFromProperty
+
+from PySide2.QtCore import *
+
+from .TrnlaFarmSpool import frame_path, frame_ranges
+
+# ms between looks for finished frames and segment encodes
+POLL_INTERVAL = 500
+
+SEGMENT_NAME = re.compile(r"^segment\.(\d+)\.(\d+)-(\d+)\.\w+$")
+# the jpegs the render writes and the segments are encoded from
+SEGMENT_FRAMES = "frame.####.jpg"
+# every segment's encode, the movie's name with this after it
+SCRIPT_EXT = ".nk"
+
+
+def segment_dir(preview_path):
+    return os.path.splitext(preview_path)[0] + "_segments"
+
+
+def segments_enabled(properties):
+    return int(properties.get("trnla_preview_segment_frames", 0)) > 0
+
+
+def segment_info(path):
+    """(index, first frame, last frame) of a segment file, None for any other file."""
+    match = SEGMENT_NAME.match(os.path.basename(path))
+    if match is None:
+        return None
+    return tuple(int(group) for group in match.groups())
+
+
+def preview_colorspace(properties):
+    colourspace = properties.get("colourspace")
+    if colourspace and colourspace != "default":
+        return getColorspaceFromProperty(colourspace)
+    return None
+
+
+def movie_write_node(properties, path):
+    """A Write node for path with the file type and codec settings of a preview preset."""
+    writeNode = nuke.WriteNode(path.replace('\\', '/'))
+    file_type = properties["file_type"]
+    writeNode.setKnob("file_type", file_type)
+    for knob, value in (properties.get(file_type) or {}).items():
+        writeNode.setKnob(knob, value)
+    colorspace = preview_colorspace(properties)
+    if colorspace:
+        writeNode.setKnob("colorspace", colorspace)
+    return writeNode
+
+
+def add_segment_nodes(script, tree, properties, preview_path, first, last, framerate=None):
+    """Adds the jpeg Write node the segments are encoded from, reading from the node set as tree, and
+    writes the script of every segment's encode next to it."""
+    directory = segment_dir(preview_path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    for name in os.listdir(directory):
+        # frames and segments of an earlier export would look finished straight away
+        os.remove(os.path.join(directory, name))
+    frames = os.path.join(directory, SEGMENT_FRAMES).replace('\\', '/')
+    script.addNode(nuke.PushNode(tree))
+    writeNode = nuke.WriteNode(frames)
+    writeNode.setKnob("file_type", "jpeg")
+    writeNode.setKnob("_jpeg_quality", 1)
+    # written and read back in the preview's colorspace, the jpegs change nothing but the codec
+    colorspace = preview_colorspace(properties)
+    if colorspace:
+        writeNode.setKnob("colorspace", colorspace)
+    script.addNode(writeNode)
+
+    ext = os.path.splitext(preview_path)[1]
+    for index, (start, end) in enumerate(frame_ranges(first, last, int(properties["trnla_preview_segment_frames"]))):
+        segment = os.path.join(directory, "segment.%03d.%d-%d%s" % (index, start, end, ext))
+        encode = nuke.ScriptWriter()
+        encode.addNode(nuke.RootNode(start, end, framerate))
+        readNode = nuke.ReadNode(frames)
+        readNode.setKnob("first", start)
+        readNode.setKnob("last", end)
+        if colorspace:
+            readNode.setKnob("colorspace", colorspace)
+        encode.addNode(readNode)
+        encode.addNode(movie_write_node(properties, segment))
+        encode.writeToDisk(segment + SCRIPT_EXT)
+
+
+def movie_complete(path):
+    """Whether a mov or mp4 has been finalised: its top level boxes fill the file and one of them is the
+    moov box, which is written last."""
+    try:
+        size = os.path.getsize(path)
+        with open(path, 'rb') as movie:
+            offset = 0
+            moov = False
+            while offset < size:
+                movie.seek(offset)
+                header = movie.read(8)
+                if len(header) < 8:
+                    return False
+                box_size, box_type = struct.unpack(">I4s", header)
+                if box_size == 1:
+                    box_size = struct.unpack(">Q", movie.read(8))[0]
+                elif box_size == 0:
+                    # runs to the end of the file, an mdat still being written
+                    return False
+                if box_size < 8:
+                    return False
+                moov = moov or box_type == b"moov"
+                offset += box_size
+            return moov and offset == size
+    except (IOError, OSError, struct.error):
+        return False
+
+
+class TrnlaSegmentWatcher(QObject):
+    """Encodes the segments of a preview as the render writes their frames, one at a time and in order,
+    and emits segmentReady for every encoded segment. finish() is called once the render is done, done
+    is emitted when every segment has been handed out. failed stops the watcher."""
+    segmentReady = Signal(str)
+    done = Signal()
+    failed = Signal(str)
+
+    def __init__(self, directory):
+        QObject.__init__(self)
+        self.directory = directory
+        self.render_done = False
+        self.finished = False
+        self.count = 0
+        # (size, mtime) of every frame of the next segment at the last poll
+        self._stamps = {}
+        self._encode = None
+        self._encoding = None
+        self._log_path = None
+        self._timer = QTimer(self)
+        self._timer.setInterval(POLL_INTERVAL)
+        self._timer.timeout.connect(self.poll)
+
+    def start(self):
+        self._timer.start()
+
+    def stop(self):
+        self._timer.stop()
+        if self._encode is not None and self._encode.poll() is None:
+            self._encode.kill()
+        self._encode = None
+        self.finished = True
+
+    def finish(self):
+        self.render_done = True
+        self.poll()
+
+    def segments(self):
+        """The segments the render has encode scripts for, in order."""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted((os.path.join(self.directory, name[:-len(SCRIPT_EXT)]) for name in os.listdir(self.directory)
+                       if name.endswith(SCRIPT_EXT) and segment_info(name[:-len(SCRIPT_EXT)]) is not None),
+                      key=lambda path: segment_info(path)[0])
+
+    def poll(self):
+        if self.finished:
+            return
+        if self._encode is not None:
+            if self._encode.poll() is None:
+                return
+            self.encoded(self._encoding, self._encode.returncode)
+            if self.finished:
+                return
+        segments = self.segments()
+        if self.count >= len(segments):
+            if self.render_done:
+                self.finished = True
+                self.stop()
+                self.done.emit()
+            return
+        path = segments[self.count]
+        index, first, last = segment_info(path)
+        if self.render_done or self.frames_written(first, last):
+            self._encoding = path
+            handle, self._log_path = tempfile.mkstemp(prefix="trnla_segment_", suffix=".log")
+            os.close(handle)
+            # run like Hiero runs the render of an export
+            self._encode = nuke.executeNukeScript(path + SCRIPT_EXT, self._log_path)
+
+    def encoded(self, path, returncode):
+        self._encode = None
+        if returncode != 0 or not movie_complete(path):
+            self.stop()
+            self.failed.emit("the encode of %s failed, see %s" % (os.path.basename(path), self._log_path))
+            return
+        os.remove(self._log_path)
+        # the jpegs are only needed until their segment is encoded
+        index, first, last = segment_info(path)
+        for frame in range(first, last + 1):
+            try:
+                os.remove(frame_path(os.path.join(self.directory, SEGMENT_FRAMES), frame))
+            except OSError:
+                pass
+        self._stamps = {}
+        self.count += 1
+        self.segmentReady.emit(path)
+
+    def frames_written(self, first, last):
+        """True once every frame of first to last exists and didn't change since the last poll."""
+        stamps = {}
+        for frame in range(first, last + 1):
+            try:
+                stat = os.stat(frame_path(os.path.join(self.directory, SEGMENT_FRAMES), frame))
+            except OSError:
+                return False
+            stamps[frame] = (stat.st_size, stat.st_mtime)
+        written = stamps == self._stamps and all(size for size, mtime in stamps.values())
+        self._stamps = stamps
+        return written
@@ -10,6 +10,7 @@ import json
 import zipfile
 
 import hiero.core
+import hiero.core.nuke as nuke
 
 from hiero.exporters import FnTranscodeExporter, FnTranscodeExporterUI, FnExternalRenderUI, FnExternalRender, \
     FnAudioHelper
@@ -18,9 +19,18 @@ from PySide2.QtNetwork import *
 from PySide2.QtCore import *
 from PySide2.QtWidgets import *
 
+from .TrnlaFarmSubmission import announce_to_farm
+from .TrnlaScrub import add_scrub_nodes
+from .TrnlaPreviewSegments import add_segment_nodes, segments_enabled
+
+# the node the preview, scrub and segment branches read from
+PREVIEW_TREE = "trnla_preview_tree"
+
 
 class TrnlaUploaderNotifier(QObject):
     preview_ready = Signal(str)
+    # the render of a segmented preview has started
+    preview_started = Signal(str)
 
     def __init__(self):
         QObject.__init__(self)
@@ -28,19 +38,62 @@ class TrnlaUploaderNotifier(QObject):
     def notify_uploader(self, path):
         self.preview_ready.emit(path)
 
+    def notify_started(self, path):
+        self.preview_started.emit(path)
+
 
 class TrnlaPreviewTranscoder(FnTranscodeExporter.TranscodeExporter):
     def __init__(self, initDict):
         FnTranscodeExporter.TranscodeExporter.__init__(self, initDict)
         self.notifier = TrnlaUploaderNotifier()
+        # the full quality exporter writing this preview in its own render, if any
+        self.rendered_by = None
 
     def startTask(self):
+        if self.rendered_by is not None:
+            return
+        announce_to_farm(self)
         FnTranscodeExporter.TranscodeExporter.startTask(self)
+        self.render_started()
+
+    def render_started(self):
+        # segments are uploaded while the render writes them
+        if segments_enabled(self._preset.properties()):
+            self.notifier.notify_started(self.resolvedExportPath())
+
+    def addWriteNodeToScript(self, script, rootNode, framerate):
+        properties = self._preset.properties()
+        if not properties["trnla_scrub"] and not segments_enabled(properties):
+            return FnTranscodeExporter.TranscodeExporter.addWriteNodeToScript(self, script, rootNode, framerate)
+        # poster, thumbnails and segments come out of the same render as the preview
+        script.addNode(nuke.SetNode(PREVIEW_TREE, 0))
+        FnTranscodeExporter.TranscodeExporter.addWriteNodeToScript(self, script, rootNode, framerate)
+        self.add_preview_branches(script, PREVIEW_TREE, framerate)
+
+    def add_preview_branches(self, script, tree, framerate=None):
+        """Adds the scrub and segment Write nodes, reading from the node set as tree. The full quality
+        exporter calls this too when it renders the preview."""
+        properties = self._preset.properties()
+        first, last = self.outputRange()
+        if properties["trnla_scrub"]:
+            add_scrub_nodes(script, tree, self.resolvedExportPath(), first, last)
+        if segments_enabled(properties):
+            add_segment_nodes(script, tree, properties, self.resolvedExportPath(), first, last, framerate)
+
+    def taskStep(self):
+        if self.rendered_by is not None:
+            return False
+        return FnTranscodeExporter.TranscodeExporter.taskStep(self)
 
     def progress(self):
+        if self.rendered_by is not None:
+            return 1.0
         return float(FnTranscodeExporter.TranscodeExporter.progress(self))
 
     def finishTask(self):
+        # the full quality exporter renders the preview, finishes its render and notifies once it is done
+        if self.rendered_by is not None:
+            return
         path = self.resolvedExportPath()
         FnTranscodeExporter.TranscodeExporter.finishTask(self)
         self.notifier.notify_uploader(path)
@@ -65,6 +118,11 @@ class TrnlaPreviewTranscoderPreset(FnTranscodeExporter.TranscodePreset):
         self.properties()["deleteAudio"] = True
 
         self.properties()["trnla_upload"] = False
+        # render a poster frame and thumbnails for the scrub sprite along with the preview
+        self.properties()["trnla_scrub"] = False
+        # frames per segment of a preview uploaded while it renders, 0 uploads the finished movie instead.
+        # Only used with the full quality preset's trnla_separate_preview
+        self.properties()["trnla_preview_segment_frames"] = 0
 
         FnAudioHelper.defineExportPresetProperties(self)
 
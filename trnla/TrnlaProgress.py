@@ -0,0 +1,199 @@
+# --------------------------Trn.la Plugin For Nuke Studio--------------------------------
+# Progress, throughput and ETA for the render, archive and upload stages of every shot
+# and for the export as a whole.
+#
+# (c) 2021 Tarantula
+# Author: Moses Molina
+# ---------------------------------------------------------------------------------------
+
+import time
+
+from PySide2.QtCore import *
+
+RENDER = "render"
+ARCHIVE = "archive"
+UPLOAD = "upload"
+STAGES = (RENDER, ARCHIVE, UPLOAD)
+
+# used to weigh the stages until they have been running long enough to measure
+DEFAULT_STAGE_WEIGHTS = {RENDER: 0.5, ARCHIVE: 0.1, UPLOAD: 0.4}
+
+# rates are smoothed over samples at least this far apart
+MIN_SAMPLE_SECONDS = 0.5
+RATE_SMOOTHING = 0.3
+REPORT_INTERVAL = 15000
+
+
+def format_seconds(seconds):
+    if seconds is None:
+        return "--"
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return "%dh%02dm" % (seconds // 3600, (seconds % 3600) // 60)
+    if seconds >= 60:
+        return "%dm%02ds" % (seconds // 60, seconds % 60)
+    return "%ds" % seconds
+
+
+class TrnlaStageProgress(object):
+    """Progress of one stage, in the units of that stage (frames for the render, bytes otherwise)."""
+    def __init__(self, name):
+        self.name = name
+        self.done = 0
+        self.total = 0
+        self.started = None
+        self.finished = None
+        self._rate = None
+        self._last_done = 0
+        self._last_time = None
+
+    def update(self, done, total):
+        now = time.time()
+        if self.started is None and done > 0:
+            self.started = now
+            self._last_time = now
+            self._last_done = done
+        self.done = done
+        self.total = max(total, done)
+        if self._last_time is not None and now - self._last_time >= MIN_SAMPLE_SECONDS:
+            rate = (done - self._last_done) / (now - self._last_time)
+            self._rate = rate if self._rate is None else RATE_SMOOTHING * rate + (1 - RATE_SMOOTHING) * self._rate
+            self._last_done = done
+            self._last_time = now
+        if self.total and done >= self.total and self.finished is None:
+            self.finished = now
+
+    def fraction(self):
+        if not self.total:
+            return 0.0
+        return min(1.0, float(self.done) / self.total)
+
+    def rate(self):
+        """Units per second."""
+        if self.finished is not None and self.started is not None:
+            elapsed = self.finished - self.started
+            return self.total / elapsed if elapsed > 0 else None
+        return self._rate
+
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def remaining_seconds(self):
+        if self.finished is not None:
+            return 0.0
+        rate = self.rate()
+        if not rate or not self.total:
+            return None
+        return (self.total - self.done) / rate
+
+    def estimated_seconds(self):
+        remaining = self.remaining_seconds()
+        if remaining is None:
+            return None
+        return self.elapsed() + remaining
+
+
+class TrnlaShotProgress(object):
+    def __init__(self, shot_name):
+        self.shot_name = shot_name
+        self.stages = dict((name, TrnlaStageProgress(name)) for name in STAGES)
+        self.skipped = set()
+        self.completed = False
+
+    def stage(self, name):
+        return self.stages[name]
+
+    def skip(self, name):
+        """Stages that don't happen for this shot, like the archive for pipelined uploads."""
+        self.skipped.add(name)
+
+    def _active(self):
+        return [self.stages[name] for name in STAGES if name not in self.skipped]
+
+    def fraction(self):
+        if self.completed:
+            return 1.0
+        stages = self._active()
+        # weigh every stage by how long it takes, once that can be measured for all of them
+        weights = [stage.estimated_seconds() for stage in stages]
+        if None in weights or not sum(weights):
+            weights = [DEFAULT_STAGE_WEIGHTS[stage.name] for stage in stages]
+        total = sum(weights)
+        return sum(stage.fraction() * weight for stage, weight in zip(stages, weights)) / total
+
+    def eta(self):
+        if self.completed:
+            return 0.0
+        remaining = [stage.remaining_seconds() for stage in self._active()]
+        if None in remaining:
+            return None
+        return sum(remaining)
+
+    def describe(self):
+        parts = [self.shot_name]
+        for stage in self._active():
+            text = "%s %d%%" % (stage.name, int(stage.fraction() * 100))
+            rate = stage.rate()
+            if rate and stage.name != RENDER:
+                text += " %.1f MB/s" % (rate / 1048576.0)
+            elif rate:
+                text += " %.1f fps" % rate
+            parts.append(text)
+        parts.append("eta " + format_seconds(self.eta()))
+        return " | ".join(parts)
+
+
+class TrnlaExportProgress(QObject):
+    """All shots of one TrnlaShotProcessor run. Prints a status line to the script editor while the
+    export is running, verbose adds a line for every shot that isn't done."""
+    def __init__(self, verbose=False):
+        QObject.__init__(self)
+        self.verbose = verbose
+        self.shots = []
+        self._timer = QTimer(self)
+        self._timer.setInterval(REPORT_INTERVAL)
+        self._timer.timeout.connect(self.report)
+
+    def add_shot(self, shot_name):
+        shot = TrnlaShotProgress(shot_name)
+        self.shots.append(shot)
+        if not self._timer.isActive():
+            self._timer.start()
+        return shot
+
+    def fraction(self):
+        if not self.shots:
+            return 0.0
+        return sum(shot.fraction() for shot in self.shots) / len(self.shots)
+
+    def upload_rate(self):
+        """Combined upload throughput of the shots that are uploading, in bytes per second."""
+        return sum(shot.stage(UPLOAD).rate() or 0.0 for shot in self.shots
+                   if not shot.completed and shot.stage(UPLOAD).finished is None)
+
+    def eta(self):
+        etas = [shot.eta() for shot in self.shots]
+        if None in etas:
+            return None
+        # uploads share the uplink, so the export is done once every remaining byte has gone up
+        rate = self.upload_rate()
+        remaining = sum(shot.stage(UPLOAD).total - shot.stage(UPLOAD).done for shot in self.shots
+                        if not shot.completed)
+        upload_eta = remaining / rate if rate else 0.0
+        return max(max(etas or [0.0]), upload_eta)
+
+    def describe(self):
+        return "Trnla: export %d%% | %d/%d shots done | upload %.1f MB/s | eta %s" % (
+            int(self.fraction() * 100), len([shot for shot in self.shots if shot.completed]), len(self.shots),
+            self.upload_rate() / 1048576.0, format_seconds(self.eta()))
+
+    def report(self):
+        print(self.describe())
+        if self.verbose:
+            for shot in self.shots:
+                if not shot.completed:
+                    print("    " + shot.describe())
+        if all(shot.completed for shot in self.shots):
+            self._timer.stop()
@@ -0,0 +1,156 @@
+# --------------------------Trn.la Plugin For Nuke Studio--------------------------------
+# On-disk cache of the trn.la project list of every account used on this machine. The
+# export dialog shows the cached list straight away and revalidates it in the background.
+#
+# (c) 2021 Tarantula
+# Author: Moses Molina
+# ---------------------------------------------------------------------------------------
+
+import os
+import json
+import time
+import hashlib
+
+from PySide2.QtNetwork import *
+from PySide2.QtCore import *
+
+from .TrnlaNetwork import trnla_network, TrnlaRetryingRequest
+from .TrnlaConfig import TARANTULA_DATA, replace_file
+
+DEFAULT_PROJECT_CACHE = TARANTULA_DATA + 'projects_cache.json'
+CACHE_VERSION = 1
+
+
+def account_key(api_key):
+    # the api key itself is never written to the cache
+    return hashlib.sha1(str(api_key).encode('utf-8')).hexdigest()[:16]
+
+
+class TrnlaProjectCache(QObject):
+    """Project lists by account. refresh() asks trn.la only for what changed: the ETag of the cached list
+    is sent as If-None-Match and the time of the last refresh as updated_since, so the server can answer
+    304, a list of changes, or the full list."""
+    updated = Signal(str)
+
+    def __init__(self, cache_path=DEFAULT_PROJECT_CACHE):
+        QObject.__init__(self)
+        self.cache_path = cache_path
+        self._accounts = {}
+        self._index = {}
+        self._refreshing = set()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.cache_path) as cache_file:
+                cache = json.load(cache_file)
+        except (IOError, OSError, ValueError):
+            return
+        if cache.get("version") != CACHE_VERSION:
+            return
+        self._accounts = cache.get("accounts", {})
+        for account in self._accounts:
+            self._reindex(account)
+
+    def _save(self):
+        cache_dir = os.path.dirname(self.cache_path)
+        try:
+            if cache_dir and not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            tmp_path = self.cache_path + ".tmp"
+            with open(tmp_path, 'w') as cache_file:
+                json.dump({"version": CACHE_VERSION, "accounts": self._accounts}, cache_file)
+            replace_file(tmp_path, self.cache_path)
+        except (IOError, OSError) as err:
+            print("Trnla: could not write the project cache: " + str(err))
+
+    def _reindex(self, account):
+        self._index[account] = dict((project["project_name"], project["project_id"])
+                                    for project in self._accounts[account]["projects"])
+
+    def projects(self, api_key):
+        """Cached projects of the account as dicts with project_id and project_name, in server order."""
+        entry = self._accounts.get(account_key(api_key))
+        return list(entry["projects"]) if entry else []
+
+    def project_id(self, api_key, project_name):
+        return self._index.get(account_key(api_key), {}).get(project_name)
+
+    def age(self, api_key):
+        entry = self._accounts.get(account_key(api_key))
+        return time.time() - entry["fetched"] if entry else None
+
+    def forget(self, api_key):
+        account = account_key(api_key)
+        if account in self._accounts:
+            del self._accounts[account]
+            del self._index[account]
+            self._save()
+
+    def refresh(self, api_key):
+        account = account_key(api_key)
+        if account in self._refreshing:
+            return
+        self._refreshing.add(account)
+        entry = self._accounts.get(account)
+        data = QByteArray()
+        data.append(("api_key=" + str(api_key)).encode('utf-8'))
+        request = trnla_network().request('projects', 'application/x-www-form-urlencoded')
+        if entry:
+            if entry.get("etag"):
+                request.setRawHeader(b"If-None-Match", entry["etag"].encode('utf-8'))
+            if entry.get("server_time"):
+                data.append(("&updated_since=" + str(entry["server_time"])).encode('utf-8'))
+        retrying = TrnlaRetryingRequest("project list refresh", lambda: trnla_network().post(request, data))
+        retrying.finished.connect(lambda reply: self._on_projects(reply, account))
+        retrying.start()
+
+    def _on_projects(self, reply, account):
+        self._refreshing.discard(account)
+        reply.deleteLater()
+        if reply.error() != QNetworkReply.NoError:
+            print("Trnla: could not refresh the project list: " + reply.errorString())
+            return
+        entry = self._accounts.get(account)
+        if reply.attribute(QNetworkRequest.HttpStatusCodeAttribute) == 304 and entry:
+            entry["fetched"] = time.time()
+            self._save()
+            return
+        try:
+            replyJson = json.loads(reply.readAll().data().decode('utf8'))
+        except ValueError:
+            print("Trnla: could not read the project list.")
+            return
+
+        projects = [{"project_id": project["project_id"], "project_name": project["project_name"]}
+                    for project in replyJson.get("projects") or []]
+        if replyJson.get("incremental") and entry:
+            # only the projects that changed since updated_since, plus the ids of deleted ones
+            changed = dict((project["project_id"], project) for project in projects)
+            deleted = set(replyJson.get("deleted") or [])
+            merged = [changed.pop(project["project_id"], project) for project in entry["projects"]
+                      if project["project_id"] not in deleted]
+            projects = merged + [project for project in projects if project["project_id"] in changed]
+        elif entry and projects == entry["projects"]:
+            entry["fetched"] = time.time()
+            self._save()
+            return
+
+        etag = reply.rawHeader(b"ETag").data().decode('utf-8')
+        self._accounts[account] = {"projects": projects,
+                                   "etag": etag or None,
+                                   "server_time": replyJson.get("server_time"),
+                                   "fetched": time.time()}
+        self._reindex(account)
+        self._save()
+        self.updated.emit(account)
+
+
+_project_cache = None
+
+
+def project_cache():
+    global _project_cache
+    if _project_cache is None:
+        _project_cache = TrnlaProjectCache()
+    return _project_cache
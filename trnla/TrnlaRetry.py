@@ -0,0 +1,65 @@
+# --------------------------Trn.la Plugin For Nuke Studio--------------------------------
+# When to send a failed request to trn.la again and how long to wait first. Transient
+# failures (dropped connections, timeouts, 429 and 5xx replies) are retried with
+# exponential backoff and full jitter, anything else fails right away.
+#
+# Plain python so the upload worker process shares it with Nuke Studio.
+#
+# (c) 2021 Tarantula
+# Author: Moses Molina
+# ---------------------------------------------------------------------------------------
+
+import random
+
+DEFAULT_MAX_RETRIES = 5
+# seconds
+BASE_DELAY = 1.0
+MAX_DELAY = 60.0
+
+# replies that say "try again later", every other 4xx means the request itself is wrong
+TRANSIENT_STATUS_CODES = (408, 425, 429, 500, 502, 503, 504)
+
+
+def transient_status(status):
+    return int(status) in TRANSIENT_STATUS_CODES
+
+
+def parse_retry_after(value):
+    """Seconds from a Retry-After header, None if it is missing or a date."""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class TrnlaRetryPolicy(object):
+    def __init__(self, max_retries=DEFAULT_MAX_RETRIES, base_delay=BASE_DELAY, max_delay=MAX_DELAY):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def configure(self, max_retries):
+        self.max_retries = max(0, int(max_retries))
+
+    def should_retry(self, retries):
+        """retries is how many times the request has been retried already."""
+        return retries < self.max_retries
+
+    def delay(self, retries, retry_after=None):
+        """Seconds to wait before the next try. Full jitter keeps the shots of an export that failed
+        together from retrying together."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** retries)))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+
+_policy = None
+
+
+def retry_policy():
+    """The policy shared by every request of this Nuke Studio session."""
+    global _policy
+    if _policy is None:
+        _policy = TrnlaRetryPolicy()
+    return _policy
@@ -0,0 +1,96 @@
+# --------------------------Trn.la Plugin For Nuke Studio--------------------------------
+# Poster frame and scrub sprite of a shot. The preview render writes a poster and a small
+# thumbnail of every frame next to the preview; the thumbnails are put together into one
+# sprite, so trn.la can show and scrub a shot before its preview has loaded.
+#
+# (c) 2021 Tarantula
+# Author: Moses Molina
+# ---------------------------------------------------------------------------------------
+
+import os
+
+import hiero.core.nuke as nuke
+
+from PySide2.QtCore import *
+from PySide2.QtGui import *
+
+# pixel widths, heights follow the aspect of the shot
+POSTER_WIDTH = 960
+THUMB_WIDTH = 240
+SPRITE_COLUMNS = 10
+# longer shots get every nth frame in the sprite
+SPRITE_MAX_TILES = 100
+JPEG_QUALITY = 80
+
+
+def scrub_dir(preview_path):
+    return os.path.splitext(preview_path)[0] + "_scrub"
+
+
+def poster_path(preview_path):
+    return os.path.join(scrub_dir(preview_path), "poster.jpg")
+
+
+def thumb_pattern(preview_path):
+    return os.path.join(scrub_dir(preview_path), "thumb.####.jpg")
+
+
+def add_scrub_nodes(script, tree, preview_path, first, last):
+    """Adds the poster and thumbnail branches to script, both reading from the node set as tree."""
+    if not os.path.isdir(scrub_dir(preview_path)):
+        os.makedirs(scrub_dir(preview_path))
+    for path, width, frame in ((thumb_pattern(preview_path), THUMB_WIDTH, None),
+                               (poster_path(preview_path), POSTER_WIDTH, (first + last) // 2)):
+        script.addNode(nuke.PushNode(tree))
+        reformat = nuke.Node("Reformat")
+        reformat.setKnob("type", "to box")
+        reformat.setKnob("box_width", width)
+        reformat.setKnob("box_fixed", False)
+        script.addNode(reformat)
+        writeNode = nuke.WriteNode(path.replace('\\', '/'))
+        writeNode.setKnob("file_type", "jpeg")
+        writeNode.setKnob("_jpeg_quality", JPEG_QUALITY / 100.0)
+        if frame is not None:
+            # the poster is the middle frame only
+            writeNode.setKnob("use_limit", True)
+            writeNode.setKnob("first", frame)
+            writeNode.setKnob("last", frame)
+        script.addNode(writeNode)
+
+
+def scrub_frames(preview_path):
+    """The rendered thumbnails in frame order."""
+    directory = scrub_dir(preview_path)
+    if not os.path.isdir(directory):
+        return []
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+            if name.startswith("thumb.") and name.endswith(".jpg")]
+
+
+def build_sprite(thumbs):
+    """Tiles the thumbnails into one jpeg. Returns (jpeg bytes, layout), or None if a thumbnail can't be
+    read. layout tells trn.la where every tile is and which frame it shows."""
+    step = max(1, -(-len(thumbs) // SPRITE_MAX_TILES))
+    tiles = thumbs[::step]
+    images = [QImage(path) for path in tiles]
+    if not images or any(image.isNull() for image in images):
+        return None
+    tile_width = images[0].width()
+    tile_height = images[0].height()
+    columns = min(SPRITE_COLUMNS, len(images))
+    rows = -(-len(images) // columns)
+    sprite = QImage(tile_width * columns, tile_height * rows, QImage.Format_RGB32)
+    sprite.fill(Qt.black)
+    painter = QPainter(sprite)
+    for index, image in enumerate(images):
+        painter.drawImage(QRect((index % columns) * tile_width, (index // columns) * tile_height,
+                                tile_width, tile_height), image)
+    painter.end()
+    data = QByteArray()
+    buffer = QBuffer(data)
+    buffer.open(QIODevice.WriteOnly)
+    sprite.save(buffer, "JPG", JPEG_QUALITY)
+    buffer.close()
+    layout = {"columns": columns, "rows": rows, "tile_width": tile_width, "tile_height": tile_height,
+              "tiles": len(images), "frame_step": step, "frames": len(thumbs)}
+    return data.data(), layout
@@ -28,10 +28,18 @@ try:
 except ImportError:
     ShotProcessorUI = FnShotProcessor.ShotProcessor
 
-from .TrnlaTranscodeExporter import TrnlaTranscodeExporter
-from .TrnlaPreviewTranscoder import TrnlaPreviewTranscoder, TrnlaPreviewTranscoderPreset
-
 from .TrnlaLoginDialog import TrnlaLoginDialog
+from .TrnlaUploadScheduler import upload_scheduler, DEFAULT_MAX_UPLOADS
+from .TrnlaNetwork import trnla_network, new_idempotency_key
+from .TrnlaRetry import retry_policy, DEFAULT_MAX_RETRIES
+from .TrnlaProjectCache import project_cache, account_key
+from .TrnlaConfig import trnla_config
+from .TrnlaColorspace import colorspace_table
+from .TrnlaExportPlan import TrnlaExportPlan
+from .TrnlaShotRegistry import TrnlaShotRegistration
+from .TrnlaProgress import TrnlaExportProgress
+from .TrnlaTiming import TrnlaSpanRecorder
+from .TrnlaPreviewSegments import segments_enabled
 
 
 class TrnlaShotProcessorUI(ShotProcessorUI):
@@ -39,20 +47,10 @@ class TrnlaShotProcessorUI(ShotProcessorUI):
         ShotProcessorUI.__init__(self, preset)
 
     def get_api_key(self):
-        TarantulaData = os.path.expanduser("~") + '/AppData/Local/Tarantula/'
-        configJsonFile = TarantulaData + 'config.json'
-        try:
-            jsonFile = open(configJsonFile)
-        except Exception as err:
-            jsonFile = None
+        api_key = trnla_config().api_key()
+        if not api_key:
             print("No trn.la account detected. Please log in to your trn.la account on this device.")
-
-        if jsonFile:
-            config = json.load(jsonFile)
-            settings = config['settings']
-            return settings["api_key"]
-        else:
-            return None
+        return api_key
 
     def displayName(self):
         return "Process as Shots for Trn.la"
@@ -95,44 +93,43 @@ class TrnlaShotProcessorUI(ShotProcessorUI):
             self.preset().properties()["trnla_upload"] = True
 
     def get_proj_id(self, projName):
-        project_ids = self.preset().properties()["trnla_project_ids"]
-        project_names = self.preset().properties()["trnla_project_names"]
-        for i in range(len(project_names)):
-            if project_names[i] == projName:
-                return project_ids[i]
+        return project_cache().project_id(self.api_key, projName)
 
     def onProjectSelected(self, projName):
         self.preset().properties()["trnla_project_name"] = projName
         self.preset().properties()["trnla_project_id"] = self.get_proj_id(projName)
 
-    def readyRead(self, reply):
-        er = reply.error()
-
-        if er == QNetworkReply.NoError:
-            bytes_string = reply.readAll()
-            string1 = str(bytes_string).decode('utf8')
-            replyJson = json.loads(string1)
-            projectsJson = replyJson.get('projects')
-            self.prjSelect.clear()
-            del self.preset().properties()["trnla_project_names"][:]
-            del self.preset().properties()["trnla_project_ids"][:]
-            self.preset().properties()["trnla_project_name"] = ""
-            self.preset().properties()["trnla_project_id"] = ""
-            if projectsJson:
-                for project in projectsJson:
-                    self.preset().properties()["trnla_project_names"].append(project["project_name"].encode('ascii'))
-                    self.preset().properties()["trnla_project_ids"].append(project["project_id"])
-                    self.prjSelect.addItem(str(project['project_name']))
-
-                self.preset().properties()["trnla_project_name"] = self.prjSelect.currentText()
-                self.preset().properties()["trnla_project_id"] = self.get_proj_id(self.prjSelect.currentText())
-            else:
+    def showProjects(self, projects):
+        # keep the selection when a refresh changes the list
+        current = self.prjSelect.currentText()
+        self.prjSelect.blockSignals(True)
+        self.prjSelect.clear()
+        del self.preset().properties()["trnla_project_names"][:]
+        del self.preset().properties()["trnla_project_ids"][:]
+        self.preset().properties()["trnla_project_name"] = ""
+        self.preset().properties()["trnla_project_id"] = ""
+        for project in projects:
+            self.preset().properties()["trnla_project_names"].append(str(project["project_name"]))
+            self.preset().properties()["trnla_project_ids"].append(project["project_id"])
+            self.prjSelect.addItem(str(project['project_name']))
+        if current and self.prjSelect.findText(current) >= 0:
+            self.prjSelect.setCurrentIndex(self.prjSelect.findText(current))
+        self.prjSelect.blockSignals(False)
+        if projects:
+            self.onProjectSelected(self.prjSelect.currentText())
+
+    def onProjectsUpdated(self, account):
+        if self.api_key and account == account_key(self.api_key):
+            projects = project_cache().projects(self.api_key)
+            try:
+                self.showProjects(projects)
+            except RuntimeError:
+                # the dialog was closed before the refresh came back
+                project_cache().updated.disconnect(self.onProjectsUpdated)
+                return
+            if not projects:
                 print('Trnla: Did not find any projects.')
 
-        else:
-            print("Error occurred: ", er)
-            print(reply.errorString())
-
     def showLogin(self, widget):
         self.loginDlg = TrnlaLoginDialog(widget)
         if self.loginDlg.exec_():
@@ -221,10 +218,10 @@ class TrnlaShotProcessorUI(ShotProcessorUI):
         self.prjSelect.setEditable(False)
         self.prjSelect.hide()
         self.prjSelect.currentTextChanged.connect(self.onProjectSelected)
+        project_cache().updated.connect(self.onProjectsUpdated)
 
-        self.nam = QNetworkAccessManager()
-        self.nam.finished.connect(self.readyRead)
         if self.api_key:
+            trnla_network().warm_up()
             self.requestProjects()
 
         # PROJECT SETUP LAYOUT
@@ -281,15 +278,10 @@ class TrnlaShotProcessorUI(ShotProcessorUI):
         self.uploadFull.hide()
 
     def requestProjects(self):
-        self.location = 'https://trn.la/api/producer/projects'
-        self.url = QUrl(self.location)
-        self.data = QByteArray()
-        self.request = QNetworkRequest(self.url)
-        self.data.append("api_key=" + str(self.api_key))
-        self.request.setHeader(QNetworkRequest.ContentTypeHeader,
-                               'application/x-www-form-urlencoded')
+        # show what is cached right away, the refresh updates the list if anything changed
         if self.api_key:
-            self.nam.post(self.request, self.data)
+            self.showProjects(project_cache().projects(self.api_key))
+            project_cache().refresh(self.api_key)
 
     def loggedInMode(self, onStart):
         self.uploadFull.setCheckState(Qt.Checked)
@@ -314,69 +306,60 @@ class TrnlaShotProcessorUI(ShotProcessorUI):
         self.uploadFull.show()
 
     def onLogOut(self):
-        TarantulaData = os.path.expanduser("~") + '/AppData/Local/Tarantula/'
-        configJsonFile = TarantulaData + 'config.json'
-        try:
-            jsonFile = open(configJsonFile)
-        except Exception as err:
-            jsonFile = None
-
-        if jsonFile:
-            jsonFile.close()
-            os.remove(configJsonFile)
+        trnla_config().clear()
+        if self.api_key:
+            project_cache().forget(self.api_key)
 
         self.loggedOutMode()
         pass
 
 
+class TrnlaPendingProject(QObject):
+    """A project that is still being created on trn.la while the shots already render."""
+    resolved = Signal()
+    failed = Signal(str)
+
+    def __init__(self, name):
+        QObject.__init__(self)
+        self.name = name
+        self.project_id = None
+        self.error = None
+
+    def resolve(self, project_id):
+        self.project_id = project_id
+        self.resolved.emit()
+
+    def fail(self, reason):
+        self.error = reason
+        self.failed.emit(reason)
+
+
 class TrnlaShotProcessor(FnShotProcessor.ShotProcessor):
     def __init__(self, preset, submission=None, synchronous=False):
         FnShotProcessor.ShotProcessor.__init__(self, preset, submission, synchronous)
-
-    def findAndDeletePreview(self, ele):
-        if ele is None:
-            return 'None'
-
-        am_prev_dir = ''
-        children = ele.children()
-        for child in children[:-1]:
-            result = self.findAndDeletePreview(child)
-            if result == 'Prev':
-                ele.removeChild(child)
-                am_prev_dir = 'am_prev_dir'
-            elif result == 'am_prev_dir':
-                ele.removeChild(child)
-
-        if ele.childCount():
-            result = self.findAndDeletePreview(children[-1])
-            if result == 'Prev':
-                ele.removeChild(children[-1])
-                am_prev_dir = 'am_prev_dir'
-            elif result == 'am_prev_dir':
-                ele.removeChild(children[-1])
-
-        if type(ele.preset()) == TrnlaPreviewTranscoderPreset:
-            return 'Prev'
-        elif am_prev_dir == 'am_prev_dir':
-            return am_prev_dir
-        else:
-            return 'Not_Prev'
+        self.pending_project = None
+        self.shot_registration = None
 
     def readyRead(self, reply):
         er = reply.error()
+        self.create_project_span.end(success=er == QNetworkReply.NoError)
 
         if er == QNetworkReply.NoError:
-            bytes_string = reply.readAll()
-            data = str(bytes_string).decode('utf8')
-            replyJson = json.loads(data)
-            if replyJson.get('success'):
-                newProjId = replyJson.get('project_id')
-                if newProjId:
-                    self.preset().properties()["trnla_project_id"] = newProjId
-                    self.TrnlaStartProcessing(self.trnlaExportItems, self.trnlaPreview)
+            try:
+                replyJson = json.loads(reply.readAll().data().decode('utf8'))
+            except ValueError:
+                replyJson = {}
+            newProjId = replyJson.get('project_id') if replyJson.get('success') else None
+            if newProjId:
+                self.preset().properties()["trnla_project_id"] = newProjId
+                self.pending_project.resolve(newProjId)
+            else:
+                self.pending_project.fail(str(replyJson.get('error') or "trn.la did not return a project id"))
         else:
             print("Error occurred: ", er)
             print(reply.errorString())
+            self.pending_project.fail(reply.errorString())
+        reply.deleteLater()
 
     def reply_error_occurred(self, err):
         print("reply error (" + self._shot_name + ") :" + str(err))
@@ -385,81 +368,69 @@ class TrnlaShotProcessor(FnShotProcessor.ShotProcessor):
         # Get Sequence Info
         project_info = self.getSeqInfo(self.trnlaExportItems) + (self.getColorSpace(),)
 
-        self.location = 'https://trn.la/api/producer/store_project'
-        self.url = QUrl(self.location)
-        self.data = QByteArray()
-        self.nam = QNetworkAccessManager()
-        self.request = QNetworkRequest(self.url)
-
-        self.multpart = QHttpMultiPart(QHttpMultiPart.FormDataType)
-        api_part = QHttpPart()
-        api_part.setHeader(QNetworkRequest.ContentDispositionHeader, "form-data; name=\"api_key\"")
-        api_part.setBody(self.preset().properties()["trnla_api_key"].encode())
-        self.multpart.append(api_part)
-
-        name_part = QHttpPart()
-        name_part.setHeader(QNetworkRequest.ContentDispositionHeader, "form-data; name=\"name\"")
-        name_part.setBody(self.preset().properties()["trnla_project_name"].encode())
-        self.multpart.append(name_part)
-
-        fps_part = QHttpPart()
-        fps_part.setHeader(QNetworkRequest.ContentDispositionHeader, "form-data; name=\"frame_rate\"")
-        fps_part.setBody(project_info[0].encode())
-        self.multpart.append(fps_part)
-
-        width_part = QHttpPart()
-        width_part.setHeader(QNetworkRequest.ContentDispositionHeader, "form-data; name=\"width\"")
-        width_part.setBody(project_info[1].encode())
-        self.multpart.append(width_part)
+        fields = [("api_key", self.preset().properties()["trnla_api_key"]),
+                  ("name", self.preset().properties()["trnla_project_name"]),
+                  ("frame_rate", project_info[0]),
+                  ("width", project_info[1]),
+                  ("height", project_info[2]),
+                  ("color_space", project_info[3])]
 
-        height_part = QHttpPart()
-        height_part.setHeader(QNetworkRequest.ContentDispositionHeader, "form-data; name=\"height\"")
-        height_part.setBody(project_info[2].encode())
-        self.multpart.append(height_part)
-
-        color_part = QHttpPart()
-        color_part.setHeader(QNetworkRequest.ContentDispositionHeader, "form-data; name=\"color_space\"")
-        color_part.setBody(project_info[3].encode())
-        self.multpart.append(color_part)
-
-
-        self.request.setHeader(QNetworkRequest.ContentTypeHeader,
-                                      'multipart/form-data; boundary=%s' % self.multpart.boundary())
-
-        self.customEventLoop = QEventLoop()
-        self.nam.finished.connect(self.readyRead)
-        self.nam.finished.connect(self.customEventLoop.quit)
-
-        self.reply = self.nam.post(self.request, self.multpart)
-        self.reply.error.connect(self.reply_error_occurred)
-
-        self.customEventLoop.exec_()
+        # the shots start rendering right away, their uploads wait for the project id
+        self.pending_project = TrnlaPendingProject(self.preset().properties()["trnla_project_name"])
+        self.create_project_span = self.timing.start("create_project", project=self.preset().properties()["trnla_project_name"])
+        self.reply = trnla_network().post_form_retrying("store_project", fields, name="project creation",
+                                                        idempotency_key=new_idempotency_key())
+        self.reply.finished.connect(self.readyRead)
 
     def TrnlaStartProcessing(self, exportItems, preview):
-        for (exportPath, preset) in self._exportTemplate.flatten():
-            if "trnla_upload" in preset.properties():
-                preset.properties()["trnla_upload"] = self.preset().properties()["trnla_upload"]
-                if "trnla_project_id" in preset.properties():
-                    preset.properties()["trnla_project_id"] = self.preset().properties()["trnla_project_id"]
-                    preset.properties()["trnla_new_project"] = self.preset().properties()["trnla_new_project"]
-                    preset.properties()["trnla_exist_project"] = self.preset().properties()["trnla_exist_project"]
-                    preset.properties()["trnla_project_name"] = self.preset().properties()["trnla_project_name"]
-                    preset.properties()["trnla_api_key"] = self.preset().properties()["trnla_api_key"]
+        setup_span = self.timing.start("setup", shots=len(exportItems))
+        self.plan.apply(self.preset().properties())
 
         exporters = FnShotProcessor.ShotProcessor.startProcessing(self, exportItems, preview)
         if self.preset().properties()["trnla_upload"]:
-            full_transcoders = []
-            prev_transcoders = []
-            for exporter in exporters:
-                if type(exporter) is TrnlaTranscodeExporter:
-                    full_transcoders.append(exporter)
-                elif type(exporter) is TrnlaPreviewTranscoder:
-                    prev_transcoders.append(exporter)
+            # every exporter of this run queues its upload on the shared scheduler
+            upload_scheduler().configure(self.preset().properties()["trnla_max_uploads"],
+                                         float(self.preset().properties()["trnla_bandwidth_limit"]) * 1024 * 1024)
+            full_transcoders, pairs = self.plan.pair_transcoders(exporters)
+            self.export_progress = TrnlaExportProgress(self.preset().properties()["trnla_verbose"])
+            registration = None
+            if full_transcoders and full_transcoders[0]._preset.properties()["trnla_batch_register"]:
+                registration = self.register_shots(full_transcoders)
             for full in full_transcoders:
-                item_id = full._item.guid()
-                for prev in prev_transcoders:
-                    if item_id == prev._item.guid():
-                        prev.notifier.preview_ready[str].connect(full.upload_shot)
+                full.export_progress = self.export_progress
+                full.verbose = self.preset().properties()["trnla_verbose"]
+                full.timing = self.timing
+                full.pending_project = self.pending_project
+                full.shot_registration = registration
+            for full, prev in pairs:
+                if full._preset.properties()["trnla_single_pass_preview"] and full.preview_task is None:
+                    # one render writes both, further previews of the shot still render on their own
+                    full.render_preview(prev)
+                if prev._preset.properties()["trnla_scrub"]:
+                    # connected first, so the poster and sprite go up before anything else
+                    prev.notifier.preview_ready[str].connect(full.upload_scrub)
+                if full._preset.properties()["trnla_separate_preview"]:
+                    if segments_enabled(prev._preset.properties()):
+                        # uploaded while it renders, the finished movie only ends the segments
+                        prev.notifier.preview_started[str].connect(full.upload_preview_segments)
+                        prev.notifier.preview_ready[str].connect(full.preview_encoded)
+                    else:
+                        prev.notifier.preview_ready[str].connect(full.upload_preview)
+                prev.notifier.preview_ready[str].connect(full.upload_shot)
+        setup_span.end(exporters=len(exporters))
+
+    def register_shots(self, full_transcoders):
+        # one request for every shot, once the project id is known
+        self.shot_registration = TrnlaShotRegistration(self.preset().properties()["trnla_api_key"],
+                                                       [full.shotName() for full in full_transcoders])
+        registration_span = self.timing.start("register_shots", shots=len(full_transcoders))
+        self.shot_registration.done.connect(lambda: registration_span.end(registered=len(self.shot_registration.shot_ids)))
+        if self.pending_project is None:
+            self.shot_registration.start(self.preset().properties()["trnla_project_id"])
+        else:
+            self.pending_project.resolved.connect(lambda: self.shot_registration.start(self.pending_project.project_id))
+            self.pending_project.failed.connect(lambda reason: self.shot_registration.finish())
+        return self.shot_registration
 
     def getSeqInfo(self, exportItems):
         """This code is mainly from FnExternalRender"""
@@ -475,11 +446,7 @@ class TrnlaShotProcessor(FnShotProcessor.ShotProcessor):
             return str(seq.framerate()), str(seq.format().width()), str(seq.format().height())
 
     def getColorSpace(self):
-        preset = None
-        for (exportPath, _preset) in self._exportTemplate.flatten():
-            if "trnla_project_id" in _preset.properties():
-                preset = _preset
-                break
+        preset = self.plan.full_presets[0] if self.plan.full_presets else None
 
         if preset:
             """This code is mainly from FnExternalRender.createWriteNode()"""
@@ -508,17 +475,8 @@ class TrnlaShotProcessor(FnShotProcessor.ShotProcessor):
                     if colourTransform in (None, "default"):
                             colourTransform = _mapDefaultColourTransform(preset, projectsettings)
                 if colourTransform is not None:
-                    # Little hack to get the name of the colourspace in case default was selected.
-                    w = nuke.createNode('Write')
-                    colorSpaces = w.knob('colorspace').values()
-                    nuke.delete(w)
-                    tabColourTransform = '\t' + colourTransform
-                    for cs in colorSpaces:
-                        if tabColourTransform in cs:
-                            _cs = cs.split('\t', 1)[1]
-                            colourTransform = getColorspaceFromProperty(_cs)
-                            break
-                    return colourTransform
+                    # the full name of the colourspace in case default was selected
+                    return colorspace_table().resolve(colourTransform, projectsettings)
             except Exception as e:
                 return "None"
         return "None"
@@ -527,14 +485,21 @@ class TrnlaShotProcessor(FnShotProcessor.ShotProcessor):
         if preview:
             return FnShotProcessor.ShotProcessor.startProcessing(self, exportItems, preview)
 
+        self.timing = TrnlaSpanRecorder(self.preset().properties()["trnla_timing_log"] or None,
+                                        self.preset().properties()["trnla_prometheus_textfile"] or None)
+
+        # every request of this run, project creation included, retries as many times
+        retry_policy().configure(self.preset().properties()["trnla_max_retries"])
+        self.plan = TrnlaExportPlan(self._exportTemplate)
         if not self.preset().properties()["trnla_upload"]:
-            self.findAndDeletePreview(self._exportTemplate.rootElement())
+            self.plan.prune_previews()
             self.TrnlaStartProcessing(exportItems, preview)
         else:
             if self.preset().properties()["trnla_new_project"]:
                 self.trnlaExportItems = exportItems
                 self.trnlaPreview = preview
                 self.create_project()
+                self.TrnlaStartProcessing(exportItems, preview)
             elif self.preset().properties()["trnla_exist_project"]:
                 self.TrnlaStartProcessing(exportItems, preview)
 
@@ -567,6 +532,18 @@ class TrnlaShotProcessorPreset(hiero.core.ProcessorPreset):
         self.properties()["trnla_project_names"] = []
         self.properties()["trnla_project_ids"] = []
         self.properties()["trnla_api_key"] = ""
+        self.properties()["trnla_max_uploads"] = DEFAULT_MAX_UPLOADS
+        # total upload bandwidth in MB/s for all media of the export, 0 for no limit
+        self.properties()["trnla_bandwidth_limit"] = 0
+        # times a request that failed on a dropped connection, a timeout or a 5xx is sent again
+        self.properties()["trnla_max_retries"] = DEFAULT_MAX_RETRIES
+        # per stage timing spans, as json lines and optionally a prometheus textfile. Off unless a path is
+        # set, the log is appended to by every export
+        self.properties()["trnla_timing_log"] = ""
+        self.properties()["trnla_prometheus_textfile"] = ""
+        # per shot progress lines, archive reports and frame counts in the script editor, for tracking down
+        # a slow export
+        self.properties()["trnla_verbose"] = False
 
         self.properties().update(properties)
 
@@ -574,17 +551,7 @@ class TrnlaShotProcessorPreset(hiero.core.ProcessorPreset):
         self.properties()["exportRoot"] = hiero.core.remapPath(self.properties()["exportRoot"])
 
     def get_org_dir(self):
-        TarantulaData = os.path.expanduser("~") + '/AppData/Local/Tarantula/'
-        configJsonFile = TarantulaData + 'config.json'
-        try:
-            with open(configJsonFile) as jsonFile:
-                config = json.load(jsonFile)
-                settings = config['settings']
-                job_dir = settings['organization_directory']
-
-                return job_dir.encode("ascii")
-        except Exception as err:
-            return ""
+        return trnla_config().org_dir()
 
     def addCustomResolveEntries(self, resolver):
         """addDefaultResolveEntries(self, resolver)
@@ -0,0 +1,62 @@
+# --------------------------Trn.la Plugin For Nuke Studio--------------------------------
+# Registers every shot of an export with trn.la in one request before the media is ready,
+# so the shots show up on trn.la straight away and the uploads only reference their ids.
+#
+# (c) 2021 Tarantula
+# Author: Moses Molina
+# ---------------------------------------------------------------------------------------
+
+import json
+
+from PySide2.QtNetwork import *
+from PySide2.QtCore import *
+
+from .TrnlaNetwork import trnla_network, new_idempotency_key
+
+
+class TrnlaShotRegistration(QObject):
+    """One shots/register call for the shots of a TrnlaShotProcessor run. If it fails the shots are
+    registered one by one by their uploads, as without batch registration."""
+    done = Signal()
+
+    def __init__(self, api_key, shot_names):
+        QObject.__init__(self)
+        self.api_key = api_key
+        self.shot_names = shot_names
+        self.shot_ids = {}
+        self.finished = False
+        self._reply = None
+
+    def start(self, project_id):
+        shots = [{"shot_name": name} for name in self.shot_names]
+        self._reply = trnla_network().post_form_retrying("shots/register", [("api_key", self.api_key),
+                                                                            ("project_id", project_id),
+                                                                            ("shots", json.dumps(shots))],
+                                                         name="shot registration",
+                                                         idempotency_key=new_idempotency_key())
+        self._reply.finished.connect(self._on_registered)
+
+    def shot_id(self, shot_name):
+        return self.shot_ids.get(shot_name)
+
+    def _on_registered(self, reply):
+        reply.deleteLater()
+        self._reply = None
+        if reply.error() == QNetworkReply.NoError:
+            try:
+                replyJson = json.loads(reply.readAll().data().decode('utf8'))
+            except ValueError:
+                replyJson = {}
+            if replyJson.get('success'):
+                for shot in replyJson.get('shots') or []:
+                    self.shot_ids[shot["shot_name"]] = shot["shot_id"]
+        else:
+            print("Trnla: shot registration failed: " + reply.errorString())
+        if len(self.shot_ids) < len(set(self.shot_names)):
+            print("Trnla: registered %d of %d shots, the rest register with their upload." % (
+                len(self.shot_ids), len(set(self.shot_names))))
+        self.finish()
+
+    def finish(self):
+        self.finished = True
+        self.done.emit()
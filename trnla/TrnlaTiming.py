@@ -0,0 +1,134 @@
+# --------------------------Trn.la Plugin For Nuke Studio--------------------------------
+# Timing spans for the stages of every shot (render, archive, project creation, upload).
+# Spans are appended to a JSON-lines log and can be summarised into a Prometheus
+# textfile for the node exporter.
+#
+# (c) 2021 Tarantula
+# Author: Moses Molina
+# ---------------------------------------------------------------------------------------
+
+import os
+import json
+import time
+import uuid
+import threading
+
+from .TrnlaConfig import replace_file
+
+# seconds between rewrites of the prometheus textfile, the spans of an export are summed up in between
+PROMETHEUS_INTERVAL = 5.0
+
+
+class TrnlaSpan(object):
+    def __init__(self, recorder, stage, shot, tags):
+        self.recorder = recorder
+        self.stage = stage
+        self.shot = shot
+        self.tags = tags
+        self.start = time.time()
+        self.end_time = None
+
+    def end(self, **tags):
+        """Ends the span once, later calls are ignored."""
+        if self.end_time is not None:
+            return
+        self.end_time = time.time()
+        self.tags.update(tags)
+        self.recorder._record(self)
+
+    def duration(self):
+        return (self.end_time or time.time()) - self.start
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.end(error=str(exc_value) if exc_value else None)
+
+
+class TrnlaSpanRecorder(object):
+    """Records the spans of one TrnlaShotProcessor run. Without a log path the spans are only kept in
+    memory."""
+    def __init__(self, log_path=None, prometheus_path=None):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.log_path = log_path
+        self.prometheus_path = prometheus_path
+        self.spans = []
+        # running per stage totals for the prometheus textfile
+        self.stages = {}
+        self.last_end = None
+        self._lock = threading.Lock()
+        self._prometheus_timer = None
+
+    def start(self, stage, shot=None, **tags):
+        return TrnlaSpan(self, stage, shot, tags)
+
+    def _record(self, span):
+        entry = {"run": self.run_id,
+                 "stage": span.stage,
+                 "shot": span.shot,
+                 "start": round(span.start, 3),
+                 "end": round(span.end_time, 3),
+                 "duration": round(span.end_time - span.start, 3)}
+        for key, value in span.tags.items():
+            if value is not None:
+                entry[key] = value
+        with self._lock:
+            self.spans.append(entry)
+            summary = self.stages.setdefault(entry["stage"], {"count": 0, "seconds": 0.0, "bytes": 0, "frames": 0})
+            summary["count"] += 1
+            summary["seconds"] += entry["duration"]
+            summary["bytes"] += int(entry.get("bytes") or 0)
+            summary["frames"] += int(entry.get("frames") or 0)
+            self.last_end = span.end_time
+            try:
+                if self.log_path:
+                    self._append_log(entry)
+            except (IOError, OSError) as err:
+                print("Trnla: could not write timing spans: " + str(err))
+            if self.prometheus_path and self._prometheus_timer is None:
+                # written once for all the spans that end in the next few seconds, off the UI thread
+                self._prometheus_timer = threading.Timer(PROMETHEUS_INTERVAL, self.write_prometheus)
+                self._prometheus_timer.daemon = True
+                self._prometheus_timer.start()
+
+    def _append_log(self, entry):
+        log_dir = os.path.dirname(self.log_path)
+        if log_dir and not os.path.exists(log_dir):
+            os.makedirs(log_dir)
+        with open(self.log_path, 'a') as log_file:
+            log_file.write(json.dumps(entry, sort_keys=True) + "\n")
+
+    def write_prometheus(self):
+        with self._lock:
+            self._prometheus_timer = None
+            stages = dict((stage, dict(summary)) for stage, summary in self.stages.items())
+            last_end = self.last_end
+        try:
+            self._write_prometheus(stages, last_end)
+        except (IOError, OSError) as err:
+            print("Trnla: could not write the prometheus textfile: " + str(err))
+
+    def _write_prometheus(self, stages, last_end):
+        lines = ["# HELP trnla_stage_duration_seconds Time spent per export stage in the last trnla export.",
+                 "# TYPE trnla_stage_duration_seconds summary"]
+        for stage, summary in sorted(stages.items()):
+            lines.append('trnla_stage_duration_seconds_sum{stage="%s"} %.3f' % (stage, summary["seconds"]))
+            lines.append('trnla_stage_duration_seconds_count{stage="%s"} %d' % (stage, summary["count"]))
+        lines.append("# HELP trnla_stage_bytes_total Bytes handled per export stage in the last trnla export.")
+        lines.append("# TYPE trnla_stage_bytes_total counter")
+        for stage, summary in sorted(stages.items()):
+            lines.append('trnla_stage_bytes_total{stage="%s"} %d' % (stage, summary["bytes"]))
+        lines.append("# HELP trnla_stage_frames_total Frames handled per export stage in the last trnla export.")
+        lines.append("# TYPE trnla_stage_frames_total counter")
+        for stage, summary in sorted(stages.items()):
+            lines.append('trnla_stage_frames_total{stage="%s"} %d' % (stage, summary["frames"]))
+        lines.append("# HELP trnla_last_span_timestamp_seconds When the last trnla span ended.")
+        lines.append("# TYPE trnla_last_span_timestamp_seconds gauge")
+        lines.append("trnla_last_span_timestamp_seconds %.3f" % last_end)
+
+        # write next to the target and rename so the collector never reads half a file
+        tmp_path = self.prometheus_path + ".tmp"
+        with open(tmp_path, 'w') as prom_file:
+            prom_file.write("\n".join(lines) + "\n")
+        replace_file(tmp_path, self.prometheus_path)
@@ -8,21 +8,41 @@
 
 import os
 import json
-import zipfile
 import re
 import copy
 
 import hiero.core
 import hiero.core.log as log
+import hiero.core.nuke as nuke
 
 from hiero.exporters import FnTranscodeExporter, FnTranscodeExporterUI, FnExternalRenderUI, FnExternalRender, FnAudioHelper
 
-from hiero.exporters.FnSubmission import Submission
-
 from PySide2.QtNetwork import *
 from PySide2.QtCore import *
 from PySide2.QtWidgets import *
 
+from .TrnlaNetwork import trnla_network, new_idempotency_key
+from .TrnlaChunkedUpload import TrnlaChunkedUpload, TrnlaFileSource
+from .TrnlaUploadScheduler import upload_scheduler
+from .TrnlaUploadWorker import upload_worker
+from .TrnlaFarmSubmission import announce_to_farm
+from .TrnlaScrub import poster_path, scrub_frames, build_sprite
+from .TrnlaPreviewSegments import TrnlaSegmentWatcher, movie_write_node, segment_dir, segment_info
+from .TrnlaRetry import retry_policy
+from .TrnlaArchive import (TrnlaArchiveStream, TrnlaCompressionPolicy, archive_workers, frame_members, hash_members,
+                           write_archive)
+from .TrnlaFrameDedup import TrnlaFrameUpload, build_manifest, frame_blob_name, frame_index
+from .TrnlaPipelinedUpload import TrnlaPipelinedUpload
+from .TrnlaProgress import TrnlaShotProgress, RENDER, ARCHIVE, UPLOAD
+from .TrnlaTiming import TrnlaSpanRecorder
+from .TrnlaProjectCache import account_key
+from .TrnlaUploadJournal import (upload_journal, UPLOADING, COMPLETED, FAILED, CANCELLED, MODE_STORE, MODE_CHUNKED,
+                                 MODE_STREAM, MODE_MANIFEST)
+
+
+# the node both Write nodes of a single pass render read from
+SHARED_TREE = "trnla_shared_tree"
+
 
 class TrnlaTranscodeExporter(FnTranscodeExporter.TranscodeExporter):
     def __init__(self, initDict):
@@ -36,6 +56,52 @@ class TrnlaTranscodeExporter(FnTranscodeExporter.TranscodeExporter):
         self.ext = ""
         self.upload_progress = 0.0
         self.upload_reply = None
+        self.chunked_upload = None
+        self.prev_file = None
+        self.zip_file = None
+        self.archive_policy = None
+        self.upload_ticket = None
+        self.manifest = None
+        self.frame_hashes = []
+        # the rendered file of every hash, in the same order
+        self.frame_paths = []
+        self.waiting_for_frames = None
+        self.frame_upload = None
+        self.pipelined_upload = None
+        self.shot_id = None
+        self.preview_pending = False
+        self.preview_upload_file = None
+        self.store_after_preview = None
+        self.export_progress = None
+        self.shot_progress = None
+        self.archive_total = 0
+        # set by the processor when the project is still being created on trn.la
+        self.pending_project = None
+        self.shot_registration = None
+        self.waiting_for_project = []
+        self.preview_stored = False
+        self.journal_id = None
+        self.store_key = None
+        # set when the export renders on the farm
+        self.farm_render = None
+        # a preview this render writes as well, see render_preview
+        self.preview_task = None
+        self.preview_sent = False
+        self.scrub_pending = False
+        self.after_scrub = []
+        # a preview uploaded in segments while it renders
+        self.segment_watcher = None
+        self.segment_queue = []
+        self.segment_sending = False
+        self.segments_sent = 0
+        # the processor hands every exporter of a run the same recorder
+        self.timing = TrnlaSpanRecorder()
+        # set by the processor, per shot diagnostics in the script editor
+        self.verbose = False
+        self.render_span = None
+        self.queue_span = None
+        self.upload_span = None
+        self.archive_span = None
         self._shot_name = None
 
     def startTask(self):
@@ -47,9 +113,130 @@ class TrnlaTranscodeExporter(FnTranscodeExporter.TranscodeExporter):
             return
         else:
             self._shot_name = self.shotName()
+            if self.export_progress:
+                self.shot_progress = self.export_progress.add_shot(self._shot_name)
+            else:
+                self.shot_progress = TrnlaShotProgress(self._shot_name)
             self.fullFilePath = self.resolvedExportPath()
             self.fileDir, self.fullFileName = os.path.split(self.fullFilePath)
+            self.render_span = self.timing.start("render", self._shot_name, frames=self.frame_count())
+            announce_to_farm(self)
             FnTranscodeExporter.TranscodeExporter.startTask(self)
+            if self.preview_task is not None:
+                self.preview_task.render_started()
+            # render nodes upload their own frames
+            if (self._preset.properties()["trnla_upload"] and self._preset.properties()["trnla_pipelined_upload"]
+                    and self.farm_render is None):
+                self.when_project_ready(self.start_pipelined_upload)
+
+    def when_project_ready(self, start):
+        # renders don't wait for the new project or the shot registration, only the uploads do
+        pending = self.pending_project
+        registration = self.shot_registration
+        if pending is not None and pending.error is not None:
+            self.project_failed(pending.error)
+        elif pending is not None and pending.project_id is None:
+            self.wait_for_project(start, pending.resolved)
+        elif registration is not None and not registration.finished:
+            self.wait_for_project(start, registration.done)
+        else:
+            if pending is not None:
+                # usually resolved before the render is done, without this exporter having waited on it
+                self._preset.properties()["trnla_project_id"] = pending.project_id
+            if registration is not None and not self.shot_id:
+                self.shot_id = registration.shot_id(self._shot_name)
+            start()
+
+    def wait_for_project(self, start, signal):
+        if not self.waiting_for_project:
+            signal.connect(self.on_project_ready)
+            if self.pending_project is not None:
+                self.pending_project.failed.connect(self.project_failed)
+        self.waiting_for_project.append(start)
+
+    def on_project_ready(self):
+        waiting, self.waiting_for_project = self.waiting_for_project, []
+        for start in waiting:
+            self.when_project_ready(start)
+
+    def project_failed(self, reason):
+        self.waiting_for_project = []
+        if self.farm_render is not None and not self.farm_render.submitted:
+            # still rendered, there is just nothing to upload the frames to
+            self.farm_render.submit(None)
+        if self.upload_started and not self.uploaded:
+            self.chunked_upload_failed("the trn.la project could not be created: " + reason)
+
+    def render_preview(self, preview):
+        """Writes the movie of preview from this render, so the source frames are read and transformed
+        once for both."""
+        self.preview_task = preview
+        preview.rendered_by = self
+
+    def addWriteNodeToScript(self, script, rootNode, framerate):
+        if self.preview_task is None:
+            return FnTranscodeExporter.TranscodeExporter.addWriteNodeToScript(self, script, rootNode, framerate)
+        # both Write nodes hang off the same read and effects tree
+        script.addNode(nuke.SetNode(SHARED_TREE, 0))
+        FnTranscodeExporter.TranscodeExporter.addWriteNodeToScript(self, script, rootNode, framerate)
+        script.addNode(nuke.PushNode(SHARED_TREE))
+        script.addNode(self.preview_write_node())
+        self.preview_task.add_preview_branches(script, SHARED_TREE, framerate)
+
+    def preview_write_node(self):
+        path = self.preview_task.resolvedExportPath()
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        # the codec settings of the preview preset, as the preview's own render would set them
+        writeNode = movie_write_node(self.preview_task._preset.properties(), path)
+        writeNode.setName("Write_trnla_preview")
+        return writeNode
+
+    def preview_rendered(self):
+        # after finishTask has returned, the preview starts the upload like the preview's own render would
+        path = self.preview_task.resolvedExportPath()
+        QTimer.singleShot(0, lambda: self.preview_task.notifier.notify_uploader(path))
+
+    def submit_to_farm(self, submit):
+        """Called by the farm render with the function that queues its tickets."""
+        if self._preset.properties()["trnla_upload"] and self._preset.properties()["trnla_api_key"] != "none":
+            # the render nodes need the project to upload the frames to
+            self.when_project_ready(lambda: submit(self.farm_upload()))
+        else:
+            submit(None)
+
+    def farm_upload(self):
+        # no api key, the tickets sit in a shared folder and the nodes upload with their own
+        return {"project_id": self._preset.properties()["trnla_project_id"],
+                "shot_name": self._shot_name,
+                "max_retries": retry_policy().max_retries}
+
+    def when_rendered(self, start):
+        # on the farm the preview can be done before every range of the full quality media
+        if self.farm_render is not None and not self.farm_render.finished:
+            self.farm_render.done.connect(start)
+        else:
+            start()
+
+    def start_pipelined_upload(self):
+        # send frames as soon as they are written, the rest follows when the preview is ready
+        self.root, self.ext = os.path.splitext(self.fullFileName)
+        self.pipelined_upload = TrnlaPipelinedUpload(self._preset.properties()["trnla_api_key"],
+                                                     self._preset.properties()["trnla_project_id"],
+                                                     self._shot_name, self.fileDir, self.ext,
+                                                     scheduler=upload_scheduler(),
+                                                     workers=self.archive_workers())
+        self.pipelined_upload.uploadProgress.connect(self.onUploadProgress)
+        self.pipelined_upload.failed.connect(self.chunked_upload_failed)
+        self.pipelined_upload.start()
+        self.shot_progress.skip(ARCHIVE)
+
+    def frame_count(self):
+        try:
+            start, end = self.outputRange()
+            return end - start + 1
+        except Exception:
+            return 1
 
     def progress(self):
         if self._preset.properties()["trnla_upload"]:
@@ -59,98 +246,610 @@ class TrnlaTranscodeExporter(FnTranscodeExporter.TranscodeExporter):
                 _p = FnTranscodeExporter.TranscodeExporter.progress(self)
                 if _p > 1.0:
                     _p = 1.0
-                return (_p / 2.0) + (self.upload_progress / 2.05)
+                if self.shot_progress is None:
+                    return _p / 2.0
+                # every stage is weighted by how long it is taking, not by a fixed share
+                frames = self.frame_count()
+                self.shot_progress.stage(RENDER).update(_p * frames, frames)
+                if self.archive_policy and self.archive_total:
+                    self.shot_progress.stage(ARCHIVE).update(self.archive_policy.stats.bytes_in, self.archive_total)
+                # the shot isn't done until trn.la has stored it
+                return min(self.shot_progress.fraction(), 0.99)
         else:
             return float(FnTranscodeExporter.TranscodeExporter.progress(self))
 
-    def zipdir(self, path, ziph):
-        # ziph is zipfile handle
-        for root, dirs, files in os.walk(path):
-            for file in files:
-                file_root, ext = os.path.splitext(file)
-                if ext == self.ext:
-                    file_to_write = os.path.join(root, file)
-                    ziph.write(file_to_write, os.path.basename(file_to_write))
+    def archive_members(self):
+        # frames of the shot in frame order, as (path, name in the archive)
+        return frame_members(self.fileDir, self.ext)
+
+    def update_journal(self, **fields):
+        if self.journal_id:
+            upload_journal().update(self.journal_id, **fields)
 
     def upload_finished(self, reply):
         self.uploaded = True
         self._finished = True
-        self.prev_file.close()
-        self.zip_file.close()
+        if reply is not None and reply.error() == QNetworkReply.NoError:
+            self.update_journal(state=COMPLETED)
+        else:
+            self.update_journal(state=FAILED, error=self.error() or (reply.errorString() if reply else None))
+        if self.upload_span:
+            self.upload_span.end(bytes=self.shot_progress.stage(UPLOAD).total if self.shot_progress else None,
+                                 success=reply is not None and reply.error() == QNetworkReply.NoError)
+        if self.shot_progress:
+            self.shot_progress.completed = True
+        if self.manifest:
+            frame_index().release(self, stored=reply is not None and reply.error() == QNetworkReply.NoError)
+        if self.upload_ticket:
+            upload_scheduler().release(self.upload_ticket)
+        if self.farm_render is not None:
+            self.farm_render.clean_up()
+        if self.prev_file:
+            self.prev_file.close()
+        if self.zip_file:
+            self.zip_file.close()
+        if self.archive_policy and self.verbose:
+            print(self.archive_policy.report(self._shot_name))
 
     def onUploadProgress(self, bytes_sent, bytes_total):
         if bytes_total:
             self.upload_progress = float(bytes_sent) / bytes_total
+            if self.shot_progress:
+                self.shot_progress.stage(UPLOAD).update(bytes_sent, bytes_total)
+
+    def archive_workers(self):
+        return archive_workers(int(self._preset.properties()["trnla_archive_workers"]))
+
+    def zip_path(self):
+        zipPath = os.path.join(os.path.dirname(self.fileDir), os.path.basename(os.path.normpath(self.fileDir)) + '.zip')
+        return zipPath.replace('\\', '/')
+
+    def archive_shot(self, members):
+        zipPath = self.zip_path()
+        write_archive(zipPath, members, self.archive_policy, self.archive_workers())
+        self.end_archive_span()
+        return zipPath
+
+    def end_archive_span(self):
+        if self.archive_span and self.archive_policy:
+            self.archive_span.end(compressed_bytes=self.archive_policy.stats.bytes_out,
+                                  compression=self.archive_policy.method)
+
+    def upload_priority(self):
+        # a "Trnla Priority" tag on the shot, with a number as its note, moves it up the upload queue
+        try:
+            for tag in self._item.tags():
+                if tag.name().lower() == "trnla priority":
+                    return int(tag.note())
+        except (AttributeError, ValueError):
+            pass
+        return 0
+
+    def upload_preview(self, prev_file_path):
+        self.when_project_ready(lambda: self.send_preview(prev_file_path))
+
+    def upload_scrub(self, prev_file_path):
+        # poster and sprite are tiny, they go up before the preview and the rest wait for the shot id
+        if not os.path.exists(poster_path(prev_file_path)) or not scrub_frames(prev_file_path):
+            print("Trnla: no poster or thumbnails were rendered for " + self._shot_name + ".")
+            return
+        self.scrub_pending = True
+        self.when_project_ready(lambda: self.send_scrub(prev_file_path))
+
+    def send_scrub(self, prev_file_path):
+        sprite = build_sprite(scrub_frames(prev_file_path))
+        try:
+            with open(poster_path(prev_file_path), 'rb') as poster_file:
+                poster = poster_file.read()
+        except (IOError, OSError):
+            poster = None
+        if sprite is None or poster is None:
+            print("Trnla: could not read the thumbnails of " + self._shot_name + ", skipping the scrub sprite.")
+            self.scrub_done()
+            return
+        sprite_data, layout = sprite
+        self.scrub_span = self.timing.start("scrub_upload", self._shot_name, bytes=len(poster) + len(sprite_data))
+        fields = [("api_key", self._preset.properties()["trnla_api_key"]),
+                  ("project_id", self._preset.properties()["trnla_project_id"]),
+                  ("shot_name", self._shot_name),
+                  ("sprite_layout", json.dumps(layout))]
+        if self.shot_id:
+            fields.append(("shot_id", self.shot_id))
+        request = trnla_network().post_form_retrying("store_scrub", fields,
+                                                     [("poster_file", "poster.jpg", poster),
+                                                      ("sprite_file", "sprite.jpg", sprite_data)],
+                                                     name="scrub upload of " + self._shot_name,
+                                                     idempotency_key=new_idempotency_key(),
+                                                     scheduler=upload_scheduler())
+        request.finished.connect(self.on_scrub_stored)
+
+    def on_scrub_stored(self, reply):
+        self.scrub_span.end(success=reply.error() == QNetworkReply.NoError)
+        stored = False
+        if reply.error() == QNetworkReply.NoError:
+            try:
+                replyJson = json.loads(reply.readAll().data().decode('utf8'))
+                if replyJson.get('success'):
+                    self.shot_id = replyJson.get('shot_id') or self.shot_id
+                    self.update_journal(shot_id=self.shot_id)
+                    stored = True
+            except ValueError:
+                pass
+        reply.deleteLater()
+        if not stored:
+            # not worth failing the shot over
+            print("Trnla: scrub sprite upload failed for " + self._shot_name + ": " + reply.errorString())
+        self.scrub_done()
+
+    def scrub_done(self):
+        self.scrub_pending = False
+        waiting, self.after_scrub = self.after_scrub, []
+        for start in waiting:
+            start()
+
+    def send_preview(self, prev_file_path):
+        # the preview goes up on its own, right away, so the shot can be reviewed before the full
+        # quality media arrives
+        if self.scrub_pending:
+            self.after_scrub.append(lambda: self.send_preview(prev_file_path))
+            return
+        self.preview_upload_file = QFile(prev_file_path)
+        if not self.preview_upload_file.open(QIODevice.ReadOnly):
+            print('failed to open mp4 preview')
+            return
+        self.preview_pending = True
+        self.preview_span = self.timing.start("preview_upload", self._shot_name,
+                                              bytes=os.path.getsize(prev_file_path))
+        fields = [("api_key", self._preset.properties()["trnla_api_key"]),
+                  ("project_id", self._preset.properties()["trnla_project_id"]),
+                  ("shot_name", self._shot_name)]
+        if self.shot_id:
+            fields.append(("shot_id", self.shot_id))
+        request = trnla_network().post_form_retrying("store_preview", fields,
+                                                     [("preview_file", os.path.basename(prev_file_path),
+                                                       self.preview_upload_file)],
+                                                     name="preview upload of " + self._shot_name,
+                                                     idempotency_key=new_idempotency_key(),
+                                                     scheduler=upload_scheduler())
+        request.finished.connect(self.on_preview_stored)
+
+    def on_preview_stored(self, reply):
+        self.preview_span.end(success=reply.error() == QNetworkReply.NoError)
+        self.preview_upload_file.close()
+        if reply.error() == QNetworkReply.NoError:
+            try:
+                replyJson = json.loads(reply.readAll().data().decode('utf8'))
+                if replyJson.get('success'):
+                    self.shot_id = replyJson.get('shot_id') or self.shot_id
+                    self.preview_stored = True
+                    self.update_journal(shot_id=self.shot_id, preview_stored=True)
+            except ValueError:
+                pass
+        else:
+            print("reply error (" + self._shot_name + ") :" + reply.errorString())
+        reply.deleteLater()
+        if not self.preview_stored:
+            print("Trnla: preview upload failed for " + self._shot_name + ", sending it with the full quality media.")
+        self.preview_done()
+
+    def preview_done(self):
+        self.preview_pending = False
+        if self.store_after_preview:
+            store, self.store_after_preview = self.store_after_preview, None
+            store()
+
+    def upload_preview_segments(self, prev_file_path):
+        # every segment goes up as soon as it is encoded, most of the preview is on trn.la when the render ends
+        self.segment_watcher = TrnlaSegmentWatcher(segment_dir(prev_file_path))
+        self.segment_watcher.segmentReady.connect(self.queue_segment)
+        self.segment_watcher.failed.connect(self.segments_failed)
+        # None marks the end of the preview
+        self.segment_watcher.done.connect(lambda: self.queue_segment(None))
+        self.preview_pending = True
+        self.preview_span = self.timing.start("preview_upload", self._shot_name, segmented=True)
+        self.segment_watcher.start()
+
+    def preview_encoded(self, prev_file_path):
+        if self.segment_watcher is not None:
+            self.segment_watcher.finish()
+
+    def queue_segment(self, path):
+        self.segment_queue.append(path)
+        if not self.segment_sending:
+            self.segment_sending = True
+            self.when_project_ready(self.send_next_segment)
+
+    def send_next_segment(self):
+        # one at a time, the first segment creates the shot the others are added to
+        if self.segment_watcher is None:
+            return
+        if self.scrub_pending:
+            self.after_scrub.append(self.send_next_segment)
+            return
+        if not self.segment_queue:
+            self.segment_sending = False
+            return
+        path = self.segment_queue.pop(0)
+        fields = [("api_key", self._preset.properties()["trnla_api_key"]),
+                  ("project_id", self._preset.properties()["trnla_project_id"]),
+                  ("shot_name", self._shot_name)]
+        if self.shot_id:
+            fields.append(("shot_id", self.shot_id))
+        if path is None:
+            fields.append(("segments", str(self.segments_sent)))
+            request = trnla_network().post_form_retrying("preview/complete", fields,
+                                                         name="preview of " + self._shot_name)
+            request.finished.connect(self.on_segments_completed)
+            return
+        index, first, last = segment_info(path)
+        try:
+            with open(path, 'rb') as segment_file:
+                data = segment_file.read()
+        except (IOError, OSError) as err:
+            self.segments_failed("could not read %s: %s" % (os.path.basename(path), err))
+            return
+        fields += [("index", str(index)), ("first", str(first)), ("last", str(last))]
+        request = trnla_network().post_form_retrying("preview/segment", fields,
+                                                     [("segment_file", os.path.basename(path), data)],
+                                                     name="preview segment %d of %s" % (index, self._shot_name),
+                                                     idempotency_key=new_idempotency_key(),
+                                                     scheduler=upload_scheduler())
+        request.finished.connect(self.on_segment_stored)
+
+    def segment_reply_ok(self, reply):
+        ok = False
+        if reply.error() == QNetworkReply.NoError:
+            try:
+                replyJson = json.loads(reply.readAll().data().decode('utf8'))
+                if replyJson.get('success'):
+                    self.shot_id = replyJson.get('shot_id') or self.shot_id
+                    ok = True
+            except ValueError:
+                pass
+        reply.deleteLater()
+        return ok
+
+    def on_segment_stored(self, reply):
+        error = reply.errorString()
+        if not self.segment_reply_ok(reply):
+            self.segments_failed(error)
+            return
+        self.segments_sent += 1
+        self.send_next_segment()
 
-    def reply_error_occurred(self, err):
-        print("reply error (" + self._shot_name + ") :" + str(err))
+    def on_segments_completed(self, reply):
+        error = reply.errorString()
+        if not self.segment_reply_ok(reply):
+            self.segments_failed(error)
+            return
+        self.segment_watcher = None
+        self.preview_stored = True
+        self.update_journal(shot_id=self.shot_id, preview_stored=True)
+        self.preview_span.end(success=True, segments=self.segments_sent)
+        self.preview_done()
+
+    def segments_failed(self, reason):
+        self.segment_watcher.stop()
+        self.segment_watcher = None
+        self.segment_queue = []
+        self.preview_span.end(success=False, segments=self.segments_sent)
+        print("Trnla: segmented preview upload failed for " + self._shot_name + " (" + reason +
+              "), sending the preview with the full quality media.")
+        self.preview_done()
 
     def upload_shot(self, prev_file_path):
-        self.net_man = QNetworkAccessManager()
-        self.net_man.finished[QNetworkReply].connect(self.upload_finished)
         self.upload_started = True
-        # zip the files
+        self.when_project_ready(lambda: self.when_rendered(lambda: self.queue_upload(prev_file_path)))
+
+    def queue_upload(self, prev_file_path):
+        # recorded so the upload can be resumed if Nuke Studio closes before it is done
+        # the same store is never acted on twice, resumed or not
+        self.store_key = new_idempotency_key()
+        self.journal_id = upload_journal().add(self._shot_name,
+                                               store_key=self.store_key,
+                                               account=account_key(self._preset.properties()["trnla_api_key"]),
+                                               project_id=self._preset.properties()["trnla_project_id"],
+                                               shot_id=self.shot_id,
+                                               preview_stored=self.preview_stored,
+                                               prev_file=prev_file_path,
+                                               file_dir=self.fileDir,
+                                               ext=os.path.splitext(self.fullFileName)[1])
+        # queue the upload, the scheduler starts it once a slot is free
+        self.queue_span = self.timing.start("upload_queue", self._shot_name)
+        self.upload_ticket = upload_scheduler().submit(lambda ticket: self.begin_upload(prev_file_path),
+                                                       self.upload_priority(), self._shot_name)
+
+    def begin_upload(self, prev_file_path):
+        self.queue_span.end()
+        self.update_journal(state=UPLOADING)
         self.root, self.ext = os.path.splitext(self.fullFileName)
+        members = self.archive_members()
+        self.upload_span = self.timing.start("upload", self._shot_name, frames=len(members))
+        if self.farm_render is not None and self.farm_render.error():
+            self.chunked_upload_failed(self.farm_render.error())
+        elif self.farm_render is not None and self.farm_render.uploaded():
+            self.store_farm_frames(members, prev_file_path)
+        elif self.pipelined_upload:
+            self.pipelined_upload.finished.connect(lambda manifest: self.on_pipelined_upload_done(manifest, prev_file_path))
+            self.pipelined_upload.finish()
+        else:
+            self.upload_frames(members, prev_file_path)
 
-        zipPath = os.path.join(os.path.dirname(self.fileDir), os.path.basename(os.path.normpath(self.fileDir)) + '.zip')
-        zipPath = zipPath.replace('\\', '/')
-        zipf = zipfile.ZipFile(zipPath, 'w', zipfile.ZIP_DEFLATED)
-        self.zipdir(self.fileDir + '/', zipf)
-        zipf.close()
-
-        # upload
-        self.multpart = QHttpMultiPart(QHttpMultiPart.FormDataType)
-        api_part = QHttpPart()
-        api_part.setHeader(QNetworkRequest.ContentDispositionHeader, "form-data; name=\"api_key\"")
-        api_part.setBody(self._preset.properties()["trnla_api_key"].encode())
-        self.multpart.append(api_part)
-
-        proj_id_part = QHttpPart()
-        proj_id_part.setHeader(QNetworkRequest.ContentDispositionHeader, "form-data; name=\"project_id\"")
-        proj_id_part.setBody(str(self._preset.properties()["trnla_project_id"]).encode())
-        self.multpart.append(proj_id_part)
-
-        shot_name_part = QHttpPart()
-        shot_name_part.setHeader(QNetworkRequest.ContentDispositionHeader, "form-data; name=\"shot_name\"")
-        shot_name_part.setBody(self._shot_name)
-        self.multpart.append(shot_name_part)
-
-        self.zip_file = QFile(zipPath)
-        if not self.zip_file.open(QIODevice.ReadOnly):
-            print('failed to open zip')
-            return
-        shot_file_part = QHttpPart()
-        shot_file_part.setHeader(QNetworkRequest.ContentDispositionHeader,
-                                 "form-data; name=\"shot_file\"; filename=\"" + zipPath + "\"")
-        shot_file_part.setBodyDevice(self.zip_file)
-        self.multpart.append(shot_file_part)
-
-        self.prev_file = QFile(prev_file_path)
-        if not self.prev_file.open(QIODevice.ReadOnly):
-            print('failed to open mp4 preview')
+    def upload_frames(self, members, prev_file_path):
+        if self._preset.properties()["trnla_dedup_frames"]:
+            self.request_missing_frames(members, prev_file_path)
+        else:
+            self.send_archive(members, prev_file_path)
+
+    def request_missing_frames(self, members, prev_file_path):
+        # ask trn.la which of the rendered frames it already has
+        with self.timing.start("hash_frames", self._shot_name, frames=len(members)):
+            hashes = hash_members(members, self.archive_workers())
+        self.frame_hashes = hashes
+        self.frame_paths = [path for path, arcname in members]
+        self.manifest = build_manifest(members, hashes)
+        self.update_journal(dedup=True, manifest=self.manifest)
+        unique_hashes = sorted(set(hashes))
+        self.lookup_span = self.timing.start("frame_lookup", self._shot_name, frames=len(unique_hashes))
+        request = trnla_network().post_form_retrying("frames/missing",
+                                                     [("api_key", self._preset.properties()["trnla_api_key"]),
+                                                      ("project_id", self._preset.properties()["trnla_project_id"]),
+                                                      ("hashes", json.dumps(unique_hashes))],
+                                                     name="frame lookup of " + self._shot_name)
+        request.finished.connect(lambda reply: self.on_missing_frames(reply, members, prev_file_path))
+
+    def on_missing_frames(self, reply, members, prev_file_path):
+        self.lookup_span.end()
+        missing = None
+        if reply.error() == QNetworkReply.NoError:
+            try:
+                replyJson = json.loads(reply.readAll().data().decode('utf8'))
+                if replyJson.get('success'):
+                    missing = set(replyJson.get('missing', []))
+            except ValueError:
+                pass
+        reply.deleteLater()
+        if missing is None:
+            print("Trnla: frame lookup failed for " + self._shot_name + ", uploading every frame.")
+            self.manifest = None
+            self.update_journal(dedup=False, manifest=None)
+            self.send_archive(members, prev_file_path)
             return
-        prev_file_part = QHttpPart()
-        prev_file_part.setHeader(QNetworkRequest.ContentDispositionHeader,
-                                 "form-data; name=\"preview_file\"; filename=\"" + os.path.basename(prev_file_path) + "\"")
-        prev_file_part.setBodyDevice(self.prev_file)
-        self.multpart.append(prev_file_part)
 
-        url = "https://trn.la/api/producer/store"
-        self.upload_request = QNetworkRequest(url)
-        self.upload_request.setHeader(QNetworkRequest.ContentTypeHeader,
-                                      'multipart/form-data; boundary=%s' % self.multpart.boundary())
+        # frames another shot of this export is already sending are only referenced
+        claimed = set(frame_index().claim([h for h in self.frame_hashes if h in missing], self))
+        new_members = []
+        for (path, arcname), frame_hash in zip(members, self.frame_hashes):
+            if frame_hash in claimed:
+                new_members.append((path, frame_blob_name(frame_hash, path)))
+                claimed.discard(frame_hash)
+        if self.verbose:
+            print("Trnla: %s needs %d of %d frames." % (self._shot_name, len(new_members), len(members)))
+        if new_members:
+            self.send_archive(new_members, prev_file_path)
+        else:
+            self.upload_progress = 1.0
+            if self.shot_progress:
+                self.shot_progress.skip(ARCHIVE)
+            self.update_journal(mode=MODE_MANIFEST)
+            self.store_shot(prev_file_path)
+
+    def on_pipelined_upload_done(self, manifest, prev_file_path):
+        self.manifest = manifest
+        self.frame_hashes = [self.pipelined_upload.hashes[path] for path in self.pipelined_upload.frames]
+        self.frame_paths = list(self.pipelined_upload.frames)
+        self.update_journal(mode=MODE_MANIFEST, dedup=True, manifest=manifest)
+        self.store_shot(prev_file_path)
+
+    def store_farm_frames(self, members, prev_file_path):
+        # the render nodes uploaded the frames, only the manifest is left to send
+        hashes = self.farm_render.frame_hashes()
+        if not members or any(os.path.basename(path) not in hashes for path, arcname in members):
+            print("Trnla: the farm didn't upload every frame of " + self._shot_name + ", uploading them from here.")
+            self.upload_frames(members, prev_file_path)
+            return
+        self.frame_hashes = [hashes[os.path.basename(path)] for path, arcname in members]
+        self.frame_paths = [path for path, arcname in members]
+        self.manifest = build_manifest(members, self.frame_hashes)
+        self.update_journal(mode=MODE_MANIFEST, dedup=True, manifest=self.manifest)
+        self.upload_progress = 1.0
+        if self.shot_progress:
+            self.shot_progress.skip(ARCHIVE)
+        self.store_shot(prev_file_path)
+
+    def send_archive(self, members, prev_file_path):
+        self.archive_total = sum(os.path.getsize(path) for path, arcname in members)
+        self.archive_policy = TrnlaCompressionPolicy.from_preset(self._preset.properties())
+        self.archive_policy.choose(members)
+        # a streamed archive is done when its upload is
+        self.archive_span = self.timing.start("archive", self._shot_name, frames=len(members), bytes=self.archive_total,
+                                              streaming=bool(self._preset.properties()["trnla_stream_archive"]))
+
+        if self._preset.properties()["trnla_upload_worker"] and self.send_to_worker(members, prev_file_path):
+            return
+        if self._preset.properties()["trnla_stream_archive"]:
+            # build the zip while it uploads, nothing is written next to the render
+            zipName = os.path.basename(os.path.normpath(self.fileDir)) + '.zip'
+            self.update_journal(mode=MODE_STREAM, compression=self.archive_policy.method,
+                                chunk_size=self.chunk_size())
+            self.start_chunked_upload(TrnlaArchiveStream(members, self.archive_policy, self.archive_workers()),
+                                      zipName, prev_file_path)
+        elif self._preset.properties()["trnla_chunked_upload"] or upload_scheduler().bandwidth_limit:
+            # under a bandwidth cap, chunks keep the upload even instead of sending the whole archive in one burst
+            zipPath = self.archive_shot(members)
+            self.update_journal(mode=MODE_CHUNKED, zip_path=zipPath, compression=self.archive_policy.method,
+                                chunk_size=self.chunk_size())
+            self.start_chunked_upload(TrnlaFileSource(zipPath), os.path.basename(zipPath), prev_file_path)
+        else:
+            zipPath = self.archive_shot(members)
+            self.update_journal(mode=MODE_STORE, zip_path=zipPath, compression=self.archive_policy.method)
+            self.store_shot(prev_file_path, zipPath=zipPath)
+
+    def send_to_worker(self, members, prev_file_path):
+        """Archives and uploads the shot in the upload worker process. Returns False when the worker
+        isn't available and the shot has to go up from Nuke Studio."""
+        worker = upload_worker()
+        if worker is None:
+            return False
+        streaming = bool(self._preset.properties()["trnla_stream_archive"])
+        # the worker always sends chunks, a zip on disk is kept for resuming
+        zipPath = None if streaming else self.zip_path()
+        zipName = os.path.basename(os.path.normpath(self.fileDir)) + '.zip'
+        worker_job = worker.submit(members=members,
+                                   compression=self.archive_policy.method,
+                                   workers=self.archive_workers(),
+                                   zip_path=zipPath,
+                                   file_name=zipName,
+                                   chunk_size=self.chunk_size(),
+                                   bandwidth_limit=upload_scheduler().bandwidth_limit,
+                                   max_retries=retry_policy().max_retries,
+                                   api_key=self._preset.properties()["trnla_api_key"],
+                                   project_id=self._preset.properties()["trnla_project_id"],
+                                   shot_name=self._shot_name)
+        if worker_job is None:
+            return False
+        self.update_journal(mode=MODE_STREAM if streaming else MODE_CHUNKED, zip_path=zipPath,
+                            compression=self.archive_policy.method, chunk_size=self.chunk_size())
+        worker_job.archived.connect(self.on_worker_archived)
+        worker_job.uploadProgress.connect(lambda bytes_sent, bytes_total: self.on_worker_progress(worker_job))
+        self.run_chunked_upload(worker_job, prev_file_path)
+        return True
+
+    def on_worker_progress(self, worker_job):
+        self.archive_policy.stats.bytes_in = worker_job.archived_bytes
+
+    def on_worker_archived(self, method, bytes_in, bytes_out, cpu_seconds, stored_bytes):
+        # the archive stats come back from the worker, for the progress and the archive report
+        self.archive_policy.method = method
+        stats = self.archive_policy.stats
+        stats.bytes_in = bytes_in
+        stats.bytes_out = bytes_out
+        stats.cpu_seconds = cpu_seconds
+        stats.stored_bytes = stored_bytes
+
+    def chunk_size(self):
+        return int(self._preset.properties()["trnla_chunk_size"]) * 1024 * 1024
+
+    def start_chunked_upload(self, source, file_name, prev_file_path):
+        self.run_chunked_upload(TrnlaChunkedUpload(self._preset.properties()["trnla_api_key"],
+                                                   self._preset.properties()["trnla_project_id"],
+                                                   self._shot_name, source, file_name, self.chunk_size(),
+                                                   scheduler=upload_scheduler()), prev_file_path)
+
+    def run_chunked_upload(self, chunked_upload, prev_file_path):
+        # a TrnlaChunkedUpload, or a TrnlaWorkerJob which has the same signals
+        self.chunked_upload = chunked_upload
+        self.chunked_upload.uploadProgress.connect(self.onUploadProgress)
+        self.chunked_upload.acknowledged.connect(lambda upload_id, offset: self.update_journal(upload_id=upload_id,
+                                                                                                offset=offset))
+        self.chunked_upload.finished.connect(lambda upload_id: self.store_shot(prev_file_path, upload_id=upload_id))
+        self.chunked_upload.failed.connect(self.chunked_upload_failed)
+        self.chunked_upload.start()
+
+    def chunked_upload_failed(self, reason):
+        self.setError("Trnla: upload of " + self._shot_name + " failed: " + reason)
+        self.upload_finished(None)
+
+    def store_shot(self, prev_file_path, zipPath=None, upload_id=None):
+        if self.scrub_pending:
+            self.after_scrub.append(lambda: self.store_shot(prev_file_path, zipPath, upload_id))
+            return
+        if self.preview_pending:
+            # attach to the shot the preview created
+            self.store_after_preview = lambda: self.store_shot(prev_file_path, zipPath, upload_id)
+            return
+        if self.manifest and frame_index().waiting_on(self.frame_hashes, self):
+            # frames shared with another shot are not on the server yet
+            if not self.waiting_for_frames:
+                self.waiting_for_frames = lambda: self.store_shot(prev_file_path, zipPath, upload_id)
+                frame_index().released.connect(self.waiting_for_frames)
+            return
+        if self.waiting_for_frames:
+            frame_index().released.disconnect(self.waiting_for_frames)
+            self.waiting_for_frames = None
+        if self.manifest:
+            reclaimed = frame_index().reclaim(self.frame_hashes, self)
+            if reclaimed:
+                # the shot that was sending them failed, they are not on the server
+                self.upload_reclaimed_frames(reclaimed, lambda: self.store_shot(prev_file_path, zipPath, upload_id))
+                return
+        self.end_archive_span()
 
-        self.upload_reply = self.net_man.post(self.upload_request, self.multpart)
-        self.upload_reply.uploadProgress.connect(self.onUploadProgress)
-        self.upload_reply.error.connect(self.reply_error_occurred)
+        # upload
+        fields = [("api_key", self._preset.properties()["trnla_api_key"]),
+                  ("project_id", self._preset.properties()["trnla_project_id"]),
+                  ("shot_name", self._shot_name)]
+        if self.manifest:
+            fields.append(("manifest", self.manifest))
+        if self.shot_id:
+            # registered up front or created by the preview upload
+            fields.append(("shot_id", self.shot_id))
+
+        files = []
+        if upload_id:
+            # the archive is already on the server, reference it instead of sending it again
+            fields.append(("shot_upload_id", upload_id))
+        elif zipPath:
+            self.zip_file = QFile(zipPath)
+            if not self.zip_file.open(QIODevice.ReadOnly):
+                self.chunked_upload_failed("could not read " + zipPath)
+                return
+            files.append(("shot_file", zipPath, self.zip_file))
+
+        if not self.preview_stored:
+            self.prev_file = QFile(prev_file_path)
+            if not self.prev_file.open(QIODevice.ReadOnly):
+                self.chunked_upload_failed("could not read " + prev_file_path)
+                return
+            files.append(("preview_file", os.path.basename(prev_file_path), self.prev_file))
+
+        # a dropped connection or a 5xx sends the shot again instead of losing it
+        self.upload_reply = trnla_network().post_form_retrying("store", fields, files,
+                                                               name="upload of " + self._shot_name,
+                                                               idempotency_key=self.store_key,
+                                                               scheduler=upload_scheduler())
+        self.upload_reply.finished.connect(self.upload_finished)
+        if not upload_id:
+            self.upload_reply.uploadProgress.connect(self.onUploadProgress)
+
+    def upload_reclaimed_frames(self, hashes, then):
+        paths = dict(zip(self.frame_hashes, self.frame_paths))
+        print("Trnla: %s uploads %d frames a failed shot was sending." % (self._shot_name, len(hashes)))
+        self.frame_upload = TrnlaFrameUpload(self._preset.properties()["trnla_api_key"],
+                                             self._preset.properties()["trnla_project_id"],
+                                             [(paths[frame_hash], frame_hash) for frame_hash in hashes],
+                                             scheduler=upload_scheduler())
+        self.frame_upload.finished.connect(then)
+        self.frame_upload.failed.connect(self.chunked_upload_failed)
+        self.frame_upload.start()
 
     def stop_upload(self):
+        # a cancelled export is not resumed
+        if not self.uploaded:
+            self.update_journal(state=CANCELLED)
+        if self.upload_ticket:
+            upload_scheduler().release(self.upload_ticket)
+        if self.pipelined_upload:
+            self.pipelined_upload.abort()
+        if self.chunked_upload:
+            self.chunked_upload.abort()
+        if self.frame_upload:
+            self.frame_upload.abort()
         if self.upload_reply:
             self.upload_reply.abort()
+        if self.segment_watcher:
+            self.segment_watcher.stop()
+            self.segment_watcher = None
 
     def finishTask(self):
+        if self.render_span:
+            self.render_span.end()
+        if self.preview_task is not None and not self.preview_sent:
+            self.preview_sent = True
+            self.preview_rendered()
         if self._preset.properties()["trnla_api_key"] != "none" and self._preset.properties()["trnla_upload"]:
-            if not self.uploaded and not self.upload_started:
+            # on the farm the preview can come first, the shot is stored once the nodes are done
+            if not self.uploaded and (not self.upload_started or self.farm_render is not None):
                 self._finished = False
             else:
                 if not self.uploaded:
@@ -185,6 +884,28 @@ class TrnlaTranscodePreset(FnTranscodeExporter.TranscodePreset):
         self.properties()["trnla_exist_project"] = False
         self.properties()["trnla_project_name"] = ""
         self.properties()["trnla_api_key"] = "none"
+        self.properties()["trnla_chunked_upload"] = False
+        self.properties()["trnla_chunk_size"] = 64
+        self.properties()["trnla_stream_archive"] = False
+        # auto picks by file type, or one of stored / deflate / fast
+        self.properties()["trnla_archive_compression"] = "auto"
+        self.properties()["trnla_compression_sample_frames"] = 0
+        # frames compressed in parallel, 0 uses every core
+        self.properties()["trnla_archive_workers"] = 0
+        # only upload frames trn.la doesn't have yet, plus a manifest of the shot
+        self.properties()["trnla_dedup_frames"] = False
+        # upload frames while the shot is still rendering
+        self.properties()["trnla_pipelined_upload"] = False
+        # send the preview on its own as soon as it is rendered
+        self.properties()["trnla_separate_preview"] = False
+        # register every shot of the export in one request before the uploads
+        self.properties()["trnla_batch_register"] = False
+        # archive and upload in a separate python process instead of in Nuke Studio
+        self.properties()["trnla_upload_worker"] = False
+        # write the preview from the full quality render instead of rendering it on its own
+        self.properties()["trnla_single_pass_preview"] = False
+        # frames every render node gets on the farm, 0 renders the whole shot on one node
+        self.properties()["trnla_farm_frames_per_ticket"] = 0
 
         FnAudioHelper.defineExportPresetProperties(self)
 
@@ -0,0 +1,362 @@
+# --------------------------Trn.la Plugin For Nuke Studio--------------------------------
+# On-disk journal of shot uploads. Every upload is recorded with what is needed to send it
+# again, and uploads that were still running when Nuke Studio closed are resumed the next
+# time the plugin loads.
+#
+# (c) 2021 Tarantula
+# Author: Moses Molina
+# ---------------------------------------------------------------------------------------
+
+import os
+import json
+import time
+import uuid
+import threading
+
+from PySide2.QtNetwork import *
+from PySide2.QtCore import *
+
+from .TrnlaConfig import TARANTULA_DATA, trnla_config, replace_file
+from .TrnlaNetwork import trnla_network, new_idempotency_key
+from .TrnlaProjectCache import account_key
+from .TrnlaUploadScheduler import upload_scheduler
+from .TrnlaChunkedUpload import TrnlaChunkedUpload, TrnlaFileSource, DEFAULT_CHUNK_SIZE
+from .TrnlaArchive import TrnlaArchiveStream, TrnlaCompressionPolicy, archive_workers, frame_members, write_archive
+
+JOURNAL_PATH = os.environ.get("TRNLA_UPLOAD_JOURNAL", TARANTULA_DATA + 'upload_journal.json')
+JOURNAL_VERSION = 1
+
+PENDING = "pending"
+UPLOADING = "uploading"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+UNFINISHED = (PENDING, UPLOADING)
+
+# how the archive goes up: one store request, chunks of a zip on disk, or a streamed zip
+MODE_STORE = "store"
+MODE_CHUNKED = "chunked"
+MODE_STREAM = "stream"
+# the frames are on trn.la already, only the manifest is left to send
+MODE_MANIFEST = "manifest"
+
+# finished entries are kept this long so it's possible to see what made it
+KEEP_FINISHED_SECONDS = 7 * 24 * 3600
+RESUME_DELAY = 5000
+HEARTBEAT_INTERVAL = 60000
+# fields that change with every chunk, written at most this often. Anything else is written right away
+PROGRESS_FIELDS = ("offset",)
+FLUSH_INTERVAL = 5000
+# a session that hasn't written its heartbeat for this long is gone
+SESSION_TIMEOUT = 180
+
+
+class TrnlaUploadJournal(object):
+    """Uploads by entry id. Several Nuke Studio sessions can share the journal: every session only
+    writes its own entries and keeps a heartbeat, so a running session's uploads are never resumed by
+    another one. Upload progress is only written every FLUSH_INTERVAL, the server knows how far an upload
+    got anyway."""
+    def __init__(self, path=JOURNAL_PATH):
+        self.path = path
+        self.session = uuid.uuid4().hex[:12]
+        self._entries = {}
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._heartbeat = None
+        self._flush_timer = None
+        self._dirty = False
+        self._entries, self._sessions = self._read()
+
+    def _read(self):
+        try:
+            with open(self.path) as journal_file:
+                journal = json.load(journal_file)
+        except (IOError, OSError, ValueError):
+            return {}, {}
+        if journal.get("version") != JOURNAL_VERSION:
+            return {}, {}
+        return journal.get("uploads", {}), journal.get("sessions", {})
+
+    def _save(self):
+        self._dirty = False
+        # entries of other sessions come from disk, they may have changed since we read them
+        disk_entries, disk_sessions = self._read()
+        entries = dict((entry_id, entry) for entry_id, entry in disk_entries.items()
+                       if entry.get("session") != self.session)
+        entries.update((entry_id, entry) for entry_id, entry in self._entries.items()
+                       if entry.get("session") == self.session)
+        now = time.time()
+        for entry_id, entry in list(entries.items()):
+            if entry["state"] not in UNFINISHED and now - entry["updated"] > KEEP_FINISHED_SECONDS:
+                del entries[entry_id]
+        live = set(entry.get("session") for entry in entries.values() if entry["state"] in UNFINISHED)
+        sessions = dict((session, beat) for session, beat in disk_sessions.items() if session in live)
+        if self.session in live:
+            sessions[self.session] = now
+        self._entries, self._sessions = entries, sessions
+
+        journal_dir = os.path.dirname(self.path)
+        try:
+            if journal_dir and not os.path.exists(journal_dir):
+                os.makedirs(journal_dir)
+            tmp_path = self.path + "." + self.session + ".tmp"
+            with open(tmp_path, 'w') as journal_file:
+                json.dump({"version": JOURNAL_VERSION, "uploads": entries, "sessions": sessions}, journal_file,
+                          indent=1, sort_keys=True)
+            replace_file(tmp_path, self.path)
+        except (IOError, OSError) as err:
+            print("Trnla: could not write the upload journal: " + str(err))
+
+    def _beat(self):
+        with self._lock:
+            if any(entry.get("session") == self.session and entry["state"] in UNFINISHED
+                   for entry in self._entries.values()):
+                self._save()
+            else:
+                self._heartbeat.stop()
+
+    def session_alive(self, session):
+        if session == self.session:
+            return True
+        return time.time() - self._sessions.get(session, 0) < SESSION_TIMEOUT
+
+    def add(self, shot_name, **fields):
+        entry_id = uuid.uuid4().hex[:12]
+        entry = {"shot_name": shot_name,
+                 "state": PENDING,
+                 "created": time.time(),
+                 "updated": time.time(),
+                 "mode": MODE_STORE,
+                 "preview_stored": False,
+                 # dedup uploads send the frames under their blob names, with a manifest mapping them back
+                 "dedup": False,
+                 "manifest": None,
+                 "upload_id": None,
+                 "offset": 0,
+                 "attempts": 0,
+                 "session": self.session}
+        entry.update(fields)
+        with self._lock:
+            self._entries[entry_id] = entry
+            self._save()
+        self._keep_alive()
+        return entry_id
+
+    def _keep_alive(self):
+        if self._heartbeat is None:
+            self._heartbeat = QTimer()
+            self._heartbeat.setInterval(HEARTBEAT_INTERVAL)
+            self._heartbeat.timeout.connect(self._beat)
+        if not self._heartbeat.isActive():
+            self._heartbeat.start()
+
+    def update(self, entry_id, **fields):
+        with self._lock:
+            entry = self._entries.get(entry_id)
+            if entry is None:
+                return
+            changed = set(name for name, value in fields.items() if entry.get(name) != value)
+            if entry.get("session") != self.session:
+                # resuming an entry of an earlier session takes it over
+                entry["session"] = self.session
+                changed.add("session")
+            if not changed:
+                return
+            entry.update(fields)
+            entry["updated"] = time.time()
+            if changed.difference(PROGRESS_FIELDS):
+                self._save()
+            else:
+                self._dirty = True
+        if self._dirty:
+            self._schedule_flush()
+        if entry["state"] in UNFINISHED:
+            self._keep_alive()
+
+    def flush(self):
+        """Writes progress that is still waiting for FLUSH_INTERVAL."""
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def _schedule_flush(self):
+        if self._flush_timer is None:
+            self._flush_timer = QTimer()
+            self._flush_timer.setSingleShot(True)
+            self._flush_timer.setInterval(FLUSH_INTERVAL)
+            self._flush_timer.timeout.connect(self.flush)
+        if not self._flush_timer.isActive():
+            self._flush_timer.start()
+
+    def entry(self, entry_id):
+        entry = self._entries.get(entry_id)
+        return dict(entry) if entry else None
+
+    def entries(self, states=None):
+        """(entry id, entry) pairs, oldest first."""
+        entries = [(entry_id, dict(entry)) for entry_id, entry in self._entries.items()
+                   if states is None or entry["state"] in states]
+        return sorted(entries, key=lambda item: item[1]["created"])
+
+
+class TrnlaResumedUpload(QObject):
+    """Sends a journalled shot again from what is on disk: the rendered frames, the zip if it is still
+    there, and the preview unless trn.la already has it."""
+    finished = Signal(bool)
+
+    def __init__(self, journal, entry_id, api_key):
+        QObject.__init__(self)
+        self.journal = journal
+        self.entry_id = entry_id
+        self.api_key = api_key
+        self.entry = journal.entry(entry_id)
+        self.ticket = None
+        self.chunked_upload = None
+        self._files = []
+
+    def start(self):
+        self.journal.update(self.entry_id, attempts=self.entry.get("attempts", 0) + 1)
+        self.ticket = upload_scheduler().submit(lambda ticket: self._begin(), 0, self.entry["shot_name"])
+
+    def _begin(self):
+        entry = self.entry
+        zip_path = entry.get("zip_path")
+        if entry.get("dedup"):
+            # only the journalled archive has the frames trn.la was missing, it can't be built again
+            if not entry.get("manifest"):
+                self._done(False, "the frame manifest of the upload wasn't journalled")
+                return
+            if entry["mode"] != MODE_MANIFEST and (entry["mode"] == MODE_STREAM or not zip_path
+                                                   or not os.path.exists(zip_path)):
+                self._done(False, "the archive of the frames trn.la was missing is gone")
+                return
+        members = frame_members(entry["file_dir"], entry["ext"])
+        if not members and entry["mode"] != MODE_MANIFEST:
+            self._done(False, "the rendered frames are gone from " + entry["file_dir"])
+            return
+        self.journal.update(self.entry_id, state=UPLOADING)
+        policy = TrnlaCompressionPolicy(entry.get("compression") or "deflate")
+        print("Trnla: resuming the upload of " + entry["shot_name"] + ".")
+        if entry["mode"] == MODE_MANIFEST:
+            self._store()
+        elif entry["mode"] in (MODE_CHUNKED, MODE_STREAM):
+            # the server recognises the upload by its resume key and continues where it stopped
+            if entry["mode"] == MODE_CHUNKED and zip_path and os.path.exists(zip_path):
+                source = TrnlaFileSource(zip_path)
+                file_name = os.path.basename(zip_path)
+            else:
+                source = TrnlaArchiveStream(members, policy, archive_workers(0))
+                file_name = os.path.basename(os.path.normpath(entry["file_dir"])) + '.zip'
+            self.chunked_upload = TrnlaChunkedUpload(self.api_key, entry["project_id"], entry["shot_name"], source,
+                                                     file_name, entry.get("chunk_size") or DEFAULT_CHUNK_SIZE,
+                                                     scheduler=upload_scheduler())
+            self.chunked_upload.acknowledged.connect(
+                lambda upload_id, offset: self.journal.update(self.entry_id, upload_id=upload_id, offset=offset))
+            self.chunked_upload.finished.connect(lambda upload_id: self._store(upload_id=upload_id))
+            self.chunked_upload.failed.connect(lambda reason: self._done(False, reason))
+            self.chunked_upload.start()
+        else:
+            if not zip_path or not os.path.exists(zip_path):
+                zip_path = os.path.join(os.path.dirname(entry["file_dir"]),
+                                        os.path.basename(os.path.normpath(entry["file_dir"])) + '.zip')
+                write_archive(zip_path, members, policy, archive_workers(0))
+            self._store(zip_path=zip_path)
+
+    def _open(self, path):
+        qfile = QFile(path)
+        if not qfile.open(QIODevice.ReadOnly):
+            return None
+        self._files.append(qfile)
+        return qfile
+
+    def _store(self, zip_path=None, upload_id=None):
+        entry = self.entry
+        fields = [("api_key", self.api_key),
+                  ("project_id", entry["project_id"]),
+                  ("shot_name", entry["shot_name"])]
+        if entry.get("shot_id"):
+            fields.append(("shot_id", entry["shot_id"]))
+        if entry.get("manifest"):
+            fields.append(("manifest", entry["manifest"]))
+        files = []
+        if upload_id:
+            fields.append(("shot_upload_id", upload_id))
+        elif zip_path:
+            zip_file = self._open(zip_path)
+            if zip_file is None:
+                self._done(False, "could not read " + zip_path)
+                return
+            files.append(("shot_file", zip_path, zip_file))
+        prev_file = entry.get("prev_file")
+        if not entry.get("preview_stored") and prev_file and os.path.exists(prev_file):
+            preview = self._open(prev_file)
+            if preview is not None:
+                files.append(("preview_file", os.path.basename(prev_file), preview))
+        request = trnla_network().post_form_retrying("store", fields, files,
+                                                     name="resumed upload of " + entry["shot_name"],
+                                                     idempotency_key=entry.get("store_key") or new_idempotency_key(),
+                                                     scheduler=upload_scheduler())
+        request.finished.connect(self._on_stored)
+
+    def _on_stored(self, reply):
+        reply.deleteLater()
+        stored = False
+        if reply.error() == QNetworkReply.NoError:
+            try:
+                stored = bool(json.loads(reply.readAll().data().decode('utf8')).get('success'))
+            except ValueError:
+                pass
+        self._done(stored, None if stored else reply.errorString())
+
+    def _done(self, success, reason=None):
+        for qfile in self._files:
+            qfile.close()
+        self._files = []
+        if self.ticket:
+            upload_scheduler().release(self.ticket)
+            self.ticket = None
+        if success:
+            print("Trnla: resumed upload of " + self.entry["shot_name"] + " is done.")
+            self.journal.update(self.entry_id, state=COMPLETED)
+        else:
+            print("Trnla: could not resume the upload of " + self.entry["shot_name"] + ": " + str(reason))
+            self.journal.update(self.entry_id, state=FAILED, error=reason)
+        self.finished.emit(success)
+
+
+_journal = None
+_resumed = []
+
+
+def upload_journal():
+    global _journal
+    if _journal is None:
+        _journal = TrnlaUploadJournal()
+        app = QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(_journal.flush)
+    return _journal
+
+
+def resume_uploads(delay=RESUME_DELAY):
+    """Resumes the uploads of the logged in account that an earlier session left unfinished. Set
+    TRNLA_RESUME_UPLOADS=0 to leave them alone."""
+    if os.environ.get("TRNLA_RESUME_UPLOADS", "1") == "0":
+        return
+    QTimer.singleShot(delay, _resume_unfinished)
+
+
+def _resume_unfinished():
+    api_key = trnla_config().api_key()
+    if not api_key:
+        return
+    journal = upload_journal()
+    for entry_id, entry in journal.entries(UNFINISHED):
+        if entry.get("account") != account_key(api_key) or not entry.get("project_id"):
+            continue
+        if journal.session_alive(entry.get("session")):
+            continue
+        upload = TrnlaResumedUpload(journal, entry_id, api_key)
+        _resumed.append(upload)
+        upload.finished.connect(lambda success, upload=upload: _resumed.remove(upload))
+        upload.start()
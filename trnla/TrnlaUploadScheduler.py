@@ -0,0 +1,93 @@
+# --------------------------Trn.la Plugin For Nuke Studio--------------------------------
+# Process wide queue for shot uploads. Limits how many uploads run at once and paces
+# everything they send (chunks, frames, previews, scrub sprites, stores) under a shared
+# bandwidth cap.
+#
+# (c) 2021 Tarantula
+# Author: Moses Molina
+# ---------------------------------------------------------------------------------------
+
+import time
+import heapq
+import itertools
+
+from PySide2.QtCore import *
+
+DEFAULT_MAX_UPLOADS = 4
+
+
+class TrnlaUploadTicket(object):
+    def __init__(self, start, priority, name):
+        self.start = start
+        self.priority = priority
+        self.name = name
+        self.running = False
+        self.cancelled = False
+
+
+class TrnlaUploadScheduler(QObject):
+    """Uploads are submitted with a start callback and run highest priority first, in submission order
+    for equal priorities. Every upload must release its ticket when it is done."""
+    def __init__(self, max_concurrent=DEFAULT_MAX_UPLOADS, bandwidth_limit=0):
+        QObject.__init__(self)
+        self.max_concurrent = max_concurrent
+        self.bandwidth_limit = bandwidth_limit
+        self._queue = []
+        self._order = itertools.count()
+        self._running = set()
+        self._next_send = 0.0
+
+    def configure(self, max_concurrent, bandwidth_limit):
+        """bandwidth_limit is the total for all uploads in bytes per second, 0 for no limit."""
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.bandwidth_limit = max(0, int(bandwidth_limit))
+        self._dispatch()
+
+    def submit(self, start, priority=0, name=""):
+        ticket = TrnlaUploadTicket(start, priority, name)
+        heapq.heappush(self._queue, (-priority, next(self._order), ticket))
+        # dispatch from the event loop so the caller is never re-entered
+        QTimer.singleShot(0, self._dispatch)
+        return ticket
+
+    def release(self, ticket):
+        ticket.cancelled = True
+        if ticket in self._running:
+            self._running.discard(ticket)
+            QTimer.singleShot(0, self._dispatch)
+
+    def pending(self):
+        return len([entry for entry in self._queue if not entry[2].cancelled])
+
+    def running(self):
+        return len(self._running)
+
+    def reserve(self, num_bytes):
+        """Claims bandwidth for num_bytes and returns how many ms the caller has to wait before
+        sending them to stay under the cap."""
+        if not self.bandwidth_limit:
+            return 0
+        now = time.time()
+        send_at = max(now, self._next_send)
+        self._next_send = send_at + float(num_bytes) / self.bandwidth_limit
+        return int((send_at - now) * 1000)
+
+    def _dispatch(self):
+        while self._queue and len(self._running) < self.max_concurrent:
+            priority, order, ticket = heapq.heappop(self._queue)
+            if ticket.cancelled:
+                continue
+            ticket.running = True
+            self._running.add(ticket)
+            ticket.start(ticket)
+
+
+_scheduler = None
+
+
+def upload_scheduler():
+    """The scheduler shared by every exporter in this Nuke Studio session."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = TrnlaUploadScheduler()
+    return _scheduler
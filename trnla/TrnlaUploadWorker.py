@@ -0,0 +1,177 @@
+# --------------------------Trn.la Plugin For Nuke Studio--------------------------------
+# Hands shot archives to the upload worker process (TrnlaWorkerProcess), so archiving and
+# uploading keep going while Nuke Studio is busy rendering or redrawing the timeline.
+#
+# (c) 2021 Tarantula
+# Author: Moses Molina
+# ---------------------------------------------------------------------------------------
+
+import os
+import sys
+import json
+import uuid
+
+from PySide2.QtCore import *
+
+from .TrnlaNetwork import TRNLA_API_ROOT
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "TrnlaWorkerProcess.py")
+WORKER_START_TIMEOUT = 10000
+
+
+def worker_python():
+    """The python the worker runs with: TRNLA_WORKER_PYTHON, or the one that ships next to the Nuke
+    executable."""
+    python = os.environ.get("TRNLA_WORKER_PYTHON")
+    if python:
+        return python
+    exe_dir = os.path.dirname(sys.executable)
+    for name in ("python3", "python", "python3.exe", "python.exe"):
+        candidate = os.path.join(exe_dir, name)
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+class TrnlaWorkerJob(QObject):
+    """One archive upload running in the worker. Has the signals of TrnlaChunkedUpload, so the exporter
+    treats both the same."""
+    uploadProgress = Signal('qint64', 'qint64')
+    acknowledged = Signal(str, 'qint64')
+    # compression method, bytes in, bytes out, cpu seconds and stored bytes of the archive
+    archived = Signal(str, 'qint64', 'qint64', float, 'qint64')
+    finished = Signal(str)
+    failed = Signal(str)
+
+    def __init__(self, worker, job):
+        QObject.__init__(self)
+        self.worker = worker
+        self.job = job
+        self.job_id = job["job"]
+        self.archived_bytes = 0
+
+    def start(self):
+        self.worker.send(self.job)
+
+    def abort(self):
+        self.worker.abort(self)
+
+    def handle(self, message):
+        event = message["event"]
+        if event == "progress":
+            self.archived_bytes = message.get("archived", 0)
+            self.uploadProgress.emit(message["sent"], message["total"])
+        elif event == "acknowledged":
+            self.acknowledged.emit(message["upload_id"], message["offset"])
+        elif event == "archived":
+            self.archived_bytes = message["bytes_in"]
+            self.archived.emit(message["method"], message["bytes_in"], message["bytes_out"],
+                               float(message["cpu_seconds"]), message["stored_bytes"])
+        elif event == "finished":
+            self.finished.emit(message["upload_id"])
+        elif event == "failed":
+            self.failed.emit(message["reason"])
+
+
+class TrnlaUploadWorker(QObject):
+    """The worker process, started on the first job. If it stops, the jobs it was running fail and are
+    left to the upload journal."""
+    def __init__(self, python):
+        QObject.__init__(self)
+        self.python = python
+        self.process = None
+        self.jobs = {}
+        self._output = b''
+
+    def running(self):
+        return self.process is not None and self.process.state() == QProcess.Running
+
+    def start(self):
+        if self.running():
+            return True
+        self.process = QProcess(self)
+        env = QProcessEnvironment.systemEnvironment()
+        env.insert("TRNLA_API_ROOT", TRNLA_API_ROOT)
+        env.insert("PYTHONUNBUFFERED", "1")
+        self.process.setProcessEnvironment(env)
+        self.process.readyReadStandardOutput.connect(self._on_output)
+        self.process.readyReadStandardError.connect(self._on_messages)
+        self.process.finished.connect(self._on_exit)
+        self.process.start(self.python, [WORKER_SCRIPT])
+        if not self.process.waitForStarted(WORKER_START_TIMEOUT):
+            print("Trnla: could not start the upload worker (" + self.python + "): " + self.process.errorString())
+            self.process = None
+            return False
+        return True
+
+    def submit(self, **job):
+        """Starts a job in the worker and returns its TrnlaWorkerJob, or None if the worker couldn't be
+        started."""
+        if not self.start():
+            return None
+        job["command"] = "upload"
+        job["job"] = uuid.uuid4().hex[:12]
+        worker_job = TrnlaWorkerJob(self, job)
+        self.jobs[worker_job.job_id] = worker_job
+        return worker_job
+
+    def abort(self, worker_job):
+        if self.jobs.pop(worker_job.job_id, None) is not None and self.running():
+            self.send({"command": "abort", "job": worker_job.job_id})
+
+    def stop(self, timeout=WORKER_START_TIMEOUT):
+        """Lets the worker finish the chunk it is sending and exit."""
+        if self.running():
+            for worker_job in list(self.jobs.values()):
+                self.abort(worker_job)
+            self.process.closeWriteChannel()
+            if not self.process.waitForFinished(timeout):
+                self.process.kill()
+
+    def send(self, message):
+        self.process.write((json.dumps(message) + "\n").encode('utf8'))
+
+    def _on_output(self):
+        self._output += self.process.readAllStandardOutput().data()
+        lines = self._output.split(b'\n')
+        self._output = lines.pop()
+        for line in lines:
+            try:
+                message = json.loads(line.decode('utf8'))
+            except ValueError:
+                continue
+            worker_job = self.jobs.get(message.get("job"))
+            if worker_job is None:
+                continue
+            if message["event"] in ("finished", "failed"):
+                del self.jobs[worker_job.job_id]
+            worker_job.handle(message)
+
+    def _on_messages(self):
+        for line in self.process.readAllStandardError().data().decode('utf8', 'replace').splitlines():
+            print(line)
+
+    def _on_exit(self, exit_code, exit_status=None):
+        print("Trnla: the upload worker stopped (exit code %d)." % exit_code)
+        jobs, self.jobs = self.jobs, {}
+        self.process = None
+        self._output = b''
+        for worker_job in jobs.values():
+            worker_job.failed.emit("the upload worker stopped")
+
+
+_worker = None
+
+
+def upload_worker():
+    """The worker shared by every exporter, or None when there is no python to run it with."""
+    global _worker
+    if _worker is None:
+        python = worker_python()
+        if python is None:
+            return None
+        _worker = TrnlaUploadWorker(python)
+        app = QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(_worker.stop)
+    return _worker
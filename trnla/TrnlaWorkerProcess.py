@@ -0,0 +1,261 @@
+# --------------------------Trn.la Plugin For Nuke Studio--------------------------------
+# Upload worker that runs next to Nuke Studio as its own python process. It archives and
+# uploads shots with plain python, so neither the compression nor the network callbacks
+# compete with the Nuke Studio UI. Started and fed by TrnlaUploadWorker: jobs come in on
+# stdin and progress goes back on stdout, one json message per line.
+#
+# (c) 2021 Tarantula
+# Author: Moses Molina
+# ---------------------------------------------------------------------------------------
+
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import threading
+
+try:
+    from urllib.request import Request, urlopen
+    from urllib.error import URLError, HTTPError
+    from http.client import HTTPException
+except ImportError:
+    from urllib2 import Request, urlopen, URLError, HTTPError
+    from httplib import HTTPException
+
+# run as a script, so the archive code is imported from next to it rather than from the package
+from TrnlaArchive import TrnlaArchiveStream, TrnlaCompressionPolicy, TrnlaFileSource, write_archive
+from TrnlaRetry import TrnlaRetryPolicy, DEFAULT_MAX_RETRIES, transient_status, parse_retry_after
+from TrnlaChunkProtocol import TrnlaChunkProtocol, BEGIN, COMPLETE
+
+TRNLA_API_ROOT = os.environ.get("TRNLA_API_ROOT", "https://trn.la/api/producer")
+REQUEST_TIMEOUT = 300
+
+
+class TrnlaWorkerError(Exception):
+    pass
+
+
+class TrnlaWorkerInterrupted(Exception):
+    """The request didn't get through, it is worth sending again."""
+    def __init__(self, reason, retry_after=None):
+        Exception.__init__(self, reason)
+        self.retry_after = retry_after
+
+
+def encode_form(fields, files=()):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields:
+        if not isinstance(value, bytes):
+            value = str(value).encode('utf-8')
+        parts.append(('--%s\r\nContent-Disposition: form-data; name="%s"\r\n\r\n' % (boundary, name)).encode('utf-8'))
+        parts.append(value)
+        parts.append(b'\r\n')
+    for name, filename, body in files:
+        parts.append(('--%s\r\nContent-Disposition: form-data; name="%s"; filename="%s"\r\n'
+                      'Content-Type: application/octet-stream\r\n\r\n' % (boundary, name, filename)).encode('utf-8'))
+        parts.append(body)
+        parts.append(b'\r\n')
+    parts.append(('--%s--\r\n' % boundary).encode('utf-8'))
+    return 'multipart/form-data; boundary=' + boundary, b''.join(parts)
+
+
+def post_form(endpoint, fields, files=()):
+    """Posts a multipart form and returns the json reply. Raises TrnlaWorkerInterrupted when the
+    request didn't get through and TrnlaWorkerError when trn.la refused it."""
+    content_type, body = encode_form(fields, files)
+    request = Request(TRNLA_API_ROOT.rstrip('/') + '/' + endpoint, body, {"Content-Type": content_type})
+    try:
+        response = urlopen(request, timeout=REQUEST_TIMEOUT)
+        try:
+            data = response.read()
+        finally:
+            response.close()
+    except HTTPError as err:
+        if not transient_status(err.code):
+            raise TrnlaWorkerError("%s: HTTP %d" % (endpoint, err.code))
+        raise TrnlaWorkerInterrupted("HTTP %d" % err.code, parse_retry_after(err.headers.get("Retry-After")))
+    except (URLError, HTTPException, socket.error, IOError) as err:
+        raise TrnlaWorkerInterrupted(str(getattr(err, 'reason', None) or err))
+    try:
+        replyJson = json.loads(data.decode('utf8'))
+    except ValueError:
+        raise TrnlaWorkerInterrupted("invalid reply from server")
+    if not replyJson.get('success'):
+        raise TrnlaWorkerError(str(replyJson.get('error', 'upload rejected by server')))
+    return replyJson
+
+
+def post_retrying(endpoint, fields, files=(), policy=None, name=None):
+    """post_form, sent again after interruptions for as long as the policy allows."""
+    policy = policy or TrnlaRetryPolicy()
+    retries = 0
+    while True:
+        try:
+            return post_form(endpoint, fields, files)
+        except TrnlaWorkerInterrupted as err:
+            if not policy.should_retry(retries):
+                raise TrnlaWorkerError(str(err))
+            delay = policy.delay(retries, err.retry_after)
+            retries += 1
+            sys.stderr.write("Trnla: %s failed (%s), retry %d of %d in %.1fs.\n" % (name or endpoint, err, retries,
+                                                                                   policy.max_retries, delay))
+            time.sleep(delay)
+
+
+class TrnlaWorkerPacer(object):
+    """The bandwidth cap shared by every upload of the worker, as TrnlaUploadScheduler.reserve."""
+    def __init__(self):
+        self.bandwidth_limit = 0
+        self._next_send = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self, num_bytes):
+        if not self.bandwidth_limit:
+            return
+        with self._lock:
+            now = time.time()
+            send_at = max(now, self._next_send)
+            self._next_send = send_at + float(num_bytes) / self.bandwidth_limit
+        if send_at > now:
+            time.sleep(send_at - now)
+
+
+class TrnlaWorkerUpload(object):
+    """Archives the members of one job and sends the archive with TrnlaChunkProtocol, as
+    TrnlaChunkedUpload does in Nuke Studio. The archive is streamed, or written to zip_path first when
+    the job has one."""
+    def __init__(self, job, worker):
+        self.job = job
+        self.worker = worker
+        self.aborted = False
+        self.policy = TrnlaRetryPolicy(int(job.get("max_retries", DEFAULT_MAX_RETRIES)))
+
+    def emit(self, event, **fields):
+        fields["event"] = event
+        fields["job"] = self.job["job"]
+        self.worker.emit(fields)
+
+    def run(self):
+        try:
+            upload_id = self.upload()
+        except TrnlaWorkerError as err:
+            self.emit("failed", reason=str(err))
+        except Exception as err:
+            self.emit("failed", reason="upload worker error: %r" % err)
+        else:
+            if upload_id is not None:
+                self.emit("finished", upload_id=upload_id)
+        finally:
+            self.worker.job_done(self.job["job"])
+
+    def archived(self, policy):
+        stats = policy.stats
+        self.emit("archived", method=policy.method, bytes_in=stats.bytes_in, bytes_out=stats.bytes_out,
+                  cpu_seconds=stats.cpu_seconds, stored_bytes=stats.stored_bytes)
+
+    def upload(self):
+        job = self.job
+        members = [tuple(member) for member in job["members"]]
+        # the exporter has already sampled the frames for the compression method
+        policy = TrnlaCompressionPolicy(job["compression"])
+        zip_path = job.get("zip_path")
+        if zip_path:
+            write_archive(zip_path, members, policy, job["workers"])
+            self.archived(policy)
+            source = TrnlaFileSource(zip_path)
+        else:
+            source = TrnlaArchiveStream(members, policy, job["workers"])
+        try:
+            return self.send(source, policy)
+        finally:
+            source.close()
+
+    def send(self, source, policy):
+        job = self.job
+        protocol = TrnlaChunkProtocol(job["api_key"], job["project_id"], job["shot_name"], source,
+                                      job["file_name"], job["chunk_size"], self.policy)
+        archived = bool(job.get("zip_path"))
+        while not protocol.finished:
+            if self.aborted:
+                return None
+            request = protocol.next_request()
+            if request.endpoint == COMPLETE and not archived:
+                # the stream is exhausted, the archive is all there
+                self.archived(policy)
+                archived = True
+            files = []
+            if request.chunk is not None:
+                self.worker.pacer.wait(len(request.chunk))
+                files = [("chunk", job["file_name"], request.chunk)]
+            try:
+                replyJson = post_form(request.endpoint, request.fields, files)
+            except TrnlaWorkerInterrupted as err:
+                delay = protocol.interrupted(err.retry_after)
+                if delay is None:
+                    raise TrnlaWorkerError(str(err))
+                sys.stderr.write("Trnla: chunk upload interrupted (%s): %s\n" % (job["shot_name"], err))
+                time.sleep(delay)
+                continue
+            protocol.replied(request, replyJson)
+            if protocol.finished:
+                break
+            self.emit("acknowledged", upload_id=protocol.upload_id, offset=protocol.offset)
+            if request.endpoint != BEGIN:
+                self.emit("progress", sent=protocol.offset, total=protocol.total_size(),
+                          archived=policy.stats.bytes_in)
+        return protocol.upload_id
+
+
+class TrnlaWorker(object):
+    def __init__(self, stdin, stdout):
+        self.stdin = stdin
+        self.stdout = stdout
+        self.pacer = TrnlaWorkerPacer()
+        self.uploads = {}
+        self._lock = threading.Lock()
+
+    def emit(self, message):
+        line = json.dumps(message) + "\n"
+        with self._lock:
+            self.stdout.write(line)
+            self.stdout.flush()
+
+    def job_done(self, job_id):
+        with self._lock:
+            self.uploads.pop(job_id, None)
+
+    def handle(self, message):
+        command = message.get("command")
+        if command == "upload":
+            self.pacer.bandwidth_limit = int(message.get("bandwidth_limit", 0))
+            upload = TrnlaWorkerUpload(message, self)
+            with self._lock:
+                self.uploads[message["job"]] = upload
+            thread = threading.Thread(target=upload.run, name="trnla-upload-" + message["job"])
+            thread.daemon = True
+            thread.start()
+        elif command == "abort":
+            upload = self.uploads.get(message["job"])
+            if upload is not None:
+                upload.aborted = True
+
+    def run(self):
+        # Nuke Studio closing its end of the pipe stops the worker, unfinished uploads are left to
+        # the upload journal
+        for line in iter(self.stdin.readline, ''):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                message = json.loads(line)
+            except ValueError:
+                sys.stderr.write("Trnla: upload worker got an invalid message\n")
+                continue
+            self.handle(message)
+
+
+if __name__ == "__main__":
+    TrnlaWorker(sys.stdin, sys.stdout).run()
@@ -9,6 +9,8 @@ import hiero.core
 from trnla import (TrnlaShotProcessor, TrnlaShotProcessorUI, TrnlaShotProcessorPreset,
                    TrnlaTranscodeExporter, TrnlaTranscodeExporterUI, TrnlaTranscodePreset,
                    TrnlaPreviewTranscoder, TrnlaPreviewTranscoderUI, TrnlaPreviewTranscoderPreset)
+from trnla.TrnlaUploadJournal import resume_uploads
+from trnla.TrnlaFarmSubmission import TrnlaFarmSubmission
 
 
 hiero.core.taskRegistry.registerProcessor(TrnlaShotProcessorPreset, TrnlaShotProcessor)
@@ -18,4 +20,10 @@ hiero.core.taskRegistry.registerTask(TrnlaTranscodePreset, TrnlaTranscodeExporte
 hiero.ui.taskUIRegistry.registerTaskUI(TrnlaTranscodePreset, TrnlaTranscodeExporterUI)
 
 hiero.core.taskRegistry.registerTask(TrnlaPreviewTranscoderPreset, TrnlaPreviewTranscoder)
-hiero.ui.taskUIRegistry.registerTaskUI(TrnlaPreviewTranscoderPreset, TrnlaPreviewTranscoderUI)
\ No newline at end of file
+hiero.ui.taskUIRegistry.registerTaskUI(TrnlaPreviewTranscoderPreset, TrnlaPreviewTranscoderUI)
+
+# renders the export on the nodes watching the farm spool, which upload the frames themselves
+hiero.core.taskRegistry.addSubmission("Trnla Render Farm", TrnlaFarmSubmission)
+
+# pick up uploads an earlier Nuke Studio session didn't finish
+resume_uploads()